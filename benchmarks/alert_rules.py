@@ -0,0 +1,96 @@
+"""
+Бенчмарк проверки правил уведомлений на тике.
+
+Запуск: python -m benchmarks.alert_rules
+
+На 200 токенах с синтетическими ценами сравнивается время одного тика
+AlertRuleEngine и прямой проверки каждого правила при росте числа правил.
+Правила равномерно распределены по токенам и видам; изменения за период -
+в трёх окнах. БД не нужна.
+"""
+import random
+import time
+from decimal import Decimal
+
+from database.read_models import AlertRuleRow
+from utils.alert_rules import AlertRuleEngine, TokenState, rule_metric
+
+SYMBOLS = [f"TKN{i}" for i in range(200)]
+SECTORS = 10
+RULE_COUNTS = (100, 1_000, 10_000, 50_000)
+WINDOWS = (15, 60, 240)
+TICKS = 300
+TICK_SECONDS = 60
+
+
+def make_rules(count: int) -> list[AlertRuleRow]:
+    rng = random.Random(count)
+    rules = []
+    for rule_id in range(1, count + 1):
+        kind = rng.choice(["price_above", "price_below", "change", "bodyfix", "sector_change"])
+        threshold = Decimal(rng.randint(50, 150))
+        if kind in ("change", "sector_change"):
+            threshold = Decimal(rng.choice([-1, 1]) * rng.randint(1, 20))
+        elif kind == "bodyfix":
+            threshold = Decimal(rng.randint(1, 50))
+        rules.append(AlertRuleRow(
+            id=rule_id, kind=kind, symbol=rng.choice(SYMBOLS),
+            sector_id=rng.randint(1, SECTORS), sector_name=None, threshold=threshold,
+            window_minutes=rng.choice(WINDOWS), triggered=False,
+        ))
+    return rules
+
+
+def make_ticks() -> list[dict[str, Decimal]]:
+    rng = random.Random(0)
+    prices = {symbol: 100.0 for symbol in SYMBOLS}
+    ticks = []
+    for _ in range(TICKS):
+        prices = {symbol: price * (1 + rng.gauss(0, 0.01)) for symbol, price in prices.items()}
+        ticks.append({symbol: Decimal(f"{price:.6f}") for symbol, price in prices.items()})
+    return ticks
+
+
+def naive_tick(engine: AlertRuleEngine, rules: list[AlertRuleRow], prices, tokens,
+               sector_symbols, now: float) -> int:
+    """Прямая проверка: метрика и сравнение отдельно для каждого правила"""
+    engine.record(prices, now)
+    passed = 0
+    for rule in rules:
+        (metric, subject, window, sign), threshold = rule_metric(rule)
+        value = engine.metric(metric, subject, window, prices, tokens, sector_symbols, now)
+        if value is not None and value * sign >= threshold:
+            passed += 1
+    return passed
+
+
+def main() -> None:
+    ticks = make_ticks()
+    tokens = {symbol: TokenState(sector_id=i % SECTORS + 1, bodyfix_price_usd=Decimal(200))
+              for i, symbol in enumerate(SYMBOLS)}
+    sector_symbols = {}
+    for symbol, token in tokens.items():
+        sector_symbols.setdefault(token.sector_id, []).append(symbol)
+    print(f"{len(SYMBOLS)} токенов, {TICKS} тиков, время одного тика:")
+    for count in RULE_COUNTS:
+        rules = make_rules(count)
+        engine = AlertRuleEngine()
+        engine.compile(rules, version=1)
+        started = time.perf_counter()
+        for tick, prices in enumerate(ticks):
+            engine.evaluate(prices, tokens, tick * TICK_SECONDS)
+        compiled = (time.perf_counter() - started) / TICKS * 1000
+
+        naive_engine = AlertRuleEngine()
+        naive_engine.compile(rules, version=1)
+        naive_ticks = ticks[:20]
+        started = time.perf_counter()
+        for tick, prices in enumerate(naive_ticks):
+            naive_tick(naive_engine, rules, prices, tokens, sector_symbols, tick * TICK_SECONDS)
+        naive = (time.perf_counter() - started) / len(naive_ticks) * 1000
+        print(f"  {count:6} правил, {len(engine.groups):5} групп: "
+              f"группы {compiled:8.2f} мс,  по одному правилу {naive:8.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Бенчмарк денежных расчётов на горячих путях против прежнего кода.
+
+Запуск: python -m benchmarks.money
+
+Сравниваются:
+- распределение депозита по направлениям, секторам и токенам
+  (database.requests.distribute_deposit);
+- проверка просадки по ценам одного цикла парсера (умножение вместо деления);
+- format_number без перевода числа в строку и обратно.
+
+Перед замером результаты сверяются с прежним кодом на случайных данных.
+"""
+import random
+import time
+import timeit
+from copy import deepcopy
+from decimal import Decimal
+from types import SimpleNamespace
+
+from database.requests import distribute_deposit
+from utils.helpers import format_number, round_to_2, drawdown_reached
+
+DRAWDOWN_PERCENTAGE = 20
+rnd = random.Random(42)
+
+
+def legacy_distribute(amount_usd, portfolio_directions, sectors) -> None:
+    """Распределение депозита в том виде, в каком оно было в add_deposit на Decimal"""
+    total_direction_balance = Decimal("0")
+    for idx, direction in enumerate(portfolio_directions):
+        if idx == len(portfolio_directions) - 1:
+            direction_balance = amount_usd - total_direction_balance
+        else:
+            direction_balance = round_to_2(amount_usd * (direction.percentage / Decimal(100)))
+        direction.balance_usd += direction_balance
+        total_direction_balance += direction_balance
+        if direction.name != "Рабочий капитал":
+            continue
+        total_sector_balance = Decimal("0")
+        for idx_sector, sector in enumerate(sectors):
+            if idx_sector == len(sectors) - 1:
+                sector_balance = direction_balance - total_sector_balance
+            else:
+                sector_balance = round_to_2(direction_balance * (sector.percentage / Decimal(100)))
+            total_sector_balance += sector_balance
+            total_token_balance = Decimal("0")
+            for idx_token, token in enumerate(sector.tokens):
+                if idx_token == len(sector.tokens) - 1:
+                    token_balance = sector_balance - total_token_balance
+                else:
+                    token_balance = round_to_2(sector_balance * (token.percentage / Decimal(100)))
+                token.balance_usd += token_balance
+                token.balance_entry_usd = round_to_2(token.balance_usd * Decimal("0.10"))
+                total_token_balance += token_balance
+        direction.balance_usd -= direction_balance
+
+
+def legacy_drawdown(entry_price, price, last_notified_price) -> bool:
+    """Проверка просадки из check_alerts на Decimal"""
+    if price >= entry_price:
+        return False
+    if ((entry_price - price) / entry_price) * 100 < DRAWDOWN_PERCENTAGE:
+        return False
+    if last_notified_price is None:
+        return True
+    return ((last_notified_price - price) / last_notified_price) * 100 >= DRAWDOWN_PERCENTAGE
+
+
+def new_drawdown(entry_price, price, last_notified_price) -> bool:
+    """Проверка просадки из check_alerts через drawdown_reached"""
+    if price >= entry_price or not drawdown_reached(entry_price, price, DRAWDOWN_PERCENTAGE):
+        return False
+    return last_notified_price is None or drawdown_reached(
+        last_notified_price, price, DRAWDOWN_PERCENTAGE
+    )
+
+
+def legacy_format_number(value: Decimal) -> Decimal:
+    """format_number в прежнем виде, через строку"""
+    value_str = format(value, "f")
+    if "." in value_str:
+        int_part, frac_part = value_str.split(".", 1)
+        frac_part = frac_part.rstrip("0")
+        if frac_part:
+            formatted_str = f"{int_part}.{frac_part}"
+        else:
+            formatted_str = int_part
+    else:
+        formatted_str = value_str
+    return Decimal(formatted_str)
+
+
+def split_percentages(count: int) -> list[Decimal]:
+    """Случайные проценты с двумя знаками, в сумме ровно 100"""
+    weights = [rnd.randint(1, 1000) for _ in range(count)]
+    parts = [Decimal(weight * 10000 // sum(weights)) / 100 for weight in weights]
+    parts[-1] += Decimal(100) - sum(parts)
+    return parts
+
+
+def make_portfolio(sector_count: int = 8, tokens_per_sector: int = 14):
+    directions = [
+        SimpleNamespace(name=name, percentage=percentage, balance_usd=Decimal("0.00"))
+        for name, percentage in zip(("Ликвидность", "Рабочий капитал"), split_percentages(2))
+    ]
+    sectors = []
+    for sector_percentage in split_percentages(sector_count):
+        tokens = [
+            SimpleNamespace(
+                percentage=percentage,
+                balance_usd=Decimal(rnd.randint(0, 10 ** 6)) / 100,
+                balance_entry_usd=Decimal("0.00"),
+            )
+            for percentage in split_percentages(tokens_per_sector)
+        ]
+        sectors.append(SimpleNamespace(percentage=sector_percentage, tokens=tokens))
+    return directions, sectors
+
+
+def random_price() -> Decimal:
+    return Decimal(f"{rnd.uniform(0.0000001, 90000):.10f}")
+
+
+def random_numbers(count: int) -> list[Decimal]:
+    """Числа как из колонок Numeric(20, 2) и Numeric(45, 15), включая целые и нули"""
+    numbers = [Decimal(f"{rnd.uniform(0, 10 ** 6):.{rnd.randint(0, 15)}f}") for _ in range(count)]
+    numbers += [Decimal("100.00"), Decimal("0E-15"), Decimal("-0.00"), Decimal("5000"),
+                Decimal("123456789012345678901234567890.123456789012345")]
+    return numbers
+
+
+def check_equivalence() -> None:
+    for _ in range(300):
+        directions, sectors = make_portfolio(rnd.randint(1, 10), rnd.randint(1, 20))
+        legacy = deepcopy((directions, sectors))
+        amount = Decimal(rnd.randint(1, 10 ** 9)) / 100
+        distribute_deposit(amount, directions, sectors)
+        legacy_distribute(amount, *legacy)
+        assert [d.balance_usd for d in directions] == [d.balance_usd for d in legacy[0]]
+        for sector, legacy_sector in zip(sectors, legacy[1]):
+            for token, legacy_token in zip(sector.tokens, legacy_sector.tokens):
+                assert token.balance_usd == legacy_token.balance_usd
+                assert token.balance_entry_usd == legacy_token.balance_entry_usd
+
+    for _ in range(100_000):
+        entry = random_price()
+        price = entry * Decimal(rnd.choice(("0.8", "0.5", "0.79999", "1.2"))) + rnd.choice(
+            (Decimal(0), Decimal("0.0000000001"), Decimal("-0.0000000001"))
+        )
+        last = rnd.choice((None, entry, entry * Decimal("0.8"), random_price()))
+        price = max(price, Decimal("0.0000000001"))
+        assert legacy_drawdown(entry, price, last) == new_drawdown(entry, price, last)
+
+    for value in random_numbers(100_000):
+        assert str(legacy_format_number(value)) == str(format_number(value))
+    print("Результаты совпадают с прежним кодом")
+
+
+def main() -> None:
+    check_equivalence()
+
+    portfolio = make_portfolio()
+    amount = Decimal("12345.67")
+    runs = 500
+    timings = []
+    for distribute in (legacy_distribute, distribute_deposit):
+        copies = [deepcopy(portfolio) for _ in range(runs)]
+        started = time.perf_counter()
+        for directions, sectors in copies:
+            distribute(amount, directions, sectors)
+        timings.append((time.perf_counter() - started) / runs * 1e6)
+    print(f"Депозит (2 направления, 112 токенов): было {timings[0]:8.1f} мкс, "
+          f"стало {timings[1]:8.1f} мкс")
+
+    ticks = [(random_price(), random_price(), rnd.choice((None, random_price())))
+             for _ in range(500)]
+    legacy_time = timeit.timeit(lambda: [legacy_drawdown(*tick) for tick in ticks], number=runs)
+    new_time = timeit.timeit(lambda: [new_drawdown(*tick) for tick in ticks], number=runs)
+    print(f"Просадка (500 позиций за цикл):       было {legacy_time / runs * 1e6:8.1f} мкс, "
+          f"стало {new_time / runs * 1e6:8.1f} мкс")
+
+    numbers = random_numbers(1000)
+    legacy_time = timeit.timeit(lambda: [legacy_format_number(v) for v in numbers], number=runs)
+    new_time = timeit.timeit(lambda: [format_number(v) for v in numbers], number=runs)
+    print(f"format_number (1000 чисел):           было {legacy_time / runs * 1e6:8.1f} мкс, "
+          f"стало {new_time / runs * 1e6:8.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
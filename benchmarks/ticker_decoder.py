@@ -0,0 +1,76 @@
+"""
+Микробенчмарк разбора ответа /v5/market/tickers.
+
+Запуск: python -m benchmarks.ticker_decoder [путь к записанному ответу]
+Без аргумента используется синтетический ответ в формате Bybit.
+Записать реальный ответ: curl "https://api.bybit.com/v5/market/tickers?category=spot" > tickers.json
+"""
+import json
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+from utils.ticker_decoder import DECODERS, scaled_int
+
+
+def synthetic_payload(count: int = 700) -> bytes:
+    rnd = random.Random(42)
+    tickers = []
+    for idx in range(count):
+        price = f"{rnd.uniform(0.000001, 90000):.8f}".rstrip("0")
+        tickers.append({
+            "symbol": f"T{idx}USDT" if idx % 5 else f"T{idx}USDC",
+            "bid1Price": price, "bid1Size": "1.5", "ask1Price": price, "ask1Size": "2.1",
+            "lastPrice": price, "prevPrice24h": price, "price24hPcnt": "0.0123",
+            "highPrice24h": price, "lowPrice24h": price, "turnover24h": "123456.789",
+            "volume24h": f"{rnd.uniform(1, 10 ** 7):.4f}", "usdIndexPrice": price,
+        })
+    payload = {
+        "retCode": 0, "retMsg": "OK",
+        "result": {"category": "spot", "list": tickers},
+        "retExtInfo": {}, "time": 1700000000000,
+    }
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as file:
+            raw = file.read()
+    else:
+        raw = synthetic_payload()
+    print(f"Размер ответа: {len(raw) / 1024:.0f} KB")
+
+    # Все декодеры должны давать одинаковый результат
+    reference = DECODERS["json"](raw, with_volume=True)
+    symbols = set(list(reference.prices)[:100])
+    for name, decoder in DECODERS.items():
+        assert decoder(raw, with_volume=True) == reference, name
+        assert decoder(raw, symbols=symbols).prices == {
+            symbol: price for symbol, price in reference.prices.items() if symbol in symbols
+        }, name
+    to_int = scaled_int(15)
+    assert all(
+        to_int(format(price, "f")) == int(price.scaleb(15))
+        for price in reference.prices.values()
+    )
+
+    runs = 50
+    for name, decoder in DECODERS.items():
+        for label, kwargs in (
+            ("все тикеры, Decimal", {}),
+            ("100 токенов, Decimal", {"symbols": symbols}),
+            ("100 токенов, int * 10^15", {"symbols": symbols, "price_parser": to_int}),
+        ):
+            seconds = timeit.timeit(lambda: decoder(raw, **kwargs), number=runs) / runs
+            print(f"{name:>7} | {label:<26} | {seconds * 1000:7.2f} мс")
+    seconds = timeit.timeit(
+        lambda: [Decimal(item["lastPrice"]) for item in json.loads(raw)["result"]["list"]],
+        number=runs,
+    ) / runs
+    print(f"{'baseline':>7} | {'json.loads + Decimal':<26} | {seconds * 1000:7.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Нагрузочный бенчмарк приёма обновлений: webhook против long polling.
+
+Запуск: python -m benchmarks.webhook_load [число обновлений] [задержка getUpdates, мс]
+
+Telegram подменяется локальным фейком: для polling - сессия бота, отдающая
+пачки обновлений на getUpdates с заданной задержкой сети, для webhook -
+клиент, отправляющий те же обновления POST-запросами на локальный сервер.
+Все обновления приходят одним всплеском, обработчик имитирует короткую работу.
+Выводится пропускная способность и p50/p99 задержки от поступления
+обновления до завершения обработчика.
+"""
+import asyncio
+import sys
+import time
+from typing import Any
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, GetUpdates, TelegramMethod
+from aiogram.types import CallbackQuery, Update, User
+
+from bot.webhook import WebhookServer
+
+HANDLER_WORK_SECONDS = 0.005
+BOT_TOKEN = "42:FAKE"
+
+
+def make_updates(count: int) -> list[dict]:
+    now = int(time.time())
+    return [
+        {
+            "update_id": idx + 1,
+            "callback_query": {
+                "id": str(idx),
+                "from": {"id": 1, "is_bot": False, "first_name": "Admin"},
+                "chat_instance": "1",
+                "data": f"sector_page_{idx % 3}",
+                "message": {
+                    "message_id": idx,
+                    "date": now,
+                    "chat": {"id": 1, "type": "private"},
+                },
+            },
+        }
+        for idx in range(count)
+    ]
+
+
+class FakeTelegramSession(BaseSession):
+    """Сессия бота, имитирующая Telegram Bot API для long polling"""
+
+    def __init__(self, updates: list[dict], rtt: float):
+        super().__init__()
+        self.updates = updates
+        self.rtt = rtt
+        self.offset = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout=None) -> Any:
+        if isinstance(method, GetMe):
+            return User(id=42, is_bot=True, first_name="Bench", username="bench_bot")
+        if not isinstance(method, GetUpdates):
+            return True
+        await asyncio.sleep(self.rtt)
+        start = max(self.offset, (method.offset or 1) - 1)
+        batch = self.updates[start:start + (method.limit or 100)]
+        self.offset = start + len(batch)
+        if not batch:
+            await asyncio.sleep(0.05)
+        return [Update.model_validate(data, context={"bot": bot}) for data in batch]
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+
+def make_dispatcher(latencies: list[float], started: dict, total: int, done: asyncio.Event):
+    router = Router()
+
+    @router.callback_query()
+    async def handler(callback: CallbackQuery):
+        await asyncio.sleep(HANDLER_WORK_SECONDS)
+        latencies.append(time.perf_counter() - started["at"])
+        if len(latencies) == total:
+            done.set()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def report(name: str, latencies: list[float], elapsed: float) -> None:
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{name:>8} | {len(latencies) / elapsed:8.0f} обн./сек | "
+          f"p50 {p50:7.1f} мс | p99 {p99:7.1f} мс")
+
+
+async def bench_polling(updates: list[dict], rtt: float) -> None:
+    latencies, started, done = [], {}, asyncio.Event()
+    dp = make_dispatcher(latencies, started, len(updates), done)
+    bot = Bot(token=BOT_TOKEN, session=FakeTelegramSession(updates, rtt))
+    started["at"] = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=0))
+    await asyncio.wait(
+        [polling, asyncio.create_task(done.wait())], return_when=asyncio.FIRST_COMPLETED
+    )
+    report("polling", latencies, time.perf_counter() - started["at"])
+    await dp.stop_polling()
+    await polling
+
+
+async def bench_webhook(updates: list[dict]) -> None:
+    latencies, started, done = [], {}, asyncio.Event()
+    dp = make_dispatcher(latencies, started, len(updates), done)
+    bot = Bot(token=BOT_TOKEN, session=FakeTelegramSession([], 0))
+    server = WebhookServer(bot=bot, dp=dp, host="127.0.0.1", port=8089, secret="bench")
+    await server.start()
+    url = f"http://127.0.0.1:8089{server.path}"
+    # Telegram держит до 40 одновременных соединений с webhook
+    connector = aiohttp.TCPConnector(limit=40)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "bench"}
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def deliver(data: dict) -> None:
+            # Как и Telegram, повторяем доставку при 503
+            while True:
+                async with session.post(url, json=data, headers=headers) as response:
+                    if response.status != 503:
+                        return
+                await asyncio.sleep(0.01)
+
+        started["at"] = time.perf_counter()
+        await asyncio.gather(*(deliver(data) for data in updates))
+        await done.wait()
+        report("webhook", latencies, time.perf_counter() - started["at"])
+    await server.stop()
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rtt = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+    updates = make_updates(count)
+    print(f"Обновлений: {count}, задержка getUpdates: {rtt * 1000:.0f} мс")
+    await bench_polling(updates, rtt)
+    await bench_webhook(updates)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+import os
+import logging
+from decimal import Decimal
+
+from aiogram import Bot
+
+import bot.keyboards as kb
+import utils.helpers as ut
+
+ADMIN_ID = int(os.getenv("ADMIN_ID"))
+
+logger = logging.getLogger(__name__)
+
+
+async def send_alert(bot: Bot, alert: dict) -> None:
+    """
+    Отправка администратору уведомления парсера.
+
+    Уведомление приходит словарём, чтобы его можно было передать между
+    процессами: {"type": "bodyfix" | "drawdown" | "peak_drawdown" | "invalid_symbol" | "rule"
+    | "ladder", ...}
+    """
+    reply_markup = None
+    if alert.get("position_id"):
+        reply_markup = await kb.to_position_button(alert["position_id"])
+
+    if alert["type"] == "bodyfix":
+        text = (f"🎯 Цена токена <b>{alert['symbol']}</b> "
+                f"достигла <b>цены фиксации тела!</b>")
+    elif alert["type"] == "drawdown":
+        text = (f"📉 <b>Просадка по {alert['symbol']} от последнего уведомления!</b>\n\n"
+                f"Текущая цена: <b>${alert['price']}</b>\n"
+                f"Просадка: <b><i>-{float(alert['drawdown_percent']):.2f}%</i></b>")
+    elif alert["type"] == "peak_drawdown":
+        text = (f"🔻 <b>Резкое падение {alert['symbol']} от максимума "
+                f"за {alert['window_minutes']} мин.!</b>\n\n"
+                f"Максимум: <b>${ut.format_number(alert['peak'])}</b>\n"
+                f"Текущая цена: <b>${ut.format_number(alert['price'])}</b>\n"
+                f"Просадка: <b><i>-{float(alert['drawdown_percent']):.2f}%</i></b> "
+                f"({float(alert['sigmas']):.1f}σ)")
+    elif alert["type"] == "invalid_symbol":
+        text = (f"❗️ Токен <b>{alert['symbol']}</b> отсутствует на Bybit, "
+                f"уведомлений по его цене <b>не будет</b>.")
+    elif alert["type"] == "rule":
+        text = (f"🔔 <b>Сработало правило уведомлений</b>\n\n"
+                f"{alert['text']}\n\n"
+                f"Сейчас: <b>{alert['value']}</b>")
+    elif alert["type"] == "ladder":
+        text = (f"🪜 <b>{alert['symbol']}: цена дошла до {alert['rung'] + 1}-й ступени "
+                f"лестницы входа</b>\n\n"
+                f"Цена ступени: <b>${ut.format_number(Decimal(alert['rung_price']))}</b>\n"
+                f"Текущая цена: <b>${ut.format_number(Decimal(alert['price']))}</b>\n"
+                f"Покупка на ступени: <b>${alert['size_usd']}</b>")
+    else:
+        logger.warning(f"Неизвестный тип уведомления: {alert['type']}")
+        return
+    await bot.send_message(chat_id=ADMIN_ID, text=text, reply_markup=reply_markup)
@@ -1,17 +1,51 @@
+import io
 from decimal import ROUND_DOWN, Decimal, InvalidOperation
+from typing import Optional
 
 from aiogram import Router, F
-from aiogram.filters import CommandStart
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery
+from aiogram.types import BufferedInputFile, InputMediaPhoto
+from aiogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 
 import bot.keyboards as kb
 import database.requests as rq
+import database.read_models as rm
+import database.equity as eq
 import bot.states as st
 import utils.helpers as ut
+from utils.instruments import instrument_catalogue
+from utils.order_import import MAX_BULK_FILE_SIZE, MAX_BULK_ORDERS, OrderLineError
+from utils.order_import import parse_order_lines
+from utils.export import EXPORTS, available_formats
+from utils.charts import allocation_chart, charts_available, position_chart, price_chart
+from utils.alert_rules import MAX_RULE_WINDOW_MINUTES, RULE_KINDS, TOKEN_RULE_KINDS
+from utils.alert_rules import WINDOW_RULE_KINDS, rule_text
+from utils.price_stats import PEAK_WINDOW_MINUTES, price_stats
+from utils.search import INLINE_CACHE_SECONDS, SECTOR_PREFIX, TOKEN_PREFIX, parse_ref
+from utils.search import search_index, search_results, sector_ref, token_ref
+from utils.render_cache import SECTORS, TOKENS, render_cache
+from utils.jobs import job_runner
+from bot.jobs import bulk_errors_text, order_params
 
 router = Router()
 
+# Сколько переводов показывать в предпросмотре перераспределения
+REALLOCATION_PREVIEW_ROWS = 15
+
+
+def reallocation_text(transfers: list[rm.Transfer]) -> str:
+    """Список переводов между рабочим капиталом и токенами для предпросмотра"""
+    rows = [f'<b>{transfer.symbol}</b>: {transfer.amount_usd:+}$ → {transfer.balance_usd}$'
+            for transfer in transfers[:REALLOCATION_PREVIEW_ROWS]]
+    if len(transfers) > REALLOCATION_PREVIEW_ROWS:
+        rows.append(f'... и ещё {len(transfers) - REALLOCATION_PREVIEW_ROWS}')
+    pool_change = -sum(transfer.amount_usd for transfer in transfers)
+    rows.append(f'\n<b>Свободный остаток Рабочего Капитала:</b> {pool_change:+}$')
+    return '\n'.join(rows)
+
+
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
@@ -47,6 +81,30 @@ async def portfolio(callback: CallbackQuery):
     await callback.message.edit_text(text, reply_markup=kb.portfolio)
 
 
+@router.callback_query(F.data.in_({'performance_1', 'performance_7', 'performance_30'}))
+async def performance(callback: CallbackQuery):
+    days = int(callback.data.split('_')[1])
+    result = await eq.get_performance(days)
+    if result is None:
+        text = (f'📈 <b>Доходность за {days} дн.</b>\n\n'
+                f'Данных пока нет: снимки портфеля появятся после нескольких циклов '
+                f'обновления цен.')
+    else:
+        change_percentage = (f' ({result.change_percentage:+}%)'
+                             if result.change_percentage is not None else '')
+        text = (f'📈 <b>Доходность за {days} дн.</b>\n'
+                f'<i>с {result.since:%d.%m.%Y %H:%M} UTC</i>\n\n'
+                f'💰 <b>Стоимость портфеля:</b> {result.start_usd}$ → {result.end_usd}$\n'
+                f'📊 <b>Изменение:</b> {result.change_usd:+}${change_percentage}\n'
+                f'⬆️ <b>Максимум:</b> {result.high_usd}$\n'
+                f'⬇️ <b>Минимум:</b> {result.low_usd}$\n\n'
+                f'<b>Сейчас:</b>\n'
+                f'  • 💵 <b>В ликвидности:</b> {result.liquidity_usd}$\n'
+                f'  • 📈 <b>В позициях:</b> {result.positions_usd}$\n'
+                f'  • 🪙 <b>В токенах:</b> {result.tokens_usd}$\n')
+    await callback.message.edit_text(text, reply_markup=kb.performance)
+
+
 @router.callback_query(F.data == 'deposit')
 async def deposit(callback: CallbackQuery, state: FSMContext):
     await state.set_state(st.Deposit.amount_usd)
@@ -60,24 +118,15 @@ async def deposit_first(message: Message, state: FSMContext):
         if raw_input <= 0:
             text = '❌ <b>Ошибка!</b>\n\nСумма должна быть больше нуля!'
             await message.answer(text)
-        else:
-            formatted_raw = raw_input.quantize(
-                Decimal('0.01'), rounding=ROUND_DOWN
-            )
-            await state.update_data(amount_usd=formatted_raw)
-        data = await state.get_data()
-        await rq.add_deposit(amount_usd=data['amount_usd'
-        ''])
-        text = f'✅ Депозит на <b>{data['amount_usd']}$</b> добавлен в <b>портфель</b>!'
-        await message.answer(text,
-                             reply_markup=kb.deposit)
-        await state.clear()
+            return
     except InvalidOperation:
         text = '❌ <b>Ошибка!</b>\n\nВведите <b>корректное число</b> в долларах!'
         await message.answer(text)
-    except ValueError as e:
-        await state.clear()
-        await message.answer(f'{e}', reply_markup=kb.deposit)
+        return
+    amount_usd = raw_input.quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+    await state.clear()
+    # Распределение по большому дереву секторов идёт в фоне, итог - в сообщении задачи
+    await job_runner.submit('deposit', {'amount_usd': str(amount_usd)}, message.chat.id)
 
 @router.callback_query(F.data == 'strategy')
 async def strategy(callback: CallbackQuery):
@@ -203,32 +252,31 @@ async def strategy_wcapital_first(message: Message, state: FSMContext):
                              '<b>Пример:</b> <code>70%</code> или <code>70.53%</code>')
 
 
-@router.callback_query(F.data == 'strategy_sectors')
-async def strategy_sectors(callback: CallbackQuery):
-    sectors = await rq.get_all_sectors()
-    sector_text=''
-    if sectors:
-        all_percentage = Decimal(0)
-        for sector in sectors:
-            sector_text += f'🔹 {sector.name} - {sector.percentage}%\n'
-            all_percentage += sector.percentage
-        available_percentage = Decimal(100) - all_percentage
+@render_cache.cached('sectors_text', scopes=(SECTORS,))
+async def sectors_text() -> str:
+    """Текст распределения по секторам с остатком до 100%"""
+    sectors = await rm.list_sectors()
+    lines = ''.join(f'🔹 {sector.name} - {sector.percentage}%\n' for sector in sectors)
+    available_percentage = Decimal(100) - sum(sector.percentage for sector in sectors)
     if available_percentage > 0:
-        text = (
+        return (
             f"<b>📊 Секторы</b>\n\n"
             f"<b>Текущее распределение по секторам:</b>\n"
-            f"{sector_text}\n\n"
+            f"{lines}\n\n"
             f"❓<u><i>Для установки секторам доступно еще: {available_percentage}%</i></u>\n\n"
             f"<b>Выберите сектор для изменения распределения в %:</b>"
         )
-    else:
-        text = (
-            f"<b>📊 Секторы</b>\n\n"
-            f"<b>Текущее распределение по секторам:</b>\n"
-            f"{sector_text}\n"
-            f"<b>Выберите сектор для изменения распределения в %:</b>"
-        )
-    await callback.message.edit_text(text, reply_markup=await kb.strategy_sectors())
+    return (
+        f"<b>📊 Секторы</b>\n\n"
+        f"<b>Текущее распределение по секторам:</b>\n"
+        f"{lines}\n"
+        f"<b>Выберите сектор для изменения распределения в %:</b>"
+    )
+
+
+@router.callback_query(F.data == 'strategy_sectors')
+async def strategy_sectors(callback: CallbackQuery):
+    await callback.message.edit_text(await sectors_text(), reply_markup=await kb.strategy_sectors())
 
 
 @router.callback_query(F.data == 'add_sector')
@@ -276,47 +324,27 @@ async def add_sector_second(message: Message, state: FSMContext):
 @router.callback_query(F.data.startswith('sector_page_'))
 async def sector_page(callback: CallbackQuery):
     page = int(callback.data.split('_')[2])
-    sectors = await rq.get_all_sectors()
-    sector_text = ''
-    if sectors:
-        all_percentage = Decimal(0)
-        for sector in sectors:
-            sector_text += f'🔹 {sector.name} - {sector.percentage}%\n'
-            all_percentage += sector.percentage
-        available_percentage = Decimal(100) - all_percentage
-    if available_percentage > 0:
-        text = (
-            f"<b>📊 Секторы</b>\n\n"
-            f"<b>Текущее распределение по секторам:</b>\n"
-            f"{sector_text}\n\n"
-            f"<b>Для установки секторам доступно еще:</b> {available_percentage}%\n\n"
-            f"<b>Выберите сектор для изменения распределения в %:</b>"
-        )
-    else:
-        text = (
-            f"<b>📊 Секторы</b>\n\n"
-            f"<b>Текущее распределение по секторам:</b>\n"
-            f"{sector_text}\n"
-            f"<b>Выберите сектор для изменения распределения в %:</b>"
-        )
-    await callback.message.edit_text(text, reply_markup=await kb.strategy_sectors(page=page))
+    await callback.message.edit_text(await sectors_text(),
+                                     reply_markup=await kb.strategy_sectors(page=page))
+
+
+@render_cache.cached('sector_text', scopes=(SECTORS, TOKENS))
+async def sector_text(sector_id: int) -> str:
+    """Текст карточки сектора с распределением по токенам"""
+    sector = await rm.get_sector_row(sector_id)
+    tokens = await rm.list_sector_tokens(sector_id)
+    lines = ''.join(f'🔹 {token.symbol} - {token.percentage}%\n' for token in tokens)
+    return (f'<b>📊 Сектор "{sector.name}"</b>\n\n'
+            f'<b>Текущее распределение по токенам:</b>\n'
+            f'{lines}'
+            f'\n\nВыделено от Рабочего Капитала: <b>{sector.percentage}%</b>')
 
 
 @router.callback_query(F.data.startswith('sector_button_'))
 async def sector_button(callback: CallbackQuery):
     sector_id = int(callback.data.split('_')[2])
-    sector = await rq.get_sector_info(sector_id=sector_id)
-    tokens = await rq.get_all_sector_tokens(sector_id=sector_id)
-    token_text = ''
-    if tokens:
-        for token in tokens:
-            token_text += f'🔹 {token.symbol} - {token.percentage}%\n'
-    text = (f'<b>📊 Сектор "{sector.name}"</b>\n\n'
-            f'<b>Текущее распределение по токенам:</b>\n'
-            f'{token_text}'
-            f'\n\nВыделено от Рабочего Капитала: <b>{sector.percentage}%</b>')
     await callback.message.edit_text(
-        text,
+        await sector_text(sector_id),
         reply_markup=await kb.in_sector(sector_id))
 
 
@@ -363,6 +391,17 @@ async def sector_change_percentage_second(message: Message, state: FSMContext):
             await state.update_data(percentage=raw_input)
 
         data = await state.get_data()
+        transfers = await rq.change_sector_percentage(sector_name=data['name'],
+                                                      percentage=data['percentage'], preview=True)
+        if transfers:
+            await state.set_state(st.Sector.confirm_percentage)
+            text = (f'🔄 <b>Сектор {data['name']}: {data['percentage']}% '
+                    f'от Рабочего Капитала</b>\n\n'
+                    f'Балансы токенов будут изменены:\n\n'
+                    f'{reallocation_text(transfers)}')
+            await message.answer(text, reply_markup=await kb.reallocation_confirm(
+                'sector_realloc_apply', 'sector_realloc_cancel'))
+            return
         await rq.change_sector_percentage(sector_name=data['name'], percentage=data['percentage'])
         await message.answer(f'✅ <b>Готово!</b>\n\n'
                              f'Сектор <b>{data['name']}</b> теперь составляет '
@@ -378,33 +417,50 @@ async def sector_change_percentage_second(message: Message, state: FSMContext):
                              '<b>Пример:</b> <code>70%</code> или <code>70.53%</code>')
 
 
-@router.callback_query(F.data.startswith('strategy_tokens_'))
-async def strategy_tokens(callback: CallbackQuery):
-    sector_id = int(callback.data.split('_')[2])
-    sector = await rq.get_sector_info(sector_id=sector_id)
-    tokens = await rq.get_all_sector_tokens(sector_id=sector_id)
-    token_text = ''
-    if tokens:
-        all_percentage = Decimal(0)
-        for token in tokens:
-            token_text += f'🔹 {token.symbol} - {token.percentage}%\n'
-            all_percentage += token.percentage
-        available_percentage = Decimal(100) - all_percentage
+@router.callback_query(st.Sector.confirm_percentage, F.data == 'sector_realloc_apply')
+async def sector_change_percentage_apply(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    await job_runner.submit('sector_percentage',
+                            {'sector_id': data['sector_id'], 'name': data['name'],
+                             'percentage': str(data['percentage'])},
+                            callback.message.chat.id, callback.message.message_id)
+
+
+@router.callback_query(st.Sector.confirm_percentage, F.data == 'sector_realloc_cancel')
+async def sector_change_percentage_cancel(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    await callback.message.edit_text('Изменение % сектора отменено.',
+                                     reply_markup=await kb.sector_change(data['sector_id']))
+
+
+@render_cache.cached('sector_tokens_text', scopes=(SECTORS, TOKENS))
+async def sector_tokens_text(sector_id: int) -> str:
+    """Текст распределения по токенам сектора с остатком до 100%"""
+    sector = await rm.get_sector_row(sector_id)
+    tokens = await rm.list_sector_tokens(sector_id)
+    lines = ''.join(f'🔹 {token.symbol} - {token.percentage}%\n' for token in tokens)
+    available_percentage = Decimal(100) - sum(token.percentage for token in tokens)
     if available_percentage > 0:
-        text = (
+        return (
             f'<b>📊 Токены сектора "{sector.name}"</b>\n\n'
             f"<b>Текущее распределение по токенам:</b>\n"
-            f"{token_text}\n\n"
+            f"{lines}\n\n"
             f"❓<u><i>Для установки токенам доступно еще: {available_percentage}%</i></u>\n\n"
             f"<b>Выберите токен для изменения распределения в %:</b>"
         )
-    else:
-        text = (f'<b>📊 Токены сектора "{sector.name}"</b>\n\n'
-                f'<b>Текущее распределение по токенам:</b>\n'
-                f'{token_text}\n'
-                f'<b>Выберите токен для изменения распределения в %:</b>')
+    return (f'<b>📊 Токены сектора "{sector.name}"</b>\n\n'
+            f'<b>Текущее распределение по токенам:</b>\n'
+            f'{lines}\n'
+            f'<b>Выберите токен для изменения распределения в %:</b>')
+
+
+@router.callback_query(F.data.startswith('strategy_tokens_'))
+async def strategy_tokens(callback: CallbackQuery):
+    sector_id = int(callback.data.split('_')[2])
     await callback.message.edit_text(
-        text,
+        await sector_tokens_text(sector_id),
         reply_markup=await kb.strategy_tokens(sector_id=sector_id, page=0))
 
 
@@ -418,7 +474,14 @@ async def add_token(callback: CallbackQuery, state: FSMContext):
 
 @router.message(st.Token.sector_id)
 async def add_token_first(message: Message, state: FSMContext):
-    await state.update_data(symbol=str(message.text))
+    symbol = str(message.text).strip().upper()
+    if not instrument_catalogue.is_known(symbol):
+        data = await state.get_data()
+        text = (f'❌ <b>Ошибка!</b>\n\nТокен <b>{symbol}</b> не торгуется на Bybit '
+                f'в паре с USDT.\n\nПроверьте название и введите его снова:')
+        await message.answer(text, reply_markup=await kb.strategy_tokens_back(data['sector_id']))
+        return
+    await state.update_data(symbol=symbol)
     data = await state.get_data()
     sector = await rq.get_sector_info(sector_id=data['sector_id'])
     await state.set_state(st.Token.percentage)
@@ -466,47 +529,32 @@ async def add_token_second(message: Message, state: FSMContext):
 async def token_page(callback: CallbackQuery):
     sector_id = int(callback.data.split('_')[2])
     page = int(callback.data.split('_')[3])
-    sector = await rq.get_sector_info(sector_id=sector_id)
-    tokens = await rq.get_all_sector_tokens(sector_id=sector_id)
-    token_text = ''
-    if tokens:
-        all_percentage = Decimal(0)
-        for token in tokens:
-            token_text += f'🔹 {token.symbol} - {token.percentage}%\n'
-            all_percentage += token.percentage
-        available_percentage = Decimal(100) - all_percentage
-    if available_percentage > 0:
-        text = (
-            f'<b>📊 Токены сектора "{sector.name}"</b>\n\n'
-            f"<b>Текущее распределение по токенам:</b>\n"
-            f"{token_text}\n\n"
-            f"❓<u><i>Для установки токенам доступно еще: {available_percentage}%</i></u>\n\n"
-            f"<b>Выберите токен для изменения распределения в %:</b>"
-        )
-    else:
-        text = (
-            f'<b>📊 Токены сектора "{sector.name}"</b>\n\n'
-            f"<b>Текущее распределение по токенам:</b>\n"
-            f"{token_text}\n"
-            f"<b>Выберите токен для изменения распределения в %:</b>"
-        )
     await callback.message.edit_text(
-        text, reply_markup=await kb.strategy_tokens(sector_id=sector_id, page=page)
+        await sector_tokens_text(sector_id),
+        reply_markup=await kb.strategy_tokens(sector_id=sector_id, page=page)
         )
 
 
+@render_cache.cached('token_text', scopes=(SECTORS, TOKENS))
+async def token_text(token_id: int) -> Optional[str]:
+    """Текст карточки токена или None, если токен не найден"""
+    token = await rm.get_token_card(token_id)
+    if not token:
+        return None
+    return (
+        f'<b>📊 Токен "{token.symbol}" из сектора "{token.sector_name}"</b>\n\n'
+        f'<b>Выделено % от сектора:</b> {token.percentage}%\n\n'
+        f'<b>Выделено на токен:</b> {token.balance_usd}$\n'
+        f'<b>Выделено на новый ордер:</b> {token.balance_entry_usd}$\n\n'
+        f'<b>Выберите действие с токеном:</b>'
+    )
+
+
 @router.callback_query(F.data.startswith('token_button_'))
 async def token_button(callback: CallbackQuery):
     token_id = int(callback.data.split('_')[2])
-    token = await rq.get_token_or_info(token_id=token_id)
-    if token:
-        text = (
-            f'<b>📊 Токен "{token.symbol}" из сектора "{token.sector.name}"</b>\n\n'
-            f'<b>Выделено % от сектора:</b> {token.percentage}%\n\n'
-            f'<b>Выделено на токен:</b> {token.balance_usd}$\n'
-            f'<b>Выделено на новый ордер:</b> {token.balance_entry_usd}$\n\n'
-            f'<b>Выберите действие с токеном:</b>'
-        )
+    text = await token_text(token_id)
+    if text:
         await callback.message.edit_text(text,
                                          reply_markup=await kb.in_token(token_id))
 
@@ -537,6 +585,19 @@ async def token_change_percentage_second(message: Message, state: FSMContext):
             await state.update_data(new_percentage=raw_input)
         data = await state.get_data()
         sector = await rq.get_sector_info(sector_id=data['sector_id'])
+        transfers = await rq.change_token_percentage(token_id=data['token_id'],
+                                                     sector_id=data['sector_id'],
+                                                     percentage=data['new_percentage'],
+                                                     preview=True)
+        if transfers:
+            await state.set_state(st.Token.confirm_percentage)
+            text = (f'🔄 <b>Токен {data['symbol']}: {data['new_percentage']}% '
+                    f'от сектора {sector.name}</b>\n\n'
+                    f'Балансы токенов будут изменены:\n\n'
+                    f'{reallocation_text(transfers)}')
+            await message.answer(text, reply_markup=await kb.reallocation_confirm(
+                'token_realloc_apply', 'token_realloc_cancel'))
+            return
         await rq.change_token_percentage(token_id=data['token_id'], sector_id=data['sector_id'],
                                          percentage=data['new_percentage'])
         await message.answer(f'✅ <b>Готово!</b>\n\n'
@@ -556,6 +617,26 @@ async def token_change_percentage_second(message: Message, state: FSMContext):
         await message.answer(text)
 
 
+@router.callback_query(st.Token.confirm_percentage, F.data == 'token_realloc_apply')
+async def token_change_percentage_apply(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    await job_runner.submit('token_percentage',
+                            {'token_id': data['token_id'], 'sector_id': data['sector_id'],
+                             'symbol': data['symbol'],
+                             'percentage': str(data['new_percentage'])},
+                            callback.message.chat.id, callback.message.message_id)
+
+
+@router.callback_query(st.Token.confirm_percentage, F.data == 'token_realloc_cancel')
+async def token_change_percentage_cancel(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    await callback.message.edit_text(
+        'Изменение % токена отменено.',
+        reply_markup=await kb.strategy_tokens_back(data['sector_id']))
+
+
 @router.callback_query(F.data.startswith('token_delete_button_'))
 async def token_delete_first(callback: CallbackQuery):
     token_id = int(callback.data.split('_')[3])
@@ -604,8 +685,10 @@ async def buy_order(callback: CallbackQuery, state: FSMContext):
 
 @router.message(st.Order.buy_token_symbol)
 async def buy_order_first(message: Message, state: FSMContext):
-    token_symbol = str(message.text)
-    token = await rq.get_token_or_info(symbol=token_symbol)
+    token_symbol = str(message.text).strip().upper()
+    token = None
+    if instrument_catalogue.is_known(token_symbol):
+        token = await rq.get_token_or_info(symbol=token_symbol)
     if token:
         await state.update_data(buy_token_symbol=token_symbol, buy_token_id=token.id)
         token_balance_entry_usd = token.balance_entry_usd
@@ -689,8 +772,10 @@ async def sell_order(callback: CallbackQuery, state: FSMContext):
 
 @router.message(st.Order.sell_token_symbol)
 async def sell_order_first(message: Message, state: FSMContext):
-    token_symbol = str(message.text)
-    token = await rq.get_token_or_info(symbol=token_symbol)
+    token_symbol = str(message.text).strip().upper()
+    token = None
+    if instrument_catalogue.is_known(token_symbol):
+        token = await rq.get_token_or_info(symbol=token_symbol)
     if not token:
         text = ('❌ <b>Ошибка! Токен не найден.</b>\n\n'
                 'Убедитесь, что токен существует и добавлен в сектор.')
@@ -731,12 +816,67 @@ async def sell_order_second(message: Message, state: FSMContext):
                              reply_markup=kb.order_cancel)
 
 
+@router.callback_query(F.data == 'bulk_order')
+async def bulk_order(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(st.Order.bulk)
+    text = ('📋 <b>Пакетный ввод ордеров</b>\n\n'
+            'Отправьте ордера по одному в строке: '
+            '<code>символ buy/sell количество цена</code>, '
+            'или CSV-файл с такими же колонками. Цену продажи можно не указывать, '
+            'дробную часть можно отделять точкой или запятой.\n\n'
+            '<b>Пример:</b>\n<code>BTC buy 0.015 64200\nETH buy 1.2 3100\nBTC sell 0.005</code>\n\n'
+            f'❓ <i>Не больше {MAX_BULK_ORDERS} строк. Если хоть одна строка содержит ошибку, '
+            f'не сохраняется ни один ордер.</i>')
+    await callback.message.edit_text(text, reply_markup=kb.order_cancel)
+
+
+@router.message(st.Order.bulk)
+async def bulk_order_first(message: Message, state: FSMContext):
+    if message.document:
+        if message.document.file_size > MAX_BULK_FILE_SIZE:
+            await message.answer(f'❌ <b>Ошибка!</b>\n\nФайл больше '
+                                 f'{MAX_BULK_FILE_SIZE // 1024} КБ.',
+                                 reply_markup=kb.order_cancel)
+            return
+        file = await message.bot.download(message.document)
+        lines = io.TextIOWrapper(file, encoding='utf-8', errors='replace')
+    elif message.text:
+        lines = message.text.splitlines()
+    else:
+        await message.answer('❌ <b>Ошибка!</b>\n\nОтправьте ордера текстом или CSV-файлом.',
+                             reply_markup=kb.order_cancel)
+        return
+
+    orders, errors = [], []
+    for line in parse_order_lines(lines):
+        if isinstance(line, OrderLineError):
+            errors.append(line)
+        else:
+            orders.append(line)
+        if len(orders) + len(errors) > MAX_BULK_ORDERS:
+            await message.answer(f'❌ <b>Ошибка!</b>\n\nВ пакете больше {MAX_BULK_ORDERS} строк.',
+                                 reply_markup=kb.order_cancel)
+            return
+    if not (orders or errors):
+        await message.answer('❌ <b>Ошибка!</b>\n\nНе найдено ни одного ордера.',
+                             reply_markup=kb.order_cancel)
+        return
+    if errors:
+        await message.answer(bulk_errors_text(errors) +
+                             '\n\nИсправьте строки и отправьте пакет заново.',
+                             reply_markup=kb.order_cancel)
+        return
+    await state.clear()
+    # Проверка по балансам и проводка ордеров - в фоновой задаче
+    await job_runner.submit('bulk_orders', {'orders': order_params(orders)}, message.chat.id)
+
+
 @router.callback_query(F.data.startswith('position_button_'))
 async def token_button(callback: CallbackQuery):
     position_id = int(callback.data.split('_')[2])
-    position = await rq.get_position_info(position_id=position_id)
+    position = await rm.get_position_card(position_id)
     if position:
-        current_price = position.token.current_coinprice_usd or 0
+        current_price = position.current_coinprice_usd or 0
         bodyfix_alert = "❗️" if current_price >= position.bodyfix_price_usd else ""
         
         text = (
@@ -749,6 +889,16 @@ async def token_button(callback: CallbackQuery):
             f"<b>Текущая цена токена:</b> {ut.format_number(current_price)}$\n\n"
             f"📈 <b>Текущая стоимость позиции:</b> {ut.format_number(position.total_usd)}$"
         )
+        stats = price_stats.get(position.name)
+        if stats:
+            text += (
+                f"\n\n<b>За {PEAK_WINDOW_MINUTES} мин.:</b>\n"
+                f"  • Изменение цены: {stats.window_change_percentage:+.2f}%\n"
+                f"  • Просадка от максимума: {stats.drawdown_percentage:.2f}%"
+            )
+            if stats.volatility_percentage is not None:
+                text += (f" ({stats.drawdown_sigmas:.1f}σ)\n"
+                         f"  • Волатильность: {stats.volatility_percentage:.2f}%")
         await callback.message.edit_text(text, reply_markup=await kb.in_position(position_id))
 
 
@@ -799,3 +949,332 @@ async def position_sell_order(callback: CallbackQuery, state: FSMContext):
         f"Введите кол-во токенов, которое будете продавать:</b>"
     )
     await callback.message.edit_text(text)
+
+
+async def ladder_text(position: rm.PositionCard) -> str:
+    """Ступени лестницы входа позиции: заполненные, следующая и оставшиеся с размерами"""
+    ladder = await rm.get_ladder(position.token_id)
+    if not ladder:
+        return (f'🪜 <b>Лестница входа "{position.name}"</b>\n\n'
+                f'Лестницы нет. Постройте её от цены первой ступени.')
+    text = (f'🪜 <b>Лестница входа "{position.name}"</b>\n\n'
+            f'<b>Шаг:</b> {ut.format_number(ladder.step_percentage)}%\n'
+            f'<b>Заполнено ступеней:</b> {min(ladder.filled, len(ladder.rungs))} '
+            f'из {len(ladder.rungs)}\n'
+            f'<b>Текущая цена:</b> {ut.format_number(position.current_coinprice_usd or 0)}$\n\n')
+    for rung in ladder.rungs:
+        if rung.rung < ladder.filled:
+            mark = '✅'
+        elif rung.rung == ladder.filled:
+            mark = '➡️'
+        else:
+            mark = '▫️'
+        price = ut.format_number(rung.price.quantize(Decimal('1E-12'), rounding=ROUND_DOWN))
+        text += f'{mark} {rung.rung + 1}. {price}$'
+        text += f' — {ut.format_number(rung.size_usd)}$\n' if rung.size_usd else '\n'
+    return text
+
+
+@router.callback_query(F.data.startswith('position_ladder_'))
+async def position_ladder(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    position_id = int(callback.data.split('_')[2])
+    position = await rm.get_position_card(position_id)
+    if position:
+        await callback.message.edit_text(await ladder_text(position),
+                                         reply_markup=await kb.ladder(position_id))
+
+
+@router.callback_query(F.data.startswith('ladder_build_'))
+async def ladder_build(callback: CallbackQuery, state: FSMContext):
+    position_id = int(callback.data.split('_')[2])
+    await state.set_state(st.Ladder.anchor_price)
+    await state.update_data(position_id=position_id)
+    await callback.message.edit_text(
+        '🪜 <b>Введите цену первой ступени в $:</b>\n\n'
+        '<i>Заполненные ступени сохранятся, цены и размеры остальных будут пересчитаны.</i>'
+    )
+
+
+@router.message(st.Ladder.anchor_price)
+async def ladder_anchor_price(message: Message, state: FSMContext):
+    try:
+        anchor_price = Decimal((message.text or '').replace('$', '').replace(',', '.').strip())
+    except InvalidOperation:
+        await message.answer('❌ <b>Ошибка!</b>\n\nВведите <b>корректное число</b>!')
+        return
+    if not anchor_price.is_finite():
+        await message.answer('❌ <b>Ошибка!</b>\n\nВведите <b>корректное число</b>!')
+        return
+    position_id = (await state.get_data())['position_id']
+    position = await rm.get_position_card(position_id)
+    if not position:
+        await state.clear()
+        await message.answer('❌ <b>Ошибка!</b>\n\nПозиция не найдена.', reply_markup=kb.order_back)
+        return
+    try:
+        await rq.build_ladder(position.token_id, anchor_price)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
+    await state.clear()
+    await message.answer(await ladder_text(position), reply_markup=await kb.ladder(position_id))
+
+
+@router.message(Command('export'))
+async def export(message: Message, command: CommandObject):
+    args = (command.args or '').split()
+    name = args[0] if args else None
+    fmt = args[1] if len(args) > 1 else 'csv'
+    if name not in EXPORTS or fmt not in available_formats():
+        text = ('📤 <b>Выгрузка данных</b>\n\n'
+                '<code>/export таблица [формат]</code>\n\n'
+                f'<b>Таблицы:</b> {", ".join(EXPORTS)}\n'
+                f'<b>Форматы:</b> {", ".join(available_formats())}')
+        await message.answer(text)
+        return
+    await job_runner.submit('export', {'name': name, 'fmt': fmt}, message.chat.id)
+
+
+async def send_chart(callback: CallbackQuery, png: Optional[bytes], caption: str,
+                     reply_markup) -> None:
+    """Отправка графика новым сообщением или заменой картинки при смене диапазона"""
+    if png is None:
+        await callback.answer('Недостаточно данных для графика: снимки цен пишутся '
+                              'во время обновления цен', show_alert=True)
+        return
+    photo = BufferedInputFile(png, filename='chart.png')
+    if callback.message.photo:
+        await callback.message.edit_media(InputMediaPhoto(media=photo, caption=caption),
+                                          reply_markup=reply_markup)
+    else:
+        await callback.message.answer_photo(photo, caption=caption, reply_markup=reply_markup)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith('token_chart_') | F.data.startswith('position_chart_')
+                       | (F.data == 'allocation_chart'))
+async def chart(callback: CallbackQuery):
+    if not charts_available():
+        await callback.answer('Графики недоступны: не установлен matplotlib', show_alert=True)
+        return
+    if callback.data == 'allocation_chart':
+        png = await allocation_chart()
+        await send_chart(callback, png, '🥧 <b>Распределение портфеля</b>', kb.chart_close)
+        return
+    prefix, entity_id, days = callback.data.rsplit('_', 2)
+    entity_id, days = int(entity_id), int(days)
+    if prefix == 'token_chart':
+        png = await price_chart(entity_id, days)
+        caption = f'📉 <b>Цена токена за {days} дн.</b>'
+    else:
+        png = await position_chart(entity_id, days)
+        caption = f'📉 <b>Стоимость позиции за {days} дн.</b>'
+    await send_chart(callback, png, caption, await kb.chart_ranges(prefix, entity_id, days))
+
+
+@router.callback_query(F.data == 'chart_close')
+async def chart_close(callback: CallbackQuery):
+    await callback.message.delete()
+
+
+@router.callback_query(F.data == 'alert_rules')
+async def alert_rules(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    text = ('🔔 <b>Правила уведомлений</b>\n\n'
+            'Правила проверяются при каждом обновлении цен токенов с открытыми позициями. '
+            'Уведомление приходит, когда условие начинает выполняться, и повторится, только '
+            'если условие перестанет выполняться и выполнится снова.')
+    await callback.message.edit_text(text, reply_markup=await kb.alert_rules())
+
+
+@router.callback_query(F.data.startswith('rule_page_'))
+async def alert_rules_page(callback: CallbackQuery):
+    page = int(callback.data.split('_')[2])
+    await callback.message.edit_reply_markup(reply_markup=await kb.alert_rules(page=page))
+
+
+@router.callback_query(F.data.startswith('rule_card_'))
+async def alert_rule_card(callback: CallbackQuery):
+    rule_id = int(callback.data.split('_')[2])
+    rule = await rm.get_alert_rule(rule_id)
+    if rule:
+        status = '✅ выполнено, уведомление отправлено' if rule.triggered else '⏳ ожидает'
+        text = (f'🔔 <b>Правило уведомлений</b>\n\n'
+                f'{rule_text(rule)}\n\n'
+                f'<b>Состояние:</b> {status}')
+        await callback.message.edit_text(text, reply_markup=await kb.alert_rule(rule_id))
+
+
+@router.callback_query(F.data.startswith('rule_delete_'))
+async def alert_rule_delete(callback: CallbackQuery):
+    rule_id = int(callback.data.split('_')[2])
+    try:
+        await rq.delete_alert_rule(rule_id)
+        await callback.message.edit_text('✅ Правило удалено.', reply_markup=kb.rules_back)
+    except ValueError as e:
+        await callback.message.edit_text(f'{e}', reply_markup=kb.rules_back)
+
+
+@router.callback_query(F.data == 'rule_add')
+async def alert_rule_add(callback: CallbackQuery):
+    await callback.message.edit_text('🔔 <b>Выберите вид правила:</b>',
+                                     reply_markup=kb.rule_kinds)
+
+
+@router.callback_query(F.data.startswith('rule_kind_'))
+async def alert_rule_kind(callback: CallbackQuery, state: FSMContext):
+    kind = callback.data.removeprefix('rule_kind_')
+    if kind not in RULE_KINDS:
+        return
+    await state.set_state(st.AlertRule.subject)
+    await state.update_data(kind=kind)
+    if kind in TOKEN_RULE_KINDS:
+        text = '✏️ <b>Введите название токена:</b>'
+    else:
+        sectors = await rm.list_sectors()
+        sectors_text = '\n'.join(f'  • {sector.name}' for sector in sectors)
+        text = f'✏️ <b>Введите название сектора:</b>\n\n{sectors_text}'
+    await callback.message.edit_text(text)
+
+
+@router.message(st.AlertRule.subject)
+async def alert_rule_subject(message: Message, state: FSMContext):
+    data = await state.get_data()
+    kind = data['kind']
+    subject = (message.text or '').strip()
+    if kind in TOKEN_RULE_KINDS:
+        subject = subject.upper()
+        if not await rq.get_token_or_info(symbol=subject, field='id'):
+            text = (f'❌ <b>Ошибка!</b>\n\nТокен <b>{subject}</b> не найден в стратегии.\n\n'
+                    f'✏️ <b>Введите название токена:</b>')
+            await message.answer(text)
+            return
+        await state.update_data(symbol=subject)
+    else:
+        sectors = {sector.name.lower(): sector for sector in await rm.list_sectors()}
+        sector = sectors.get(subject.lower())
+        if not sector:
+            text = ('❌ <b>Ошибка!</b>\n\nСектор не найден.\n\n'
+                    '✏️ <b>Введите название сектора:</b>')
+            await message.answer(text)
+            return
+        await state.update_data(sector_id=sector.id)
+
+    await state.set_state(st.AlertRule.threshold)
+    if kind in ('price_above', 'price_below'):
+        text = '💵 <b>Введите цену в $:</b>'
+    elif kind == 'bodyfix':
+        text = '🎯 <b>Введите расстояние до цены фиксации тела в %:</b>'
+    else:
+        text = ('📊 <b>Введите изменение в %:</b>\n\n'
+                'Например, <code>5</code> - рост на 5%, <code>-5</code> - падение на 5%')
+    await message.answer(text)
+
+
+@router.message(st.AlertRule.threshold)
+async def alert_rule_threshold(message: Message, state: FSMContext):
+    try:
+        threshold = Decimal((message.text or '').replace('$', '').replace('%', '')
+                            .replace(',', '.').strip())
+    except InvalidOperation:
+        await message.answer('❌ <b>Ошибка!</b>\n\nВведите <b>корректное число</b>!')
+        return
+    if not threshold.is_finite():
+        await message.answer('❌ <b>Ошибка!</b>\n\nВведите <b>корректное число</b>!')
+        return
+    await state.update_data(threshold=threshold)
+    data = await state.get_data()
+    if data['kind'] in WINDOW_RULE_KINDS:
+        await state.set_state(st.AlertRule.window_minutes)
+        await message.answer(f'⏱ <b>Введите период в минутах</b> '
+                             f'(от 1 до {MAX_RULE_WINDOW_MINUTES}):')
+        return
+    await save_alert_rule(message, state)
+
+
+@router.message(st.AlertRule.window_minutes)
+async def alert_rule_window(message: Message, state: FSMContext):
+    try:
+        window_minutes = int((message.text or '').strip())
+    except ValueError:
+        await message.answer('❌ <b>Ошибка!</b>\n\nВведите <b>целое число</b> минут!')
+        return
+    await state.update_data(window_minutes=window_minutes)
+    await save_alert_rule(message, state)
+
+
+async def save_alert_rule(message: Message, state: FSMContext) -> None:
+    data = await state.get_data()
+    await state.clear()
+    try:
+        rule_id = await rq.add_alert_rule(
+            kind=data['kind'],
+            threshold=data['threshold'],
+            symbol=data.get('symbol'),
+            sector_id=data.get('sector_id'),
+            window_minutes=data.get('window_minutes'),
+        )
+    except ValueError as e:
+        await message.answer(f'{e}', reply_markup=kb.rules_back)
+        return
+    rule = await rm.get_alert_rule(rule_id)
+    await message.answer(f'✅ Правило добавлено:\n\n{rule_text(rule)}',
+                         reply_markup=kb.rules_back)
+
+
+def token_search_result(token: rm.TokenSearchRow) -> InlineQueryResultArticle:
+    """Результат поиска по токену: цена с последнего тика и сводка позиции"""
+    stats = price_stats.get(token.symbol)
+    price = Decimal(repr(stats.price)) if stats else token.current_coinprice_usd
+    price_text = f'{ut.format_number(price)}$' if price else 'нет данных'
+    text = (f'<b>📊 Токен "{token.symbol}" из сектора "{token.sector_name}"</b>\n\n'
+            f'<b>Текущая цена:</b> {price_text}\n'
+            f'<b>Выделено % от сектора:</b> {token.percentage}%\n'
+            f'<b>Выделено на токен:</b> {token.balance_usd}$')
+    if token.position_amount is None:
+        description = f'{token.sector_name} · {price_text} · позиции нет'
+    else:
+        total_usd = token.position_amount * (price or 0)
+        pnl = ((total_usd - token.invested_usd) / token.invested_usd * 100
+               if token.invested_usd else Decimal(0))
+        description = f'{token.sector_name} · {price_text} · позиция {pnl:+.2f}%'
+        text += (f'\n\n<b>Позиция:</b> {ut.format_number(token.position_amount)} '
+                 f'{token.symbol}\n'
+                 f'<b>Инвестировано:</b> {ut.format_number(token.invested_usd)}$\n'
+                 f'<b>Текущая стоимость:</b> {ut.round_to_2(total_usd)}$ ({pnl:+.2f}%)')
+    return InlineQueryResultArticle(
+        id=token_ref(token.id), title=token.symbol, description=description,
+        input_message_content=InputTextMessageContent(message_text=text),
+    )
+
+
+def sector_search_result(sector: rm.SectorSearchRow) -> InlineQueryResultArticle:
+    description = f'Сектор · {sector.percentage}% портфеля · токенов: {sector.tokens_count}'
+    text = (f'<b>🗄 Сектор "{sector.name}"</b>\n\n'
+            f'<b>Выделено % от портфеля:</b> {sector.percentage}%\n'
+            f'<b>Токенов:</b> {sector.tokens_count}')
+    return InlineQueryResultArticle(
+        id=sector_ref(sector.id), title=sector.name, description=description,
+        input_message_content=InputTextMessageContent(message_text=text),
+    )
+
+
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    query = inline_query.query.strip().lower()
+    version = search_index.version
+    results = search_results.get(query, version)
+    if results is None:
+        refs = search_index.search(query)
+        parsed = [parse_ref(ref) for ref in refs]
+        tokens = await rm.list_search_tokens([ref_id for kind, ref_id in parsed
+                                              if kind == TOKEN_PREFIX])
+        sectors = await rm.list_search_sectors([ref_id for kind, ref_id in parsed
+                                                if kind == SECTOR_PREFIX])
+        found = {token_ref(token.id): token_search_result(token) for token in tokens}
+        found.update({sector_ref(sector.id): sector_search_result(sector) for sector in sectors})
+        # Порядок индекса: точные совпадения первыми
+        results = [found[ref] for ref in refs if ref in found]
+        search_results.put(query, version, results)
+    await inline_query.answer(results, cache_time=INLINE_CACHE_SECONDS, is_personal=True)
@@ -0,0 +1,105 @@
+"""
+Виды фоновых задач бота (см. utils.jobs): обработчики сообщений ставят их в
+очередь и сразу отвечают, итог появляется в сообщении о ходе задачи.
+"""
+import os
+import tempfile
+from decimal import Decimal
+
+from aiogram.types import FSInputFile
+
+import bot.keyboards as kb
+import database.requests as rq
+from utils.export import export_filename, export_table
+from utils.jobs import JobContext, JobResult, job_runner
+from utils.order_import import OrderLine
+
+# Сколько ошибок показывать в отчёте о пакетном вводе ордеров
+BULK_ERROR_ROWS = 15
+
+
+def bulk_errors_text(errors: list[tuple[int, str]]) -> str:
+    rows = [f'<b>Строка {line_no}:</b> {" ".join(str(error).split())}'
+            for line_no, error in errors[:BULK_ERROR_ROWS]]
+    if len(errors) > BULK_ERROR_ROWS:
+        rows.append(f'... и ещё {len(errors) - BULK_ERROR_ROWS}')
+    return '❌ <b>Ордера не сохранены.</b>\n\n' + '\n'.join(rows)
+
+
+def order_params(orders: list[OrderLine]) -> list[list]:
+    """Строки ордеров в JSON-виде для параметров задачи"""
+    return [[order.line_no, order.symbol, order.side, str(order.amount),
+             None if order.price is None else str(order.price)] for order in orders]
+
+
+@job_runner.job('deposit', 'Добавление депозита')
+async def deposit_job(job: JobContext, amount_usd: str) -> JobResult:
+    await job.progress(0, stage='Распределение по направлениям, секторам и токенам')
+    try:
+        await rq.add_deposit(amount_usd=Decimal(amount_usd))
+    except ValueError as e:
+        return JobResult(f'{e}', reply_markup=kb.deposit, failed=True)
+    return JobResult(f'✅ Депозит на <b>{amount_usd}$</b> добавлен в <b>портфель</b>!',
+                     reply_markup=kb.deposit)
+
+
+@job_runner.job('bulk_orders', 'Пакетный ввод ордеров')
+async def bulk_orders_job(job: JobContext, orders: list[list]) -> JobResult:
+    lines = [OrderLine(line_no, symbol, side, Decimal(amount),
+                       None if price is None else Decimal(price))
+             for line_no, symbol, side, amount, price in orders]
+    errors = await rq.bulk_orders(
+        lines, progress=lambda done, total: job.progress(done, total, 'Проверка и проводка строк')
+    )
+    if errors:
+        return JobResult(bulk_errors_text(errors) +
+                         '\n\nИсправьте строки и отправьте пакет заново.',
+                         reply_markup=kb.add_order, failed=True)
+    return JobResult(f'✅ <b>Готово!</b>\n\nСохранено ордеров: {len(lines)}.',
+                     reply_markup=kb.order_back)
+
+
+@job_runner.job('sector_percentage', 'Перераспределение сектора')
+async def sector_percentage_job(job: JobContext, sector_id: int, name: str,
+                                percentage: str) -> JobResult:
+    await job.progress(0, stage='Перераспределение балансов токенов сектора')
+    try:
+        transfers = await rq.change_sector_percentage(sector_name=name,
+                                                      percentage=Decimal(percentage))
+    except ValueError as e:
+        return JobResult(f'{e}', reply_markup=kb.strategy_sectors_back, failed=True)
+    return JobResult(f'✅ <b>Готово!</b>\n\n'
+                     f'Сектор <b>{name}</b> теперь составляет '
+                     f'<b>{percentage}% от Рабочего Капитала.</b>\n\n'
+                     f'Перераспределены балансы токенов: {len(transfers)}',
+                     reply_markup=await kb.sector_change(sector_id))
+
+
+@job_runner.job('token_percentage', 'Перераспределение токена')
+async def token_percentage_job(job: JobContext, token_id: int, sector_id: int, symbol: str,
+                               percentage: str) -> JobResult:
+    await job.progress(0, stage='Перераспределение баланса токена')
+    try:
+        transfers = await rq.change_token_percentage(token_id=token_id, sector_id=sector_id,
+                                                     percentage=Decimal(percentage))
+    except ValueError as e:
+        return JobResult(f'{e}', reply_markup=await kb.strategy_tokens_back(sector_id),
+                         failed=True)
+    return JobResult(f'✅ <b>Готово!</b>\n\n'
+                     f'Токен <b>{symbol}</b> теперь составляет '
+                     f'<b>{percentage}%</b> от сектора.\n\n'
+                     f'Перераспределены балансы токенов: {len(transfers)}',
+                     reply_markup=await kb.strategy_tokens_back(sector_id))
+
+
+@job_runner.job('export', 'Выгрузка данных')
+async def export_job(job: JobContext, name: str, fmt: str) -> JobResult:
+    with tempfile.TemporaryDirectory() as directory:
+        path = export_filename(name, fmt, directory)
+        rows_count = await export_table(
+            name, path, fmt, progress=lambda rows: job.progress(rows, stage=f'Таблица {name}')
+        )
+        await job.bot.send_document(job.chat_id,
+                                    FSInputFile(path, filename=os.path.basename(path)),
+                                    caption=f'✅ <b>{name}</b>: {rows_count} строк')
+    return JobResult(f'✅ <b>Выгрузка готова</b>\n\n<b>{name}</b>: {rows_count} строк')
@@ -1,19 +1,33 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-import database.requests as rq
+import database.read_models as rm
+from utils.charts import CHART_RANGES
+from utils.alert_rules import RULE_KINDS, rule_text
+from utils.render_cache import POSITIONS, SECTORS, TOKENS, render_cache
 
 main = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text='Портфель', callback_data='portfolio')],
     [InlineKeyboardButton(text='Стратегия', callback_data='strategy')],
-    [InlineKeyboardButton(text='Активные позиции', callback_data='positions')]
+    [InlineKeyboardButton(text='Активные позиции', callback_data='positions')],
+    [InlineKeyboardButton(text='🔔 Уведомления', callback_data='alert_rules')],
+    [InlineKeyboardButton(text='🔎 Поиск токена', switch_inline_query_current_chat='')]
 ])
 
 portfolio = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text='➕ Добавить депозит', callback_data='deposit')],
+    [InlineKeyboardButton(text='📈 Доходность', callback_data='performance_1'),
+     InlineKeyboardButton(text='🥧 Распределение', callback_data='allocation_chart')],
     [InlineKeyboardButton(text='Назад', callback_data='start')]
 ])
 
+performance = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text='1 день', callback_data='performance_1'),
+     InlineKeyboardButton(text='7 дней', callback_data='performance_7'),
+     InlineKeyboardButton(text='30 дней', callback_data='performance_30')],
+    [InlineKeyboardButton(text='Назад', callback_data='portfolio')]
+])
+
 deposit = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text='Назад', callback_data='start')]
 ])
@@ -40,6 +54,7 @@ strategy_portfolio_back = InlineKeyboardMarkup(inline_keyboard=[
 add_order = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text='Покупка', callback_data='buy_order'),
      InlineKeyboardButton(text='Продажа', callback_data='sell_order')],
+    [InlineKeyboardButton(text='Пакетный ввод', callback_data='bulk_order')],
     [InlineKeyboardButton(text='Назад', callback_data='back_positions')]
 ])
 
@@ -62,10 +77,9 @@ order_back = InlineKeyboardMarkup(inline_keyboard=[
      InlineKeyboardButton(text='В меню', callback_data='start')]
 ])
 
+@render_cache.cached('strategy_sectors', scopes=(SECTORS,))
 async def strategy_sectors(page: int = 0) -> InlineKeyboardMarkup:
-    all_strategy_sectors = await rq.get_all_sectors()
-    if all_strategy_sectors is None:
-        all_strategy_sectors = []
+    all_strategy_sectors = await rm.list_sectors()
     keyboard = InlineKeyboardBuilder()
     buttons_per_page = 4
     nav_buttons = []
@@ -92,6 +106,7 @@ async def strategy_sectors(page: int = 0) -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@render_cache.cached('in_sector')
 async def in_sector(sector_id: int) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardBuilder()
     keyboard.add(InlineKeyboardButton(text='Изменить % сектора',
@@ -120,10 +135,16 @@ async def sector_change(sector_id: int) -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+async def reallocation_confirm(apply_data: str, cancel_data: str) -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardBuilder()
+    keyboard.add(InlineKeyboardButton(text='✅ Применить', callback_data=apply_data))
+    keyboard.add(InlineKeyboardButton(text='❌ Отмена', callback_data=cancel_data))
+    return keyboard.as_markup()
+
+
+@render_cache.cached('positions', scopes=(POSITIONS,))
 async def positions(page: int = 0) -> InlineKeyboardMarkup:
-    all_positions = await rq.get_all_positions()
-    if all_positions is None:
-        all_positions = []
+    all_positions = await rm.list_positions()
     keyboard = InlineKeyboardBuilder()
     buttons_per_page = 4
     nav_buttons = []
@@ -149,6 +170,7 @@ async def positions(page: int = 0) -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@render_cache.cached('in_position')
 async def in_position(position_id: int) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardBuilder()
     keyboard.add(
@@ -159,15 +181,18 @@ async def in_position(position_id: int) -> InlineKeyboardMarkup:
             text="➖ Продать токен", callback_data=f"position_sell_order_{position_id}"
         ),
     )
+    keyboard.row(InlineKeyboardButton(text='📉 График',
+                                      callback_data=f'position_chart_{position_id}_7'),
+                 InlineKeyboardButton(text='🪜 Лестница входа',
+                                      callback_data=f'position_ladder_{position_id}'))
     keyboard.row(InlineKeyboardButton(text='Назад', callback_data='positions'),
                  InlineKeyboardButton(text='В меню', callback_data='start'))
     return keyboard.as_markup()
 
 
+@render_cache.cached('strategy_tokens', scopes=(TOKENS,))
 async def strategy_tokens(sector_id: int, page: int = 0) -> InlineKeyboardMarkup:
-    all_strategy_tokens = await rq.get_all_sector_tokens(sector_id=sector_id)
-    if all_strategy_tokens is None:
-        all_strategy_tokens = []
+    all_strategy_tokens = await rm.list_sector_tokens(sector_id=sector_id)
     keyboard = InlineKeyboardBuilder()
     buttons_per_page = 4
     nav_buttons = []
@@ -193,6 +218,7 @@ async def strategy_tokens(sector_id: int, page: int = 0) -> InlineKeyboardMarkup
     return keyboard.as_markup()
 
 
+@render_cache.cached('strategy_tokens_back')
 async def strategy_tokens_back(sector_id: int) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardBuilder()
     keyboard.add(InlineKeyboardButton(text='Назад', callback_data=f'strategy_tokens_{sector_id}'),
@@ -200,12 +226,15 @@ async def strategy_tokens_back(sector_id: int) -> InlineKeyboardMarkup:
     return keyboard.as_markup()
 
 
+@render_cache.cached('in_token')
 async def in_token(token_id: int) -> InlineKeyboardMarkup:
     keyboard = InlineKeyboardBuilder()
     keyboard.add(InlineKeyboardButton(text='Изменить %',
                                       callback_data=f'token_change_percentage_{token_id}'),
                  InlineKeyboardButton(text='Удалить токен',
                                       callback_data=f'token_delete_button_{token_id}'))
+    keyboard.row(InlineKeyboardButton(text='📉 График цены',
+                                      callback_data=f'token_chart_{token_id}_7'))
     keyboard.row(InlineKeyboardButton(text='Назад', callback_data='strategy_sectors'))
     return keyboard.as_markup()
 
@@ -216,9 +245,79 @@ async def token_delete_confirm(token_id: int) -> InlineKeyboardMarkup:
     keyboard.add(InlineKeyboardButton(text='❌ Отмена', callback_data=f'token_button_{token_id}'))
     return keyboard.as_markup()
 
+@render_cache.cached('to_position_button')
 async def to_position_button(position_id: int) -> InlineKeyboardMarkup:
     """Создает клавиатуру с одной кнопкой для перехода к позиции"""
     keyboard = InlineKeyboardBuilder()
     keyboard.row(InlineKeyboardButton(text='Открыть позицию', 
                                      callback_data=f'position_button_{position_id}'))
     return keyboard.as_markup()
+
+
+async def ladder(position_id: int) -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardBuilder()
+    keyboard.row(InlineKeyboardButton(text='🔄 Перестроить от цены',
+                                      callback_data=f'ladder_build_{position_id}'))
+    keyboard.row(InlineKeyboardButton(text='Назад',
+                                      callback_data=f'position_button_{position_id}'),
+                 InlineKeyboardButton(text='В меню', callback_data='start'))
+    return keyboard.as_markup()
+
+
+async def chart_ranges(prefix: str, entity_id: int, days: int) -> InlineKeyboardMarkup:
+    """Переключение диапазона графика; текущий диапазон отмечен точкой"""
+    keyboard = InlineKeyboardBuilder()
+    for chart_days in CHART_RANGES:
+        mark = '• ' if chart_days == days else ''
+        keyboard.add(InlineKeyboardButton(text=f'{mark}{chart_days} дн.',
+                                          callback_data=f'{prefix}_{entity_id}_{chart_days}'))
+    keyboard.row(InlineKeyboardButton(text='✖️ Закрыть', callback_data='chart_close'))
+    return keyboard.as_markup()
+
+
+chart_close = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text='✖️ Закрыть', callback_data='chart_close')]
+])
+
+
+async def alert_rules(page: int = 0) -> InlineKeyboardMarkup:
+    all_rules = await rm.list_alert_rules()
+    keyboard = InlineKeyboardBuilder()
+    buttons_per_page = 6
+    nav_buttons = []
+    total_pages = (len(all_rules) - 1) // buttons_per_page + 1
+    start_index = page * buttons_per_page
+    rules_on_page = all_rules[start_index:start_index + buttons_per_page]
+    for rule in rules_on_page:
+        # В тексте кнопки разметка не поддерживается
+        text = rule_text(rule).replace('<b>', '').replace('</b>', '')
+        keyboard.row(InlineKeyboardButton(text=text, callback_data=f'rule_card_{rule.id}'))
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton(text='⬅️', callback_data=f'rule_page_{page - 1}'))
+    if page < total_pages - 1:
+        nav_buttons.append(InlineKeyboardButton(text='➡️', callback_data=f'rule_page_{page + 1}'))
+    if nav_buttons:
+        keyboard.row(*nav_buttons)
+    keyboard.row(InlineKeyboardButton(text='➕ Добавить правило', callback_data='rule_add'),
+                 InlineKeyboardButton(text='Назад', callback_data='start'))
+    return keyboard.as_markup()
+
+
+rule_kinds = InlineKeyboardMarkup(inline_keyboard=[
+    *[[InlineKeyboardButton(text=title, callback_data=f'rule_kind_{kind}')]
+      for kind, title in RULE_KINDS.items()],
+    [InlineKeyboardButton(text='Назад', callback_data='alert_rules')]
+])
+
+rules_back = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text='К правилам', callback_data='alert_rules'),
+     InlineKeyboardButton(text='В меню', callback_data='start')]
+])
+
+
+async def alert_rule(rule_id: int) -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardBuilder()
+    keyboard.row(InlineKeyboardButton(text='Удалить правило',
+                                      callback_data=f'rule_delete_{rule_id}'))
+    keyboard.row(InlineKeyboardButton(text='Назад', callback_data='alert_rules'))
+    return keyboard.as_markup()
@@ -1,10 +1,31 @@
 import os
-from typing import Callable, Dict, Any, Awaitable
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import suppress
+from typing import Callable, Dict, Any, Awaitable, Optional
 
 from aiogram import BaseMiddleware, Dispatcher
-from aiogram.types import TelegramObject
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, TelegramObject, Update
+from dotenv import load_dotenv
 
+import database.requests as rq
+
+load_dotenv()
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
+# Повтор той же кнопки в течение этого времени после обработки отбрасывается, сек.
+CALLBACK_DEBOUNCE_SECONDS = float(os.getenv("CALLBACK_DEBOUNCE_SECONDS", 1))
+# Сколько последних update_id помнить для отсева повторов во время работы
+RECENT_UPDATES = 1000
+# Как часто сохранять отметку принятых обновлений в БД, сек.
+UPDATE_WATERMARK_FLUSH_SECONDS = float(os.getenv("UPDATE_WATERMARK_FLUSH_SECONDS", 5))
+# Повторами считаются только номера не дальше этого ниже отметки: после недели
+# без обновлений Telegram начинает новую последовательность со случайного номера
+UPDATE_ID_WINDOW = 100_000
+
+logger = logging.getLogger(__name__)
 
 
 class CheckAdminMiddleware(BaseMiddleware):
@@ -29,3 +50,139 @@ class CheckAdminMiddleware(BaseMiddleware):
             self.dp.inline_query,
         ]:
             event_type.outer_middleware(self)
+
+
+class CallbackDebounceMiddleware(BaseMiddleware):
+    """
+    Отсев повторных нажатий одной и той же кнопки.
+
+    Нажатие определяется пользователем, сообщением и callback_data. Пока
+    обработчик нажатия выполняется, такие же нажатия не запускают его ещё
+    раз, как и повторы в течение window секунд после его завершения. На
+    отброшенные нажатия сразу отвечается пустым answer, чтобы у кнопки
+    пропал индикатор загрузки. Ошибка "message is not modified" (повторная
+    отрисовка того же экрана) тоже гасится ответом на нажатие.
+    """
+
+    def __init__(self, dp: Dispatcher, window: float = CALLBACK_DEBOUNCE_SECONDS) -> None:
+        self.window = window
+        self.in_flight: set[tuple] = set()
+        # Момент завершения обработки нажатия {ключ: time.monotonic()}
+        self.finished: dict[tuple, float] = {}
+        dp.callback_query.outer_middleware(self)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        message_id = event.message.message_id if event.message else event.inline_message_id
+        key = (event.from_user.id, message_id, event.data)
+        finished_at = self.finished.get(key)
+        if key in self.in_flight or (finished_at is not None
+                                     and time.monotonic() - finished_at < self.window):
+            await self.answer(event)
+            return None
+        self.in_flight.add(key)
+        try:
+            return await handler(event, data)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+            await self.answer(event)
+        finally:
+            self.in_flight.discard(key)
+            self.finished[key] = time.monotonic()
+            self._prune()
+
+    @staticmethod
+    async def answer(event: CallbackQuery) -> None:
+        # На уже отвеченное или устаревшее нажатие Telegram отвечает ошибкой
+        with suppress(TelegramBadRequest):
+            await event.answer()
+
+    def _prune(self) -> None:
+        if len(self.finished) < RECENT_UPDATES:
+            return
+        horizon = time.monotonic() - self.window
+        self.finished = {key: at for key, at in self.finished.items() if at >= horizon}
+
+
+class UpdateWatermarkMiddleware(BaseMiddleware):
+    """
+    Отсев уже принятых в обработку обновлений.
+
+    Наибольший принятый update_id сохраняется в БД раз в
+    UPDATE_WATERMARK_FLUSH_SECONDS и при остановке, поэтому после перезапуска
+    обновления, которые Telegram отдаёт повторно (не подтверждённые при
+    остановке), не обрабатываются второй раз; после аварийного падения могут
+    повториться принятые за последний интервал. Отбрасываются только номера
+    в пределах UPDATE_ID_WINDOW ниже отметки: номер намного ниже - новая
+    последовательность Telegram, с него отметка начинается заново. Во время
+    работы повторы отсеиваются по последним RECENT_UPDATES номерам, а не по
+    отметке: при параллельной обработке обновления могут приходить не по
+    порядку.
+    """
+
+    def __init__(self, dp: Dispatcher, bot_id: int) -> None:
+        self.bot_id = bot_id
+        # Отметка на момент запуска: всё, что не больше неё, обработано до перезапуска
+        self.watermark = 0
+        # Наибольший принятый номер и сохранён ли он в БД
+        self.highest = 0
+        self.saved = True
+        self.recent: deque[int] = deque(maxlen=RECENT_UPDATES)
+        self.recent_ids: set[int] = set()
+        self.flush_task: Optional[asyncio.Task] = None
+        dp.update.outer_middleware(self)
+
+    async def start(self) -> None:
+        """Загрузка отметки из БД и запуск её периодического сохранения"""
+        self.watermark = self.highest = await rq.get_update_watermark(self.bot_id)
+        self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self.flush_task:
+            self.flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.flush_task
+            self.flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if self.saved:
+            return
+        self.saved = True
+        try:
+            await rq.save_update_watermark(self.bot_id, self.highest, UPDATE_ID_WINDOW)
+        except Exception as e:
+            self.saved = False
+            logger.error(f"Не удалось сохранить отметку обновлений: {e}")
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(UPDATE_WATERMARK_FLUSH_SECONDS)
+            await self.flush()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_id = event.update_id
+        if update_id in self.recent_ids or 0 <= self.watermark - update_id < UPDATE_ID_WINDOW:
+            logger.info(f"Обновление {update_id} уже обработано, пропуск")
+            return None
+        if update_id < self.highest - UPDATE_ID_WINDOW:
+            logger.warning(f"Новая последовательность update_id с {update_id}, отметка сброшена")
+            self.watermark = self.highest = 0
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_ids.discard(self.recent[0])
+        self.recent.append(update_id)
+        self.recent_ids.add(update_id)
+        if update_id > self.highest:
+            self.highest = update_id
+            self.saved = False
+        return await handler(event, data)
@@ -16,6 +16,7 @@ class Sector(StatesGroup):
     name = State()
     percentage = State()
     new_percentage = State()
+    confirm_percentage = State()
 
 class Token(StatesGroup):
     token_id = State()
@@ -23,6 +24,7 @@ class Token(StatesGroup):
     symbol = State()
     percentage = State()
     new_percentage = State()
+    confirm_percentage = State()
     balance_usd = State()
 
 class Order(StatesGroup):
@@ -34,4 +36,14 @@ class Order(StatesGroup):
     sell_token_symbol = State()
     sell_token_id = State()
     sell_amount = State()
-    
\ No newline at end of file
+
+    bulk = State()
+    
+class Ladder(StatesGroup):
+    anchor_price = State()
+
+
+class AlertRule(StatesGroup):
+    subject = State()
+    threshold = State()
+    window_minutes = State()
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 16))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookServer:
+    """
+    Приём обновлений Telegram через webhook.
+
+    HTTP-обработчик только кладёт обновление в ограниченную очередь и сразу
+    отвечает Telegram. Обновления из очереди передаются диспетчеру пулом
+    воркеров. При заполненной очереди возвращается 503, и Telegram повторит
+    доставку позже - так нагрузка не накапливается в памяти бота.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        host: str = WEBHOOK_HOST,
+        port: int = WEBHOOK_PORT,
+        path: str = WEBHOOK_PATH,
+        secret: str = WEBHOOK_SECRET,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+        workers: int = WEBHOOK_WORKERS,
+    ):
+        self.bot = bot
+        self.dp = dp
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.workers_count = workers
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=queue_size)
+        self.runner: Optional[web.AppRunner] = None
+        self.workers: list[asyncio.Task] = []
+        # Число отклонённых подряд обновлений, чтобы не засорять лог при всплеске
+        self.rejected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Приём одного обновления от Telegram"""
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return web.Response(status=401)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            if self.rejected == 1:
+                logger.warning("Очередь обновлений webhook заполнена, Telegram повторит доставку")
+            return web.Response(status=503)
+        self.rejected = 0
+        return web.Response()
+
+    async def worker(self) -> None:
+        """Передача обновлений из очереди диспетчеру"""
+        while True:
+            data = await self.queue.get()
+            try:
+                update = Update.model_validate(data, context={"bot": self.bot})
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления webhook: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def start(self) -> None:
+        """Запуск HTTP-сервера и воркеров в текущем цикле событий"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.workers_count)]
+        await self.dp.emit_startup(bot=self.bot)
+        logger.info(f"Webhook-сервер запущен на {self.host}:{self.port}{self.path}")
+
+    async def set_webhook(self, url: str = WEBHOOK_URL) -> None:
+        """Регистрация адреса webhook в Telegram"""
+        await self.bot.set_webhook(
+            url=f"{url.rstrip('/')}{self.path}",
+            secret_token=self.secret or None,
+            allowed_updates=self.dp.resolve_used_update_types(),
+        )
+
+    async def stop(self, drain_timeout: float = 10) -> None:
+        """
+        Остановка: сервер, дообработка очереди, воркеры и HTTP-сессия бота.
+
+        Сессию бота в режиме polling закрывает start_polling, здесь - сервер.
+        """
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не обработано обновлений webhook: {self.queue.qsize()}")
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        await self.dp.emit_shutdown(bot=self.bot)
+        await self.bot.session.close()
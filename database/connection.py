@@ -2,11 +2,13 @@ import os
 from dotenv import load_dotenv
 from decimal import Decimal
 
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, async_sessionmaker, create_async_engine
 from sqlalchemy.sql import text
 
-from database.models import Base
-import database.requests as rq
+from database.models import Base, Sector, Token, PercentageTotal
+from database.models import SECTORS_SCOPE, SECTOR_SCOPE_PREFIX
 
 load_dotenv()
 engine_pg = create_async_engine(url=os.getenv('POSTGRESQL_URL'))
@@ -14,11 +16,50 @@ engine_pg = create_async_engine(url=os.getenv('POSTGRESQL_URL'))
 engine = create_async_engine(url=os.getenv('DB_URL'))
 async_session = async_sessionmaker(engine)
 
+
+def get_asyncpg_dsn() -> str:
+    """DSN для прямых соединений asyncpg (LISTEN/NOTIFY, advisory locks)"""
+    return engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+
+
 async def async_main():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await rebuild_percentage_totals(conn)
+
+
+async def rebuild_percentage_totals(conn: AsyncConnection) -> None:
+    """
+    Пересчёт итогов процентов по секторам и токенам из самих таблиц.
+
+    Выполняется при каждом старте: заполняет таблицу после обновления и
+    исправляет итоги после правок БД в обход бота. Блокировка таблицы ждёт
+    транзакции, которые уже изменили итоги, а новые изменения применятся
+    поверх пересчитанных значений.
+    """
+    await conn.execute(text('LOCK TABLE percentage_totals IN SHARE ROW EXCLUSIVE MODE'))
+    sector_scope = func.concat(SECTOR_SCOPE_PREFIX, Sector.id)
+    sectors_total = select(literal(SECTORS_SCOPE), func.coalesce(func.sum(Sector.percentage), 0))
+    tokens_totals = (
+        select(sector_scope, func.coalesce(func.sum(Token.percentage), 0))
+        .outerjoin(Token, Token.sector_id == Sector.id)
+        .group_by(Sector.id)
+    )
+    for totals in (sectors_total, tokens_totals):
+        query = insert(PercentageTotal).from_select(['scope', 'total'], totals)
+        await conn.execute(query.on_conflict_do_update(
+            index_elements=['scope'], set_={'total': query.excluded.total}
+        ))
+    # Итоги удалённых в обход бота секторов
+    await conn.execute(delete(PercentageTotal).where(
+        PercentageTotal.scope != SECTORS_SCOPE,
+        PercentageTotal.scope.not_in(select(sector_scope)),
+    ))
 
 async def create_default_columns():
+    # database.requests сам импортирует этот модуль, поэтому импорт здесь
+    import database.requests as rq
+
     await rq.add_portfolio_directions()
     sectors_data = [
         ('Layer 1', Decimal(32)),
@@ -165,3 +206,6 @@ async def create_database():
             await async_main()
             await create_default_columns()
             print('База данных cryptofolio_db создана.')
+        else:
+            # Таблицы, добавленные после создания БД
+            await async_main()
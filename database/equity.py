@@ -0,0 +1,206 @@
+"""
+История стоимости портфеля и цен токенов: снимки, агрегаты по часам и дням и выборка для экрана.
+
+Снимки пишутся пачками (см. utils.equity), затем сворачиваются в
+equity_rollups. Экран доходности читает только свёрнутые строки.
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, array_agg, insert
+
+from database.connection import async_session
+from database.models import Direction, Position, Token
+from database.models import EquityRollup, EquitySnapshot, PriceSnapshot, SectorSnapshot
+
+# Периоды агрегатов и их длительность
+ROLLUP_PERIODS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+class EquitySample(NamedTuple):
+    taken_at: datetime
+    liquidity_usd: Decimal
+    positions_usd: Decimal
+    tokens_usd: Decimal
+    total_usd: Decimal
+    # {sector_id: (стоимость позиций, баланс токенов)}
+    sectors: dict[int, tuple[Decimal, Decimal]]
+    # {token_id: текущая цена} для токенов с известной ценой
+    prices: dict[int, Decimal]
+
+
+class Performance(NamedTuple):
+    start_usd: Decimal
+    end_usd: Decimal
+    high_usd: Decimal
+    low_usd: Decimal
+    change_usd: Decimal
+    change_percentage: Optional[Decimal]
+    liquidity_usd: Decimal
+    positions_usd: Decimal
+    tokens_usd: Decimal
+    since: datetime
+
+
+def utc_now() -> datetime:
+    """Текущее время UTC без часового пояса, как в колонках TIMESTAMP"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def period_start(moment: datetime, period: str) -> datetime:
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if period == "day" else moment
+
+
+async def take_snapshot() -> EquitySample:
+    """Текущая стоимость портфеля с разбивкой по секторам и цены токенов"""
+    directions_query = select(Direction.name, func.coalesce(Direction.balance_usd, 0))
+    sectors_query = (
+        select(Token.sector_id,
+               func.coalesce(func.sum(Position.total_usd), 0),
+               func.coalesce(func.sum(Token.balance_usd), 0))
+        .outerjoin(Position, Position.token_id == Token.id)
+        .group_by(Token.sector_id)
+    )
+    prices_query = (select(Token.id, Token.current_coinprice_usd)
+                    .where(Token.current_coinprice_usd.is_not(None)))
+    async with async_session() as session:
+        directions = dict((await session.execute(directions_query)).all())
+        sectors = {
+            sector_id: (positions_usd, tokens_usd)
+            for sector_id, positions_usd, tokens_usd in await session.execute(sectors_query)
+        }
+        prices = dict((await session.execute(prices_query)).all())
+    liquidity_usd = directions.get("Ликвидность", Decimal(0))
+    positions_usd = sum((positions for positions, _ in sectors.values()), Decimal(0))
+    tokens_usd = sum((tokens for _, tokens in sectors.values()),
+                     directions.get("Рабочий капитал", Decimal(0)))
+    return EquitySample(
+        taken_at=utc_now(),
+        liquidity_usd=liquidity_usd,
+        positions_usd=positions_usd,
+        tokens_usd=tokens_usd,
+        total_usd=liquidity_usd + positions_usd + tokens_usd,
+        sectors=sectors,
+        prices=prices,
+    )
+
+
+async def save_snapshots(samples: list[EquitySample]) -> None:
+    """Запись пачки снимков: по одному INSERT на таблицу"""
+    if not samples:
+        return
+    sector_rows = [
+        {"taken_at": sample.taken_at, "sector_id": sector_id,
+         "positions_usd": positions_usd, "tokens_usd": tokens_usd}
+        for sample in samples
+        for sector_id, (positions_usd, tokens_usd) in sample.sectors.items()
+    ]
+    price_rows = [
+        {"token_id": token_id, "taken_at": sample.taken_at, "price": price}
+        for sample in samples
+        for token_id, price in sample.prices.items()
+    ]
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(insert(EquitySnapshot), [
+                {"taken_at": sample.taken_at, "liquidity_usd": sample.liquidity_usd,
+                 "positions_usd": sample.positions_usd, "tokens_usd": sample.tokens_usd,
+                 "total_usd": sample.total_usd}
+                for sample in samples
+            ])
+            if sector_rows:
+                await session.execute(insert(SectorSnapshot), sector_rows)
+            if price_rows:
+                await session.execute(insert(PriceSnapshot), price_rows)
+
+
+async def rollup_snapshots(since: datetime, retention: timedelta) -> None:
+    """
+    Пересчёт агрегатов по часам и дням, начиная с периода, в который попадает since.
+
+    Агрегаты уже прошедших периодов перезаписываются теми же значениями,
+    поэтому повторный запуск безопасен. Снимки старше retention удаляются:
+    к этому времени они уже свёрнуты.
+    """
+    snapshot = EquitySnapshot
+    async with async_session() as session:
+        async with session.begin():
+            for period in ROLLUP_PERIODS:
+                start = func.date_trunc(period, snapshot.taken_at)
+                rollup = (
+                    select(
+                        literal(period),
+                        start,
+                        array_agg(aggregate_order_by(snapshot.total_usd, snapshot.taken_at))[1],
+                        func.max(snapshot.total_usd),
+                        func.min(snapshot.total_usd),
+                        *[array_agg(aggregate_order_by(column, snapshot.taken_at.desc()))[1]
+                          for column in (snapshot.total_usd, snapshot.liquidity_usd,
+                                         snapshot.positions_usd, snapshot.tokens_usd)],
+                        func.count(),
+                    )
+                    .where(snapshot.taken_at >= period_start(since, period))
+                    .group_by(start)
+                )
+                query = insert(EquityRollup).from_select(
+                    ["period", "period_start", "open_usd", "high_usd", "low_usd", "close_usd",
+                     "liquidity_usd", "positions_usd", "tokens_usd", "samples"],
+                    rollup,
+                )
+                await session.execute(query.on_conflict_do_update(
+                    index_elements=["period", "period_start"],
+                    set_={column: query.excluded[column] for column in (
+                        "open_usd", "high_usd", "low_usd", "close_usd",
+                        "liquidity_usd", "positions_usd", "tokens_usd", "samples")},
+                ))
+
+            expired = utc_now() - retention
+            await session.execute(delete(EquitySnapshot).where(EquitySnapshot.taken_at < expired))
+            await session.execute(delete(SectorSnapshot).where(SectorSnapshot.taken_at < expired))
+
+
+async def purge_price_history(retention: timedelta) -> None:
+    """Удаление снимков цен старше retention"""
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                delete(PriceSnapshot).where(PriceSnapshot.taken_at < utc_now() - retention)
+            )
+
+
+async def get_performance(days: int) -> Optional[Performance]:
+    """
+    Изменение стоимости портфеля за последние days дней по агрегатам.
+
+    До недели включительно используются часовые агрегаты, дальше - дневные.
+    None, если за период нет ни одного агрегата.
+    """
+    period = "hour" if days <= 7 else "day"
+    since = period_start(utc_now() - timedelta(days=days), period)
+    query = (
+        select(EquityRollup)
+        .where(EquityRollup.period == period, EquityRollup.period_start >= since)
+        .order_by(EquityRollup.period_start)
+    )
+    async with async_session() as session:
+        rollups = (await session.execute(query)).scalars().all()
+    if not rollups:
+        return None
+    first, last = rollups[0], rollups[-1]
+    change_usd = last.close_usd - first.open_usd
+    return Performance(
+        start_usd=first.open_usd,
+        end_usd=last.close_usd,
+        high_usd=max(rollup.high_usd for rollup in rollups),
+        low_usd=min(rollup.low_usd for rollup in rollups),
+        change_usd=change_usd,
+        change_percentage=(round(change_usd / first.open_usd * 100, 2)
+                           if first.open_usd else None),
+        liquidity_usd=last.liquidity_usd,
+        positions_usd=last.positions_usd,
+        tokens_usd=last.tokens_usd,
+        since=first.period_start,
+    )
@@ -0,0 +1,111 @@
+"""
+Очередь фоновых задач бота: запись, захват воркером, ход выполнения и итог.
+
+Задача захватывается атомарным переводом queued -> running, поэтому одну
+задачу выполняет только один воркер, даже если её поставили в очередь
+несколько процессов. Процесс, выполняющий задачу, регулярно обновляет её
+updated_at: задачи без обновлений дольше срока брошены упавшим процессом.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select, update
+
+from database.connection import async_session
+from database.equity import utc_now
+from database.models import Job
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobRow(NamedTuple):
+    id: int
+    kind: str
+    params: dict
+    chat_id: int
+    message_id: Optional[int]
+
+
+async def create_job(kind: str, params: dict, chat_id: int,
+                     message_id: Optional[int] = None) -> int:
+    """Записывает задачу в очередь и возвращает её ID"""
+    async with async_session() as session:
+        async with session.begin():
+            now = utc_now()
+            job = Job(kind=kind, params=params, status=QUEUED, chat_id=chat_id,
+                      message_id=message_id, created_at=now, updated_at=now)
+            session.add(job)
+            await session.flush()
+            return job.id
+
+
+async def set_job_message(job_id: int, message_id: int) -> None:
+    """Сообщение о ходе задачи, отправленное после её записи"""
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(update(Job).where(Job.id == job_id)
+                                  .values(message_id=message_id))
+
+
+async def claim_job(job_id: int) -> Optional[JobRow]:
+    """Переводит задачу из очереди в выполнение; None, если её уже взял другой воркер"""
+    async with async_session() as session:
+        async with session.begin():
+            query = (update(Job)
+                     .where(Job.id == job_id, Job.status == QUEUED)
+                     .values(status=RUNNING, updated_at=utc_now())
+                     .returning(Job.id, Job.kind, Job.params, Job.chat_id, Job.message_id))
+            row = (await session.execute(query)).one_or_none()
+            return JobRow(*row) if row else None
+
+
+async def save_job_progress(job_id: int, progress: int) -> None:
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(update(Job).where(Job.id == job_id, Job.status == RUNNING)
+                                  .values(progress=progress, updated_at=utc_now()))
+
+
+async def touch_jobs(job_ids: list[int]) -> None:
+    """Отметка, что выполняемые задачи живы, когда отчётов о ходе давно не было"""
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(update(Job).where(Job.id.in_(job_ids), Job.status == RUNNING)
+                                  .values(updated_at=utc_now()))
+
+
+async def finish_job(job_id: int, status: str, result: str) -> None:
+    async with async_session() as session:
+        async with session.begin():
+            values = {'status': status, 'result': result, 'updated_at': utc_now()}
+            if status == DONE:
+                values['progress'] = 100
+            await session.execute(update(Job).where(Job.id == job_id).values(**values))
+
+
+async def list_queued_jobs() -> list[int]:
+    """ID задач в очереди по порядку постановки"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Job.id).where(Job.status == QUEUED).order_by(Job.id)
+        )
+        return list(result.scalars())
+
+
+async def fail_stale_jobs(updated_before: datetime, result: str) -> list[JobRow]:
+    """
+    Завершает ошибкой выполняемые задачи без отчётов о ходе с updated_before.
+
+    Returns:
+        Завершённые задачи: их сообщения нужно обновить
+    """
+    async with async_session() as session:
+        async with session.begin():
+            query = (update(Job)
+                     .where(Job.status == RUNNING, Job.updated_at < updated_before)
+                     .values(status=FAILED, result=result, updated_at=utc_now())
+                     .returning(Job.id, Job.kind, Job.params, Job.chat_id, Job.message_id))
+            return [JobRow(*row) for row in await session.execute(query)]
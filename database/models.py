@@ -1,6 +1,8 @@
+from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import Numeric, String, TIMESTAMP, ForeignKey, CheckConstraint
+from sqlalchemy import Numeric, String, TIMESTAMP, ForeignKey, CheckConstraint, BigInteger
+from sqlalchemy import JSON, Text
 from sqlalchemy import func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import AsyncAttrs
@@ -103,3 +105,140 @@ class Order(Base):
     added_at: Mapped[str] = mapped_column(TIMESTAMP, default=func.current_timestamp())
 
     token: Mapped['Token'] = relationship('Token', back_populates='orders')
+
+
+class AlertState(Base):
+    __tablename__ = 'alert_states'
+
+    symbol: Mapped[str] = mapped_column(String(50), primary_key=True)
+    bodyfix_notified: Mapped[bool] = mapped_column(default=False)
+    drawdown_last_price: Mapped[Decimal] = mapped_column(Numeric(45, 15), nullable=True)
+
+
+# Области итогов процентов: все секторы и токены одного сектора
+SECTORS_SCOPE = 'sectors'
+SECTOR_SCOPE_PREFIX = 'sector:'
+
+
+def sector_scope(sector_id: int) -> str:
+    return f'{SECTOR_SCOPE_PREFIX}{sector_id}'
+
+
+class PercentageTotal(Base):
+    __tablename__ = 'percentage_totals'
+
+    scope: Mapped[str] = mapped_column(String(30), primary_key=True)
+    total: Mapped[Decimal] = mapped_column(Numeric(6, 2), nullable=False, default=0)
+
+
+class EquitySnapshot(Base):
+    __tablename__ = 'equity_snapshots'
+
+    taken_at: Mapped[datetime] = mapped_column(TIMESTAMP, primary_key=True)
+    liquidity_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    # Рыночная стоимость позиций
+    positions_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    # Нераспределённое: балансы токенов и свободный остаток рабочего капитала
+    tokens_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    total_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+
+
+class SectorSnapshot(Base):
+    __tablename__ = 'sector_snapshots'
+
+    taken_at: Mapped[datetime] = mapped_column(TIMESTAMP, primary_key=True)
+    # Без внешнего ключа: история остаётся и после удаления сектора
+    sector_id: Mapped[int] = mapped_column(primary_key=True)
+    positions_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    tokens_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+
+
+class EquityRollup(Base):
+    __tablename__ = 'equity_rollups'
+
+    # hour или day
+    period: Mapped[str] = mapped_column(String(4), primary_key=True)
+    period_start: Mapped[datetime] = mapped_column(TIMESTAMP, primary_key=True)
+    open_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    high_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    low_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    close_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    liquidity_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    positions_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    tokens_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+    samples: Mapped[int] = mapped_column(nullable=False)
+
+
+class PriceSnapshot(Base):
+    __tablename__ = 'price_snapshots'
+
+    token_id: Mapped[int] = mapped_column(primary_key=True)
+    taken_at: Mapped[datetime] = mapped_column(TIMESTAMP, primary_key=True)
+    price: Mapped[Decimal] = mapped_column(Numeric(45, 15), nullable=False)
+
+
+class AlertRule(Base):
+    __tablename__ = 'alert_rules'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # price_above, price_below, change, bodyfix или sector_change (см. utils.alert_rules)
+    kind: Mapped[str] = mapped_column(String(20), nullable=False)
+    # Токен для правил по токену, сектор - для правил по сектору
+    symbol: Mapped[str] = mapped_column(String(50), nullable=True, index=True)
+    sector_id: Mapped[int] = mapped_column(nullable=True, index=True)
+    # Цена в $ или процент; у изменения за окно знак задаёт направление
+    threshold: Mapped[Decimal] = mapped_column(Numeric(45, 15), nullable=False)
+    window_minutes: Mapped[int] = mapped_column(nullable=True)
+    # Условие выполнено и уведомление отправлено; сбрасывается, когда условие перестаёт выполняться
+    triggered: Mapped[bool] = mapped_column(default=False)
+
+
+class Ladder(Base):
+    __tablename__ = 'ladders'
+
+    token_id: Mapped[int] = mapped_column(ForeignKey('tokens.id'), primary_key=True)
+    # Цена первой ступени и шаг между ступенями, %
+    anchor_price: Mapped[Decimal] = mapped_column(Numeric(45, 15), nullable=False)
+    step_percentage: Mapped[Decimal] = mapped_column(Numeric(5, 2), nullable=False)
+    # Заполненные ступени: растёт на единицу с каждой покупкой
+    filled: Mapped[int] = mapped_column(nullable=False, default=0)
+    # Последняя ступень, о достижении цены которой отправлено уведомление
+    alerted: Mapped[int] = mapped_column(nullable=False, default=-1)
+
+
+class LadderRung(Base):
+    __tablename__ = 'ladder_rungs'
+
+    token_id: Mapped[int] = mapped_column(ForeignKey('tokens.id'), primary_key=True)
+    rung: Mapped[int] = mapped_column(primary_key=True)
+    price: Mapped[Decimal] = mapped_column(Numeric(45, 15), nullable=False)
+    # Размер покупки на ступени; у заполненных ступеней 0
+    size_usd: Mapped[Decimal] = mapped_column(Numeric(20, 2), nullable=False)
+
+
+class UpdateWatermark(Base):
+    __tablename__ = 'update_watermarks'
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # Наибольший update_id, принятый в обработку
+    update_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class Job(Base):
+    __tablename__ = 'jobs'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    kind: Mapped[str] = mapped_column(String(30), nullable=False)
+    # Аргументы обработчика задачи; суммы хранятся строками
+    params: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # queued, running, done или failed
+    status: Mapped[str] = mapped_column(String(10), nullable=False, default='queued', index=True)
+    # Сообщение, в котором показывается ход выполнения и итог
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    message_id: Mapped[int] = mapped_column(nullable=True)
+    # Выполнено, %
+    progress: Mapped[int] = mapped_column(nullable=False, default=0)
+    result: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP, nullable=False)
+    # Обновляется с каждым отчётом о ходе выполнения: по нему находятся брошенные задачи
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP, nullable=False)
@@ -0,0 +1,256 @@
+"""
+Запросы для экранов просмотра: только нужные колонки в именованные кортежи.
+
+В отличие от database.requests здесь не создаются ORM-объекты: нет identity
+map, загрузчиков связей и ленивых загрузок после закрытия сессии. Результат
+неизменяемый и годится только для отображения - для изменений нужны функции
+из database.requests.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, select
+
+from database.models import AlertRule, Sector, Token, Position, PriceSnapshot
+from database.models import Ladder, LadderRung
+from database.connection import async_session
+
+
+class SectorRow(NamedTuple):
+    id: int
+    name: str
+    percentage: Decimal
+
+
+class TokenRow(NamedTuple):
+    id: int
+    symbol: str
+    percentage: Decimal
+
+
+class TokenCard(NamedTuple):
+    id: int
+    symbol: str
+    percentage: Decimal
+    balance_usd: Decimal
+    balance_entry_usd: Decimal
+    sector_id: int
+    sector_name: str
+
+
+class PositionRow(NamedTuple):
+    id: int
+    name: str
+
+
+class PositionCard(NamedTuple):
+    id: int
+    name: str
+    amount: Decimal
+    entry_price: Decimal
+    invested_usd: Decimal
+    bodyfix_price_usd: Decimal
+    total_usd: Decimal
+    current_coinprice_usd: Optional[Decimal]
+    token_id: int
+
+
+class PricePoint(NamedTuple):
+    taken_at: datetime
+    price: Decimal
+
+
+class AlertRuleRow(NamedTuple):
+    id: int
+    kind: str
+    symbol: Optional[str]
+    sector_id: Optional[int]
+    sector_name: Optional[str]
+    threshold: Decimal
+    window_minutes: Optional[int]
+    triggered: bool
+
+
+class LadderRungRow(NamedTuple):
+    rung: int
+    price: Decimal
+    size_usd: Decimal
+
+
+class LadderCard(NamedTuple):
+    token_id: int
+    symbol: str
+    anchor_price: Decimal
+    step_percentage: Decimal
+    filled: int
+    rungs: list[LadderRungRow]
+
+
+class TokenSearchRow(NamedTuple):
+    id: int
+    symbol: str
+    sector_name: str
+    percentage: Decimal
+    balance_usd: Decimal
+    current_coinprice_usd: Optional[Decimal]
+    # Поля позиции; None, если позиции по токену нет
+    position_amount: Optional[Decimal]
+    invested_usd: Optional[Decimal]
+
+
+class SectorSearchRow(NamedTuple):
+    id: int
+    name: str
+    percentage: Decimal
+    tokens_count: int
+
+
+class Transfer(NamedTuple):
+    """Перевод между свободным остатком рабочего капитала и токеном"""
+    token_id: int
+    symbol: str
+    # Положительная сумма - в токен, отрицательная - обратно в рабочий капитал
+    amount_usd: Decimal
+    balance_usd: Decimal
+
+
+async def list_sectors() -> list[SectorRow]:
+    """Все секторы, отсортированные по id"""
+    query = select(Sector.id, Sector.name, Sector.percentage).order_by(Sector.id)
+    async with async_session() as session:
+        result = await session.execute(query)
+        return [SectorRow._make(row) for row in result]
+
+
+async def get_sector_row(sector_id: int) -> Optional[SectorRow]:
+    """Сектор по id или None"""
+    query = select(Sector.id, Sector.name, Sector.percentage).where(Sector.id == sector_id)
+    async with async_session() as session:
+        row = (await session.execute(query)).one_or_none()
+        return SectorRow._make(row) if row else None
+
+
+async def list_sector_tokens(sector_id: int) -> list[TokenRow]:
+    """Токены сектора, отсортированные по id"""
+    query = (select(Token.id, Token.symbol, Token.percentage)
+             .where(Token.sector_id == sector_id)
+             .order_by(Token.id))
+    async with async_session() as session:
+        result = await session.execute(query)
+        return [TokenRow._make(row) for row in result]
+
+
+async def get_token_card(token_id: int) -> Optional[TokenCard]:
+    """Карточка токена с названием сектора или None"""
+    query = (select(Token.id, Token.symbol, Token.percentage, Token.balance_usd,
+                    Token.balance_entry_usd, Token.sector_id, Sector.name)
+             .join(Sector, Token.sector_id == Sector.id)
+             .where(Token.id == token_id))
+    async with async_session() as session:
+        row = (await session.execute(query)).one_or_none()
+        return TokenCard._make(row) if row else None
+
+
+async def list_positions() -> list[PositionRow]:
+    """Все позиции, новые первыми"""
+    query = select(Position.id, Position.name).order_by(Position.id.desc())
+    async with async_session() as session:
+        result = await session.execute(query)
+        return [PositionRow._make(row) for row in result]
+
+
+async def get_position_card(position_id: int) -> Optional[PositionCard]:
+    """Карточка позиции с текущей ценой токена или None"""
+    query = (select(Position.id, Position.name, Position.amount, Position.entry_price,
+                    Position.invested_usd, Position.bodyfix_price_usd, Position.total_usd,
+                    Token.current_coinprice_usd, Position.token_id)
+             .join(Token, Position.token_id == Token.id)
+             .where(Position.id == position_id))
+    async with async_session() as session:
+        row = (await session.execute(query)).one_or_none()
+        return PositionCard._make(row) if row else None
+
+
+async def get_price_history(token_id: int, since: datetime) -> list[PricePoint]:
+    """Снимки цены токена начиная с since, по возрастанию времени"""
+    query = (select(PriceSnapshot.taken_at, PriceSnapshot.price)
+             .where(PriceSnapshot.token_id == token_id, PriceSnapshot.taken_at >= since)
+             .order_by(PriceSnapshot.taken_at))
+    async with async_session() as session:
+        result = await session.execute(query)
+        return [PricePoint._make(row) for row in result]
+
+
+async def get_price_history_version(token_id: int) -> Optional[datetime]:
+    """Время последнего снимка цены токена: меняется с каждым новым снимком"""
+    query = select(func.max(PriceSnapshot.taken_at)).where(PriceSnapshot.token_id == token_id)
+    async with async_session() as session:
+        return await session.scalar(query)
+
+
+def alert_rules_query():
+    return (select(AlertRule.id, AlertRule.kind, AlertRule.symbol, AlertRule.sector_id,
+                   Sector.name, AlertRule.threshold, AlertRule.window_minutes,
+                   AlertRule.triggered)
+            .outerjoin(Sector, AlertRule.sector_id == Sector.id))
+
+
+async def list_alert_rules() -> list[AlertRuleRow]:
+    """Все правила уведомлений, отсортированные по id"""
+    query = alert_rules_query().order_by(AlertRule.id)
+    async with async_session() as session:
+        result = await session.execute(query)
+        return [AlertRuleRow._make(row) for row in result]
+
+
+async def get_alert_rule(rule_id: int) -> Optional[AlertRuleRow]:
+    """Правило уведомлений по id или None"""
+    query = alert_rules_query().where(AlertRule.id == rule_id)
+    async with async_session() as session:
+        row = (await session.execute(query)).one_or_none()
+        return AlertRuleRow._make(row) if row else None
+
+
+async def get_ladder(token_id: int) -> Optional[LadderCard]:
+    """Лестница входа токена со ступенями по порядку или None"""
+    query = (select(Ladder.token_id, Token.symbol, Ladder.anchor_price,
+                    Ladder.step_percentage, Ladder.filled)
+             .join(Token, Ladder.token_id == Token.id)
+             .where(Ladder.token_id == token_id))
+    rungs_query = (select(LadderRung.rung, LadderRung.price, LadderRung.size_usd)
+                   .where(LadderRung.token_id == token_id)
+                   .order_by(LadderRung.rung))
+    async with async_session() as session:
+        row = (await session.execute(query)).one_or_none()
+        if not row:
+            return None
+        rungs = [LadderRungRow._make(rung) for rung in await session.execute(rungs_query)]
+        return LadderCard(*row, rungs=rungs)
+
+
+async def list_search_tokens(token_ids: list[int]) -> list[TokenSearchRow]:
+    """Токены результатов поиска с сектором и позицией одним запросом"""
+    if not token_ids:
+        return []
+    query = (select(Token.id, Token.symbol, Sector.name, Token.percentage, Token.balance_usd,
+                    Token.current_coinprice_usd, Position.amount, Position.invested_usd)
+             .join(Sector, Token.sector_id == Sector.id)
+             .outerjoin(Position, Position.token_id == Token.id)
+             .where(Token.id.in_(token_ids)))
+    async with async_session() as session:
+        result = await session.execute(query)
+        return [TokenSearchRow._make(row) for row in result]
+
+
+async def list_search_sectors(sector_ids: list[int]) -> list[SectorSearchRow]:
+    """Секторы результатов поиска с числом токенов"""
+    if not sector_ids:
+        return []
+    query = (select(Sector.id, Sector.name, Sector.percentage, func.count(Token.id))
+             .outerjoin(Token, Token.sector_id == Sector.id)
+             .where(Sector.id.in_(sector_ids))
+             .group_by(Sector.id))
+    async with async_session() as session:
+        result = await session.execute(query)
+        return [SectorSearchRow._make(row) for row in result]
@@ -1,15 +1,35 @@
+from datetime import timedelta
 from decimal import Decimal
 from turtle import pensize
-from typing import Optional, Union, Any
+from typing import Any, Awaitable, Callable, Collection, Optional, Union
 
 from sqlalchemy.orm import selectinload, joinedload
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc
+from sqlalchemy import case, select, func, desc, update, delete
+from sqlalchemy.dialects.postgresql import insert
 
-from database.models import Deposit, Direction, Sector, Token, Position, Order
+from database.models import Deposit, Direction, Sector, Token, Position, Order, AlertState
+from database.models import AlertRule, PercentageTotal, PriceSnapshot, Ladder, LadderRung
+from database.models import UpdateWatermark
+from database.models import SECTORS_SCOPE, SECTOR_SCOPE_PREFIX, sector_scope
 from database.connection import async_session
-from utils.helpers import round_to_2
-from utils.common import symbols_list, bodyfix_notified_tokens, drawdown_last_prices
+from database.read_models import Transfer
+from database.equity import utc_now
+from utils.helpers import allocate, round_to_2
+from utils.common import drawdown_last_prices, cache_bus
+from utils.instruments import instrument_catalogue
+from utils.order_import import OrderLine
+from utils.search import sector_ref, token_ref
+from utils.render_cache import POSITIONS, SECTORS, TOKENS, version_bumps
+from utils.alert_rules import MAX_RULE_WINDOW_MINUTES, RULE_KINDS, TOKEN_RULE_KINDS
+from utils.alert_rules import WINDOW_RULE_KINDS
+from utils.ladder import LADDER_RUNGS, LADDER_SPACING, LADDER_STEP_PERCENTAGE, VOLATILITY_DAYS
+from utils.ladder import daily_volatility, rung_prices, rung_sizes, step_from_volatility
+
+# Доля баланса токена, доступная для входа в позицию
+ENTRY_BALANCE_SHARE = Decimal("0.10")
+# Токенов в одном пакете DELETE при удалении сектора или токена
+DELETE_CHUNK_SIZE = 500
 
 async def add_deposit(amount_usd: Decimal) -> None:
     """
@@ -41,15 +61,12 @@ async def add_deposit(amount_usd: Decimal) -> None:
                         f", а для добавления депозита должен быть <b>ровно 100%!</b>"
                     )
 
-            # Проверка, что секторы в сумме дают 100%
-            query = select(Sector).options(selectinload(Sector.tokens))
-            result = await session.execute(query)
-            sectors = result.scalars().all()
+            # Проверка по итогам процентов: секторы и токены каждого сектора дают 100%
+            result = await session.execute(select(PercentageTotal.scope, PercentageTotal.total))
+            sector_totals = dict(result.all())
+            total_percentage_sectors = sector_totals.pop(SECTORS_SCOPE, Decimal(0))
 
-            if sectors:
-                query = select(func.sum(Sector.percentage))
-                result = await session.execute(query)
-                total_percentage_sectors = result.scalar_one_or_none() or Decimal(0)
+            if sector_totals:
                 if total_percentage_sectors != Decimal(100):
                     raise ValueError(
                         f"❌ <b>Ошибка!</b>\n\nСуммарный % всех секторов = "
@@ -57,95 +74,55 @@ async def add_deposit(amount_usd: Decimal) -> None:
                         f", а для добавления депозита должен быть <b>ровно 100%!</b>"
                     )
 
-            # Проверка, что токены в каждом секторе в сумме дают 100%
-            for sector in sectors:
-                total_percentage_tokens = sum(
-                    token.percentage for token in sector.tokens
+                incomplete = sorted(
+                    int(scope.removeprefix(SECTOR_SCOPE_PREFIX))
+                    for scope, total in sector_totals.items() if total != Decimal(100)
                 )
-                if total_percentage_tokens != Decimal(100):
+                if incomplete:
+                    sector_name = await session.scalar(
+                        select(Sector.name).where(Sector.id == incomplete[0])
+                    )
+                    total_percentage_tokens = sector_totals[sector_scope(incomplete[0])]
                     raise ValueError(
                         f"❌ <b>Ошибка!</b>\n\nСуммарный % токенов "
-                        f"в секторе <b>{sector.name}</b> = "
+                        f"в секторе <b>{sector_name}</b> = "
                         f"<b>{total_percentage_tokens}%</b>, "
                         f"а должен быть <b>ровно 100%!</b>"
                     )
 
-            # Распределение средств по направлениям
-            total_direction_balance = Decimal("0")
-            for idx, direction in enumerate(portfolio_directions):
-                # Последнее направление получает остаток для избежания ошибок округления
-                if idx == len(portfolio_directions) - 1:
-                    direction_balance = amount_usd - total_direction_balance
-                else:
-                    direction_balance = round_to_2(
-                        amount_usd * (direction.percentage / Decimal(100))
-                    )
-                direction.balance_usd += direction_balance
-                total_direction_balance += direction_balance
-
-                # Распределение внутри рабочего капитала
-                if direction.name == "Рабочий капитал":
-                    # Распределение по секторам
-                    total_sector_balance = Decimal("0")
-                    for i, sector in enumerate(sectors[:-1]):
-                        sector_balance = round_to_2(
-                            direction_balance * (sector.percentage / Decimal(100))
-                        )
-                        sector.balance_usd += sector_balance
-                        total_sector_balance += sector_balance
-
-                        # Распределение по всем токенам кроме последнего
-                        total_token_balance = Decimal("0")
-                        for j, token in enumerate(sector.tokens[:-1]):
-                            token_balance = round_to_2(
-                                sector_balance * (token.percentage / Decimal(100))
-                            )
-                            token.balance_usd += token_balance
-                            token.balance_entry_usd = round_to_2(
-                                token.balance_usd * Decimal("0.10")
-                            )
-                            total_token_balance += token_balance
-
-                        # Последний токен получает остаток для избежания ошибок округления
-                        last_token_balance = sector_balance - total_token_balance
-                        sector.tokens[-1].balance_usd += last_token_balance
-                        sector.tokens[-1].balance_entry_usd = round_to_2(
-                            sector.tokens[-1].balance_usd * Decimal("0.10")
-                        )
-                        # Вычитаем распределённую сумму из сектора
-                        sector.balance_usd -= (total_token_balance + last_token_balance)
-
-                    # Обработка последнего сектора для избежания ошибок округления
-                    if sectors:
-                        last_sector = sectors[-1]
-                        last_sector_balance = direction_balance - total_sector_balance
-                        last_sector.balance_usd += last_sector_balance
-
-                        # Распределение по всем токенам кроме последнего
-                        total_last_token_balance = Decimal("0")
-                        for j, token in enumerate(last_sector.tokens[:-1]):
-                            token_balance = round_to_2(
-                                last_sector_balance * (token.percentage / Decimal(100))
-                            )
-                            token.balance_usd += token_balance
-                            token.balance_entry_usd = round_to_2(
-                                token.balance_usd * Decimal("0.10")
-                            )
-                            total_last_token_balance += token_balance
-
-                        # Последний токен получает остаток для избежания ошибок округления
-                        last_token_balance = (
-                            last_sector_balance - total_last_token_balance
-                        )
-                        last_sector.tokens[-1].balance_usd += last_token_balance
-                        last_sector.tokens[-1].balance_entry_usd = round_to_2(
-                            last_sector.tokens[-1].balance_usd * Decimal("0.10")
-                        )
-                        last_sector.balance_usd -= (
-                            total_last_token_balance + last_token_balance
-                        )
-                    # Вычитание израсходованный рабочий капитал
-                    direction.balance_usd -= direction_balance
+            query = select(Sector).options(selectinload(Sector.tokens))
+            result = await session.execute(query)
+            sectors = result.scalars().all()
+            distribute_deposit(amount_usd, portfolio_directions, sectors)
+            changes = await rebuild_ladders(session) + version_bumps(TOKENS)
+            await cache_bus.publish(changes, session=session)
+
+
+def distribute_deposit(amount_usd: Decimal, directions: list[Direction],
+                       sectors: list[Sector]) -> None:
+    """Распределение суммы депозита по направлениям и по токенам рабочего капитала.
+
+    На каждом уровне последняя доля получает остаток, чтобы не терять центы
+    на округлении.
+
+    Args:
+        amount_usd: Сумма депозита в USD
+        directions: Направления портфеля
+        sectors: Секторы с загруженными токенами
+    """
+    direction_balances = allocate(amount_usd, [direction.percentage for direction in directions])
+    for direction, direction_balance in zip(directions, direction_balances):
+        # Рабочий капитал целиком распределяется по секторам и токенам
+        if direction.name != "Рабочий капитал":
+            direction.balance_usd += direction_balance
+            continue
+
+        sector_balances = allocate(direction_balance, [sector.percentage for sector in sectors])
+        for sector, sector_balance in zip(sectors, sector_balances):
+            token_balances = allocate(sector_balance, [token.percentage for token in sector.tokens])
+            for token, token_balance in zip(sector.tokens, token_balances):
+                token.balance_usd += token_balance
+                token.balance_entry_usd = round_to_2(token.balance_usd * ENTRY_BALANCE_SHARE)
 
 
 async def add_portfolio_directions() -> None:
@@ -219,6 +196,39 @@ async def get_direction_or_info(
     return result.scalar_one_or_none()
 
 
+async def change_percentage_total(session: AsyncSession, scope: str, delta: Decimal) -> bool:
+    """
+    Изменяет итог процентов области (все секторы или токены одного сектора).
+
+    Проверка и изменение выполняются одним UPDATE, строка итога блокируется
+    до конца транзакции, поэтому параллельные правки одной области не могут
+    вместе превысить 100%.
+
+    Args:
+        session: Текущая сессия
+        scope: Область итога (SECTORS_SCOPE или sector_scope(id))
+        delta: Изменение итога, может быть отрицательным
+
+    Returns:
+        False, если итог превысил бы 100%
+    """
+    query = (
+        update(PercentageTotal)
+        .where(PercentageTotal.scope == scope, PercentageTotal.total + delta <= Decimal(100))
+        .values(total=PercentageTotal.total + delta)
+        .returning(PercentageTotal.total)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(query)
+    return result.scalar_one_or_none() is not None
+
+
+async def get_percentage_total(session: AsyncSession, scope: str) -> Decimal:
+    """Текущий итог процентов области"""
+    query = select(PercentageTotal.total).where(PercentageTotal.scope == scope)
+    return await session.scalar(query) or Decimal(0)
+
+
 async def add_sector(sector_name: str, percentage: Decimal) -> None:
     """
     Добавляет новый сектор в портфель с указанным процентом.
@@ -232,15 +242,16 @@ async def add_sector(sector_name: str, percentage: Decimal) -> None:
     """
     async with async_session() as session:
         async with session.begin():
-            query = select(func.sum(Sector.percentage)).where(Sector.name != sector_name)
+            query = select(Sector.id).where(Sector.name == sector_name)
             result = await session.execute(query)
-            not_inclusive_percentage = result.scalar_one_or_none() or Decimal(0)
+            if result.scalar_one_or_none():
+                text = (f'❌ <b>Ошибка!</b>\n\nСектор <b>{sector_name}</b> уже существует.\n\n'
+                        f'<b>❓ Чтобы изменить процент, перейдите в сектор по кнопке из '
+                        f'распределения по секторам.</b>')
+                raise ValueError(text)
 
-            if not_inclusive_percentage + percentage > Decimal(100):
-                query = select(func.sum(Sector.percentage))
-                all_percentage = await session.execute(query)
-                all_percentage = all_percentage.scalar_one_or_none() or Decimal(0)
-                residue = Decimal(100) - all_percentage
+            if not await change_percentage_total(session, SECTORS_SCOPE, percentage):
+                residue = Decimal(100) - await get_percentage_total(session, SECTORS_SCOPE)
                 if residue == Decimal(0):
                     text = (f'❌ <b>Ошибка!</b>\n\n'
                             f'Общая сумма процентов <u>не может превышать 100%</u>\n\n'
@@ -252,16 +263,13 @@ async def add_sector(sector_name: str, percentage: Decimal) -> None:
                             f'Общая сумма процентов <u>не может превышать 100%</u>\n\n'
                             f'Для установки новому сектору доступно: {residue}%')
                     raise ValueError(text)
-            query = select(Sector).where(Sector.name == sector_name)
-            result = await session.execute(query)
-            existing_record = result.scalar_one_or_none()
-            if existing_record:
-                text = (f'❌ <b>Ошибка!</b>\n\nСектор <b>{sector_name}</b> уже существует.\n\n'
-                        f'<b>❓ Чтобы изменить процент, перейдите в сектор по кнопке из '
-                        f'распределения по секторам.</b>')
-                raise ValueError(text)
-            else:
-                session.add(Sector(name=sector_name, percentage=percentage))
+
+            sector = Sector(name=sector_name, percentage=percentage)
+            session.add(sector)
+            await session.flush()
+            session.add(PercentageTotal(scope=sector_scope(sector.id), total=Decimal(0)))
+            changes = [("search", "set", sector_ref(sector.id), sector_name)]
+            await cache_bus.publish(changes + version_bumps(SECTORS), session=session)
 
 
 async def get_all_sectors() -> Optional[list[Sector]]:
@@ -314,7 +322,7 @@ async def get_sector_info(
 async def delete_sector(sector_id: int = None,
                         sector_name: str = None, sector: Sector = None) -> None:
     """
-    Удаляет сектор из базы данных.
+    Удаляет сектор из базы данных вместе с токенами (см. purge_tokens).
 
     Args:
         sector_id (int, optional): ID сектора. По умолчанию None.
@@ -328,36 +336,58 @@ async def delete_sector(sector_id: int = None,
         return None
     async with async_session() as session:
         async with session.begin():
-            query = select(Sector)
-            if sector_id:
+            query = select(Sector.id, Sector.percentage)
+            if sector:
+                query = query.where(Sector.id == sector.id)
+            elif sector_id:
                 query = query.where(Sector.id == sector_id)
             elif sector_name:
                 query = query.where(Sector.name == sector_name)
-            elif sector:
-                await session.delete(sector)
-                return
             result = await session.execute(query)
-            sector = result.scalar_one_or_none()
+            sector = result.one_or_none()
             if not sector:
                 raise ValueError(f'❌ <b>Ошибка!</b>\n\nСектор не найден.')
-            await session.delete(sector)
+
+            query = select(Token.id).where(Token.sector_id == sector.id)
+            token_ids = (await session.execute(query)).scalars().all()
+            await purge_tokens(session, token_ids)
+            result = await session.execute(
+                delete(AlertRule).where(AlertRule.sector_id == sector.id).returning(AlertRule.id)
+            )
+            await cache_bus.publish(
+                [("rules", "remove", rule_id) for rule_id in result.scalars().all()],
+                session=session,
+            )
+
+            await change_percentage_total(session, SECTORS_SCOPE, -sector.percentage)
+            await session.execute(
+                delete(PercentageTotal).where(PercentageTotal.scope == sector_scope(sector.id))
+            )
+            await session.execute(delete(Sector).where(Sector.id == sector.id))
+            changes = [("search", "remove", sector_ref(sector.id))]
+            await cache_bus.publish(changes + version_bumps(SECTORS), session=session)
 
 
-async def change_sector_percentage(percentage: Decimal, 
-                                   sector_id: int = None, sector_name: str = None) -> None:
+async def change_sector_percentage(percentage: Decimal, sector_id: int = None,
+                                   sector_name: str = None,
+                                   preview: bool = False) -> Optional[list[Transfer]]:
     """
-    Изменяет процентное соотношение сектора в портфеле.
+    Изменяет процентное соотношение сектора в портфеле и перераспределяет
+    балансы его токенов через свободный остаток рабочего капитала; нехватка
+    остатка при росте доли покрывается из токенов других секторов.
 
     Args:
         percentage (Decimal): Новое процентное значение
         sector_id (int, optional): ID сектора. По умолчанию None
         sector_name (str, optional): Название сектора. По умолчанию None
+        preview (bool, optional): Только рассчитать переводы, ничего не меняя
 
     Raises:
-        ValueError: Если сектор не найден или общая сумма процентов превышает 100%
+        ValueError: Если сектор не найден, общая сумма процентов превышает 100%
+            или на рост доли не хватает средств
 
     Returns:
-        None
+        Optional[list[Transfer]]: Переводы между рабочим капиталом и токенами
     """
     if not (sector_id or sector_name):
         return None
@@ -373,13 +403,13 @@ async def change_sector_percentage(percentage: Decimal,
             if not sector:
                 raise ValueError('Сектор не найден')
 
-            query = select(func.sum(Sector.percentage)).where(Sector.id != sector.id)
-            result = await session.execute(query)
-            not_inclusive_percentage = result.scalar_one_or_none() or Decimal(0)
-            if not_inclusive_percentage + percentage > Decimal(100):
-                query = select(func.sum(Sector.percentage))
-                all_percentage = await session.execute(query)
-                residue = Decimal(100) - (all_percentage.scalar_one_or_none() or Decimal(0))
+            delta = percentage - sector.percentage
+            if preview:
+                fits = await get_percentage_total(session, SECTORS_SCOPE) + delta <= Decimal(100)
+            else:
+                fits = await change_percentage_total(session, SECTORS_SCOPE, delta)
+            if not fits:
+                residue = Decimal(100) - await get_percentage_total(session, SECTORS_SCOPE)
                 if residue == Decimal(0):
                     text = (f'❌ <b>Ошибка!</b>\n\n'
                             f'Общая сумма процентов <u>не может превышать 100%</u>\n\n'
@@ -391,7 +421,21 @@ async def change_sector_percentage(percentage: Decimal,
                             f'Общая сумма процентов <u>не может превышать 100%</u>\n\n'
                             f'Для установки новому сектору доступно: {residue}%')
                     raise ValueError(text)
-            sector.percentage = percentage
+
+            query = select(Token).where(Token.sector_id == sector.id).order_by(Token.id)
+            tokens = (await session.execute(query)).scalars().all()
+            donors = []
+            if delta > 0:
+                query = select(Token).where(Token.sector_id != sector.id).order_by(Token.id)
+                donors = (await session.execute(query)).scalars().all()
+            pool, transfers = await plan_reallocation(
+                session, tokens, [token.percentage for token in tokens], delta, donors
+            )
+            if not preview:
+                sector.percentage = percentage
+                await apply_reallocation(session, pool, transfers)
+                await cache_bus.publish(version_bumps(SECTORS), session=session)
+            return transfers
 
 
 async def add_token(sector_id: int, symbol: str, percentage: Decimal) -> None:
@@ -408,15 +452,20 @@ async def add_token(sector_id: int, symbol: str, percentage: Decimal) -> None:
     """
     async with async_session() as session:
         async with session.begin():
-            query = select(func.sum(Token.percentage)).where(Token.symbol != symbol,
-                                                             Token.sector_id == sector_id)
+            query = select(Token).where(Token.symbol == symbol).options(selectinload(Token.sector))
             result = await session.execute(query)
-            total_percentage = result.scalar_one_or_none() or Decimal(0)
-            if total_percentage + percentage > Decimal(100):
-                all_percentage = await session.execute(select(func.sum(Token.percentage)).where(
-                    Token.sector_id == sector_id))
-                all_percentage = all_percentage.scalar_one_or_none() or Decimal(0)
-                residue = Decimal(100) - all_percentage
+            token = result.scalar_one_or_none()
+            if token:
+                sector_name = token.sector.name
+                text = (f'❌ <b>Ошибка!</b>\n\nТокен <b>{symbol}</b> уже добавлен в сектор '
+                        f'<b>{sector_name}</b>.\n\n'
+                        f'<b>❓ Чтобы изменить процент, '
+                        f'перейдите в токен по кнопке из его сектора.</b>')
+                raise ValueError(text)
+
+            scope = sector_scope(sector_id)
+            if not await change_percentage_total(session, scope, percentage):
+                residue = Decimal(100) - await get_percentage_total(session, scope)
                 if residue == Decimal(0):
                     text = (f'❌ <b>Ошибка!</b>\n\n'
                             f'Общая сумма процентов <u>не может превышать 100%</u>\n\n'
@@ -429,32 +478,33 @@ async def add_token(sector_id: int, symbol: str, percentage: Decimal) -> None:
                             f'Для установки новому токену доступно: {residue}%')
                     raise ValueError(text)
 
-            query = select(Token).where(Token.symbol == symbol).options(selectinload(Token.sector))
-            result = await session.execute(query)
-            token = result.scalar_one_or_none()
-            if token:
-                sector_name = token.sector.name
-                text = (f'❌ <b>Ошибка!</b>\n\nТокен <b>{symbol}</b> уже добавлен в сектор '
-                        f'<b>{sector_name}</b>.\n\n'
-                        f'<b>❓ Чтобы изменить процент, '
-                        f'перейдите в токен по кнопке из его сектора.</b>')
-                raise ValueError(text)
-            else:
-                session.add(Token(sector_id=sector_id, symbol=symbol, percentage=percentage))
+            token = Token(sector_id=sector_id, symbol=symbol, percentage=percentage)
+            session.add(token)
+            await session.flush()
+            changes = [("search", "set", token_ref(token.id), symbol)]
+            await cache_bus.publish(changes + version_bumps(TOKENS), session=session)
 
 
 async def change_token_percentage(percentage: Decimal, sector_id: int, token_id: int = None,
-                                  symbol: str = None) -> None:
-    """Изменяет процент токена в секторе.
+                                  symbol: str = None,
+                                  preview: bool = False) -> Optional[list[Transfer]]:
+    """Изменяет процент токена в секторе и его баланс через рабочий капитал.
+
+    Нехватка свободного остатка при росте доли покрывается из остальных токенов сектора.
     
     Args:
         percentage: Новый процент токена
         sector_id: ID сектора
         token_id: ID токена (опционально)
         symbol: Символ токена (опционально)
+        preview: Только рассчитать перевод, ничего не меняя
         
     Raises:
-        ValueError: Если токен не найден или сумма процентов превышает 100%
+        ValueError: Если токен не найден, сумма процентов превышает 100%
+            или на рост доли не хватает средств
+
+    Returns:
+        Переводы между рабочим капиталом и токенами (пустой список, если менять нечего)
     """
     if not (token_id or symbol):
         return None
@@ -469,14 +519,14 @@ async def change_token_percentage(percentage: Decimal, sector_id: int, token_id:
             token = result.scalar_one_or_none()
             if not token:
                 raise ValueError('Токен не найден')
-            query = select(func.sum(Token.percentage)).where(Token.symbol != symbol,
-                                                             Token.sector_id == sector_id)
-            result = await session.execute(query)
-            total_percentage = result.scalar() or Decimal(0)
-            if total_percentage + percentage > Decimal(100):
-                all_percentage = await session.execute(select(func.sum(Token.percentage)).where(
-                    Token.sector_id == sector_id))
-                residue = Decimal(100) - all_percentage.scalar()
+            scope = sector_scope(token.sector_id)
+            delta = percentage - token.percentage
+            if preview:
+                fits = await get_percentage_total(session, scope) + delta <= Decimal(100)
+            else:
+                fits = await change_percentage_total(session, scope, delta)
+            if not fits:
+                residue = Decimal(100) - await get_percentage_total(session, scope)
                 if residue == Decimal(0):
                     text = (f'❌ <b>Ошибка!</b>\n\n'
                             f'Общая сумма процентов <u>не может превышать 100%</u>\n\n'
@@ -488,7 +538,107 @@ async def change_token_percentage(percentage: Decimal, sector_id: int, token_id:
                             f'Общая сумма процентов <u>не может превышать 100%</u>\n\n'
                             f'Для установки новому токену доступно: {residue}%')
                     raise ValueError(text)
-            token.percentage = percentage
+
+            sector_percentage = await session.scalar(
+                select(Sector.percentage).where(Sector.id == token.sector_id)
+            )
+            donors = []
+            if delta > 0:
+                query = (select(Token)
+                         .where(Token.sector_id == token.sector_id, Token.id != token.id)
+                         .order_by(Token.id))
+                donors = (await session.execute(query)).scalars().all()
+            pool, transfers = await plan_reallocation(
+                session, [token], [Decimal(100)], sector_percentage * delta / Decimal(100),
+                donors,
+            )
+            if not preview:
+                token.percentage = percentage
+                await apply_reallocation(session, pool, transfers)
+                await cache_bus.publish(version_bumps(TOKENS), session=session)
+            return transfers
+
+
+async def plan_reallocation(session: AsyncSession, tokens: list[Token], weights: list[Decimal],
+                            delta: Decimal,
+                            donors: list[Token] = ()) -> tuple[Direction, list[Transfer]]:
+    """Расчёт переводов после изменения доли в рабочем капитале.
+
+    Переносится только сумма, соответствующая изменению доли: delta процентов
+    от рабочего капитала (свободный остаток плюс балансы всех токенов)
+    делится между токенами изменившегося поддерева по весам. При уменьшении
+    доли переводится не больше баланса токена, деньги уходят в свободный
+    остаток. Рост доли оплачивается сначала из свободного остатка, а его
+    нехватка - из балансов donors пропорционально им: после депозита
+    остаток обычно пуст, всё распределено по токенам. Центы от округления
+    остаются в свободном остатке.
+
+    Args:
+        session: Текущая сессия
+        tokens: Токены изменившегося сектора или один токен
+        weights: Доли токенов в переводе, %
+        delta: Изменение доли в рабочем капитале, %
+        donors: Токены, уменьшаемые при нехватке свободного остатка
+
+    Raises:
+        ValueError: Если остатка и балансов donors не хватает на рост доли
+
+    Returns:
+        Направление "Рабочий капитал" (заблокировано до конца транзакции) и переводы
+    """
+    query = select(Direction).where(Direction.name == "Рабочий капитал").with_for_update()
+    pool = (await session.execute(query)).scalar_one()
+    pool_balance = pool.balance_usd or Decimal(0)
+    tokens_balance = await session.scalar(select(func.sum(Token.balance_usd))) or Decimal(0)
+
+    amount_usd = round_to_2((pool_balance + tokens_balance) * delta / Decimal(100))
+    transfers = []
+    if amount_usd > pool_balance:
+        shortfall = amount_usd - max(pool_balance, Decimal(0))
+        donors = [donor for donor in donors if (donor.balance_usd or Decimal(0)) > 0]
+        donors_balance = sum((donor.balance_usd for donor in donors), Decimal(0))
+        if shortfall > donors_balance:
+            raise ValueError(
+                f'❌ <b>Ошибка!</b>\n\nНе хватает средств для увеличения доли: '
+                f'нужно <b>{amount_usd}$</b>, в свободном остатке Рабочего Капитала '
+                f'<b>{pool_balance}$</b>, на балансах остальных токенов <b>{donors_balance}$</b>.'
+            )
+        parts = allocate(shortfall, [donor.balance_usd / donors_balance * Decimal(100)
+                                     for donor in donors])
+        donated = Decimal(0)
+        for donor, part in zip(donors, parts):
+            part = min(part, donor.balance_usd)
+            if part:
+                donated += part
+                transfers.append(Transfer(donor.id, donor.symbol, -part, donor.balance_usd - part))
+        amount_usd = max(pool_balance, Decimal(0)) + donated
+
+    for token, weight in zip(tokens, weights):
+        balance = token.balance_usd or Decimal(0)
+        token_amount = max(round_to_2(amount_usd * weight / Decimal(100)), -balance)
+        if token_amount:
+            transfers.append(Transfer(token.id, token.symbol, token_amount, balance + token_amount))
+    return pool, transfers
+
+
+async def apply_reallocation(session: AsyncSession, pool: Direction,
+                             transfers: list[Transfer]) -> None:
+    """Проведение переводов из plan_reallocation одним пакетным UPDATE"""
+    if not transfers:
+        return
+    await session.execute(update(Token), [
+        {
+            "id": transfer.token_id,
+            "balance_usd": transfer.balance_usd,
+            "balance_entry_usd": round_to_2(transfer.balance_usd * ENTRY_BALANCE_SHARE),
+        }
+        for transfer in transfers
+    ])
+    pool.balance_usd = (pool.balance_usd or Decimal(0)) - sum(
+        transfer.amount_usd for transfer in transfers
+    )
+    changes = await rebuild_ladders(session, [transfer.token_id for transfer in transfers])
+    await cache_bus.publish(changes + version_bumps(TOKENS), session=session)
 
 
 async def get_token_or_info(
@@ -539,7 +689,7 @@ async def get_token_or_info(
 
 
 async def delete_token(token_id: int = None, symbol: str = None, token: Token = None) -> None:
-    """Удаляет токен из базы данных.
+    """Удаляет токен из базы данных вместе с ордерами и позицией (см. purge_tokens).
     
     Args:
         token_id: ID токена для удаления
@@ -553,19 +703,101 @@ async def delete_token(token_id: int = None, symbol: str = None, token: Token =
         return None
     async with async_session() as session:
         async with session.begin():
-            query = select(Token)
-            if token_id:
+            query = select(Token.id, Token.sector_id, Token.percentage)
+            if token:
+                query = query.where(Token.id == token.id)
+            elif token_id:
                 query = query.where(Token.id == token_id)
             elif symbol:
                 query = query.where(Token.symbol == symbol)
-            elif token:
-                await session.delete(token)
-                return
             result = await session.execute(query)
-            token = result.scalar_one_or_none()
+            token = result.one_or_none()
             if not token:
                 raise ValueError(f'❌ <b>Ошибка!</b>\n\nТокен не найден.')
-            await session.delete(token)
+            await change_percentage_total(session, sector_scope(token.sector_id), -token.percentage)
+            await purge_tokens(session, [token.id])
+
+
+async def purge_tokens(session: AsyncSession, token_ids: list[int]) -> None:
+    """Удаление токенов с ордерами, позициями, лестницами, историей цен, правилами
+    и состоянием уведомлений.
+
+    Удаление идёт пакетными DELETE по DELETE_CHUNK_SIZE токенов, без загрузки
+    ORM-объектов. Неизрасходованные балансы токенов возвращаются в
+    Ликвидность тем же пакетом запросов. Символы удалённых позиций и
+    уведомлений снимаются с отслеживания, а токены - с поиска во всех
+    процессах одной публикацией после коммита.
+
+    Args:
+        session: Текущая сессия
+        token_ids: ID удаляемых токенов
+    """
+    position_symbols, alert_symbols, rule_ids, ladder_symbols = [], [], [], []
+    deleted_ids = []
+    for start in range(0, len(token_ids), DELETE_CHUNK_SIZE):
+        chunk = token_ids[start:start + DELETE_CHUNK_SIZE]
+        reclaimed = (select(func.coalesce(func.sum(Token.balance_usd), 0))
+                     .where(Token.id.in_(chunk))
+                     .scalar_subquery())
+        await session.execute(
+            update(Direction)
+            .where(Direction.name == "Ликвидность")
+            .values(balance_usd=func.coalesce(Direction.balance_usd, 0) + reclaimed)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            delete(Order).where(Order.token_id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(
+            delete(Position).where(Position.token_id.in_(chunk)).returning(Position.name)
+            .execution_options(synchronize_session=False)
+        )
+        position_symbols += result.scalars().all()
+        await session.execute(
+            delete(PriceSnapshot).where(PriceSnapshot.token_id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            delete(LadderRung).where(LadderRung.token_id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(
+            delete(Ladder).where(Ladder.token_id.in_(chunk)).returning(Ladder.token_id)
+            .execution_options(synchronize_session=False)
+        )
+        ladder_ids = set(result.scalars().all())
+        result = await session.execute(
+            delete(Token).where(Token.id.in_(chunk)).returning(Token.id, Token.symbol)
+            .execution_options(synchronize_session=False)
+        )
+        token_symbols = []
+        for token_id, symbol in result:
+            deleted_ids.append(token_id)
+            token_symbols.append(symbol)
+            if token_id in ladder_ids:
+                ladder_symbols.append(symbol)
+        result = await session.execute(
+            delete(AlertState).where(AlertState.symbol.in_(token_symbols))
+            .returning(AlertState.symbol)
+            .execution_options(synchronize_session=False)
+        )
+        alert_symbols += result.scalars().all()
+        result = await session.execute(
+            delete(AlertRule).where(AlertRule.symbol.in_(token_symbols))
+            .returning(AlertRule.id)
+            .execution_options(synchronize_session=False)
+        )
+        rule_ids += result.scalars().all()
+
+    changes = [("symbols", "remove", symbol) for symbol in position_symbols]
+    changes += [("rules", "remove", rule_id) for rule_id in rule_ids]
+    changes += [("ladders", "remove", symbol) for symbol in ladder_symbols]
+    changes += [("search", "remove", token_ref(token_id)) for token_id in deleted_ids]
+    changes += version_bumps(TOKENS, POSITIONS)
+    for symbol in alert_symbols:
+        changes += [("bodyfix", "remove", symbol), ("drawdown", "remove", symbol)]
+    await cache_bus.publish(changes, session=session)
 
 
 async def get_all_sector_tokens(sector_id: int = None,
@@ -608,83 +840,104 @@ async def buy_order(token_id: int, amount: Decimal, entry_price: Decimal) -> Non
             token = await get_token_or_info(
                 token_id=token_id, current_session=session
                 )
-            position = token.position if token.position else None
-            token_symbol = token.symbol
-
             liquidity = await get_direction_or_info(
                 direction_name="Ликвидность", current_session=session
                 )
+            changes, alert_state = await apply_buy(session, token, liquidity, amount, entry_price)
+            await save_alert_state(session, token.symbol, **alert_state)
+            changes += await rebuild_ladders(session, [token.id])
+            changes += version_bumps(TOKENS, POSITIONS)
+            await cache_bus.publish(changes, session=session)
 
-            invested_usd = amount * entry_price
-            token_balance_entry_usd = token.balance_entry_usd
-            allowed_liquidity_balance = liquidity.balance_usd * Decimal("0.02")
 
-            if position or token_balance_entry_usd < Decimal("5"):
-                allowed_balance = token_balance_entry_usd + allowed_liquidity_balance
-            else:
-                allowed_balance = token_balance_entry_usd
-
-            if invested_usd > allowed_balance:
-                text = (
-                    "❌ <b>Ошибка! Ордер не был добавлен.</b>\n\n"
-                    "Вы превысили максимально возможную сумму $ для покупки!\n\n"
-                )
-                raise ValueError(text)
-
-            token_used = min(token_balance_entry_usd, invested_usd)
-            liquidity_used = max(Decimal(0), invested_usd - token_balance_entry_usd)
-            if liquidity_used > 0:
-                liquidity.balance_usd -= liquidity_used
-            token.balance_usd -= token_used
-
-            order = Order(token_id=token_id, amount=amount, entry_price=entry_price)
-            session.add(order)
-            await session.flush()
-            order.name = f"{order.type} #{order.id} — {token_symbol}"
-
-            if position:
-                position.amount += amount
-                position.invested_usd += invested_usd
-                position.entry_price = position.invested_usd / position.amount
-                position.bodyfix_price_usd = position.entry_price * Decimal(2)
-                if token_symbol in bodyfix_notified_tokens:
-                    bodyfix_notified_tokens.remove(token_symbol)
-                # Обновляем цену входа в словаре отслеживания просадки
-                if token_symbol in drawdown_last_prices:
-                    drawdown_last_prices[token_symbol] = position.entry_price
-            else:
-                await add_position(token_id=token_id, amount=amount, entry_price=entry_price)
-                # Добавляем цену входа в словарь отслеживания просадки
-                drawdown_last_prices[token_symbol] = entry_price
+async def apply_buy(session: AsyncSession, token: Token, liquidity: Direction,
+                    amount: Decimal, entry_price: Decimal,
+                    drawdown_symbols: Collection[str] = drawdown_last_prices,
+                    ) -> tuple[list[tuple], dict]:
+    """Проводит покупку в текущей сессии: проверка баланса, ордер, позиция и лестница.
 
+    Балансы токена и ликвидности меняются на загруженных объектах, поэтому
+    следующие покупки в той же сессии проверяются уже с учётом этой. Каждая
+    покупка заполняет очередную ступень лестницы входа; первая покупка без
+    лестницы ставит её первую ступень на цену входа. Ступени пересчитывает
+    вызывающий код через rebuild_ladders после всех покупок.
 
-async def add_position(token_id: int, amount: Decimal, entry_price: Decimal) -> None:
-    """Создает новую позицию по токену.
-    
     Args:
-        token_id: ID токена
+        session: Текущая сессия
+        token: Токен с загруженной позицией
+        liquidity: Направление "Ликвидность"
         amount: Количество токенов
         entry_price: Цена входа
+        drawdown_symbols: Символы, для которых отслеживается просадка
+
+    Raises:
+        ValueError: Если превышен доступный баланс
+
+    Returns:
+        Изменения общих кэшей и новое состояние уведомлений по токену
     """
-    async with async_session() as session:
-        async with session.begin():
-            invested_usd = Decimal(amount * entry_price)
-            bodyfix_price_usd = Decimal(entry_price * 2)
-            token = await get_token_or_info(token_id=token_id)
-            token_symbol = token.symbol
-            position = Position(
-                name=token_symbol,
-                token_id=token_id,
-                amount=amount,
-                entry_price=entry_price,
-                invested_usd=invested_usd,
-                bodyfix_price_usd=bodyfix_price_usd,
-            )
-            if token_symbol not in symbols_list:
-                symbols_list.append(token_symbol)
-            # Добавляем цену входа в словарь отслеживания просадки
-            drawdown_last_prices[token_symbol] = entry_price
-            session.add(position)
+    position = token.position
+    token_symbol = token.symbol
+
+    invested_usd = amount * entry_price
+    token_balance_entry_usd = token.balance_entry_usd
+    allowed_liquidity_balance = liquidity.balance_usd * Decimal("0.02")
+
+    if position or token_balance_entry_usd < Decimal("5"):
+        allowed_balance = token_balance_entry_usd + allowed_liquidity_balance
+    else:
+        allowed_balance = token_balance_entry_usd
+
+    if invested_usd > allowed_balance:
+        text = (
+            "❌ <b>Ошибка! Ордер не был добавлен.</b>\n\n"
+            "Вы превысили максимально возможную сумму $ для покупки!\n\n"
+        )
+        raise ValueError(text)
+
+    token_used = min(token_balance_entry_usd, invested_usd)
+    liquidity_used = max(Decimal(0), invested_usd - token_balance_entry_usd)
+    if liquidity_used > 0:
+        liquidity.balance_usd -= liquidity_used
+    token.balance_usd -= token_used
+
+    session.add(Order(token_id=token.id, amount=amount, entry_price=entry_price))
+    result = await session.execute(
+        update(Ladder).where(Ladder.token_id == token.id)
+        .values(filled=Ladder.filled + 1).returning(Ladder.token_id)
+        .execution_options(synchronize_session=False)
+    )
+    if result.scalar_one_or_none() is None:
+        # Первая ступень и есть эта покупка: уведомление нужно со второй
+        session.add(Ladder(token_id=token.id, anchor_price=entry_price,
+                           step_percentage=await ladder_step(session, token.id),
+                           filled=1, alerted=0))
+
+    if position:
+        position.amount += amount
+        position.invested_usd += invested_usd
+        position.entry_price = position.invested_usd / position.amount
+        position.bodyfix_price_usd = position.entry_price * Decimal(2)
+        changes = [("bodyfix", "remove", token_symbol)]
+        alert_state = {"bodyfix_notified": False}
+        # Обновляем цену входа в словаре отслеживания просадки
+        if token_symbol in drawdown_symbols:
+            changes.append(("drawdown", "set", token_symbol, position.entry_price))
+            alert_state["drawdown_last_price"] = position.entry_price
+        return changes, alert_state
+
+    token.position = Position(
+        name=token_symbol,
+        token_id=token.id,
+        amount=amount,
+        entry_price=entry_price,
+        invested_usd=invested_usd,
+        bodyfix_price_usd=entry_price * 2,
+    )
+    session.add(token.position)
+    # Добавляем токен в отслеживание и цену входа в словарь отслеживания просадки
+    changes = [("symbols", "add", token_symbol), ("drawdown", "set", token_symbol, entry_price)]
+    return changes, {"drawdown_last_price": entry_price}
 
 
 async def sell_order(token_id: int, amount: Decimal) -> None:
@@ -702,27 +955,245 @@ async def sell_order(token_id: int, amount: Decimal) -> None:
             query = select(Token).options(joinedload(Token.position)).where(Token.id == token_id)
             result = await session.execute(query)
             token = result.scalar_one_or_none()
-            if not token.position:
-                text = f'❌ <b>Ошибка!</b> Позиция для токена {token.symbol} не найдена.'
-                raise ValueError(text)
-            token_symbol = token.symbol
-            position = token.position
-            if amount > position.amount:
-                text = (f'❌ <b>Ошибка! Ордер не был добавлен.</b>\n\n'
-                        f'Вы превысили максимально возможную сумму для продажи!\n\n'
-                        f'⚖️<b>Для продажи токена "{token_symbol}" доступно: '
-                        f'{position.amount} токенов</b>')
-                raise ValueError(text)
-            order = Order(token_id=token_id, amount=amount, entry_price=Decimal(0), type='sell')
-            session.add(order)
-            new_amount = position.amount - amount
-            if new_amount == Decimal(0):
-                await session.delete(position)
-                if token_symbol in symbols_list:
-                    symbols_list.remove(token_symbol)
-            else:
-                position.amount = new_amount
-                position.invested_usd -= amount * position.entry_price
+            changes = await apply_sell(session, token, amount)
+            await cache_bus.publish(changes + version_bumps(POSITIONS), session=session)
+
+
+async def apply_sell(session: AsyncSession, token: Token, amount: Decimal) -> list[tuple]:
+    """Проводит продажу в текущей сессии: ордер и уменьшение или закрытие позиции.
+
+    Args:
+        session: Текущая сессия
+        token: Токен с загруженной позицией
+        amount: Количество токенов для продажи
+
+    Raises:
+        ValueError: Если позиция не найдена или недостаточно токенов
+
+    Returns:
+        Изменения общих кэшей
+    """
+    if not token.position:
+        text = f'❌ <b>Ошибка!</b> Позиция для токена {token.symbol} не найдена.'
+        raise ValueError(text)
+    token_symbol = token.symbol
+    position = token.position
+    if amount > position.amount:
+        text = (f'❌ <b>Ошибка! Ордер не был добавлен.</b>\n\n'
+                f'Вы превысили максимально возможную сумму для продажи!\n\n'
+                f'⚖️<b>Для продажи токена "{token_symbol}" доступно: '
+                f'{position.amount} токенов</b>')
+        raise ValueError(text)
+    session.add(Order(token_id=token.id, amount=amount, entry_price=Decimal(0), type='sell'))
+    new_amount = position.amount - amount
+    if new_amount == Decimal(0):
+        await session.delete(position)
+        # Удаление до возможной новой позиции по этому токену в той же сессии
+        await session.flush()
+        token.position = None
+        for model in (LadderRung, Ladder):
+            await session.execute(
+                delete(model).where(model.token_id == token.id)
+                .execution_options(synchronize_session=False)
+            )
+        return [("symbols", "remove", token_symbol), ("ladders", "remove", token_symbol)]
+    position.amount = new_amount
+    position.invested_usd -= amount * position.entry_price
+    return []
+
+
+async def bulk_orders(
+        orders: list[OrderLine],
+        progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+) -> list[tuple[int, str]]:
+    """Проводит пакет ордеров одной транзакцией.
+
+    Токены всех строк загружаются одним запросом, каждая строка проверяется
+    по балансам с учётом предыдущих строк. Если хоть одна строка ошибочна,
+    транзакция откатывается и ничего не сохраняется.
+
+    Args:
+        orders: Разобранные строки ордеров
+        progress: Вызывается после каждой строки с числом проведённых и всех строк
+
+    Returns:
+        Ошибки вида (номер строки, текст); пустой список, если пакет сохранён
+    """
+    errors = []
+    async with async_session() as session:
+        async with session.begin():
+            tokens = await get_token_or_info(
+                symbols=list({order.symbol for order in orders}), current_session=session
+            )
+            tokens = {token.symbol: token for token in tokens}
+            liquidity = await get_direction_or_info(
+                direction_name="Ликвидность", current_session=session
+            )
+            changes, alert_states = [], {}
+            # Просадка по новым позициям пакета начинает отслеживаться ещё до коммита
+            drawdown_symbols = set(drawdown_last_prices)
+            for done, order in enumerate(orders):
+                if progress:
+                    await progress(done, len(orders))
+                token = tokens.get(order.symbol)
+                if not token:
+                    errors.append((order.line_no, f'Токен {order.symbol} не добавлен в сектор'))
+                    continue
+                try:
+                    if order.side == "buy":
+                        line_changes, alert_state = await apply_buy(
+                            session, token, liquidity, order.amount, order.price,
+                            drawdown_symbols,
+                        )
+                        alert_states.setdefault(order.symbol, {}).update(alert_state)
+                        if "drawdown_last_price" in alert_state:
+                            drawdown_symbols.add(order.symbol)
+                    else:
+                        line_changes = await apply_sell(session, token, order.amount)
+                except ValueError as e:
+                    errors.append((order.line_no, str(e)))
+                    continue
+                changes += line_changes
+            if errors:
+                await session.rollback()
+                return errors
+
+            for symbol, alert_state in alert_states.items():
+                await save_alert_state(session, symbol, **alert_state)
+            bought_ids = [tokens[symbol].id for symbol in alert_states]
+            changes += await rebuild_ladders(session, bought_ids)
+            changes += version_bumps(TOKENS, POSITIONS)
+            await cache_bus.publish(changes, session=session)
+    return errors
+
+
+
+async def ladder_step(session: AsyncSession, token_id: int) -> Decimal:
+    """Шаг новой лестницы, %: фиксированный или от волатильности по снимкам цены токена"""
+    if LADDER_SPACING != "volatility":
+        return LADDER_STEP_PERCENTAGE
+    query = (select(PriceSnapshot.taken_at, PriceSnapshot.price)
+             .where(PriceSnapshot.token_id == token_id,
+                    PriceSnapshot.taken_at >= utc_now() - timedelta(days=VOLATILITY_DAYS))
+             .order_by(PriceSnapshot.taken_at))
+    rows = (await session.execute(query)).all()
+    return step_from_volatility(daily_volatility([row.taken_at for row in rows],
+                                                 [row.price for row in rows]))
+
+
+async def rebuild_ladders(session: AsyncSession,
+                          token_ids: Optional[Collection[int]] = None) -> list[tuple]:
+    """Пересчёт ступеней лестниц пакетом: один DELETE и один INSERT на все лестницы.
+
+    Цены ступеней зависят только от цены первой ступени и шага, размеры - от
+    текущего баланса токена и числа заполненных ступеней, поэтому пересчёт
+    нужен после покупок, депозита и изменения долей.
+
+    Args:
+        session: Текущая сессия
+        token_ids: ID токенов; None - все лестницы
+
+    Returns:
+        Изменения кэша "ladders": цена следующей ступени для уведомления
+        или снятие токена с отслеживания
+    """
+    query = (select(Ladder.token_id, Ladder.anchor_price, Ladder.step_percentage,
+                    Ladder.filled, Ladder.alerted, Token.symbol, Token.balance_usd)
+             .join(Token, Token.id == Ladder.token_id))
+    rungs_query = delete(LadderRung)
+    if token_ids is not None:
+        if not token_ids:
+            return []
+        query = query.where(Ladder.token_id.in_(token_ids))
+        rungs_query = rungs_query.where(LadderRung.token_id.in_(token_ids))
+    ladders = (await session.execute(query)).all()
+    await session.execute(rungs_query.execution_options(synchronize_session=False))
+
+    rungs, changes = [], []
+    for ladder in ladders:
+        prices = rung_prices(ladder.anchor_price, ladder.step_percentage)
+        sizes = rung_sizes(ladder.balance_usd or Decimal(0), ladder.filled)
+        rungs += [
+            {"token_id": ladder.token_id, "rung": rung, "price": price, "size_usd": size}
+            for rung, (price, size) in enumerate(zip(prices, sizes))
+        ]
+        if ladder.alerted < ladder.filled < LADDER_RUNGS:
+            changes.append(("ladders", "set", ladder.symbol, prices[ladder.filled]))
+        else:
+            changes.append(("ladders", "remove", ladder.symbol))
+    if rungs:
+        await session.execute(insert(LadderRung), rungs)
+    return changes
+
+
+async def build_ladder(token_id: int, anchor_price: Decimal) -> None:
+    """Построение или перестроение лестницы входа открытой позиции от новой первой ступени.
+
+    Заполненные ступени сохраняются; если лестницы ещё не было, ими считаются
+    покупки токена. Шаг пересчитывается по текущим настройкам.
+
+    Raises:
+        ValueError: Если цена некорректна или по токену нет открытой позиции
+    """
+    if anchor_price <= 0:
+        raise ValueError('❌ <b>Ошибка!</b>\n\nЦена должна быть больше нуля.')
+    async with async_session() as session:
+        async with session.begin():
+            token = await get_token_or_info(token_id=token_id, current_session=session)
+            if not token or not token.position:
+                raise ValueError('❌ <b>Ошибка!</b>\n\nЛестница строится только '
+                                 'для открытой позиции.')
+            filled = await session.scalar(select(Ladder.filled).where(Ladder.token_id == token_id))
+            if filled is None:
+                filled = min(await session.scalar(
+                    select(func.count()).select_from(Order)
+                    .where(Order.token_id == token_id, Order.type != 'sell')
+                ), LADDER_RUNGS)
+            await session.merge(Ladder(
+                token_id=token_id, anchor_price=anchor_price,
+                step_percentage=await ladder_step(session, token_id),
+                filled=filled, alerted=filled - 1,
+            ))
+            changes = await rebuild_ladders(session, [token_id])
+            await cache_bus.publish(changes, session=session)
+
+
+async def save_ladder_alerts(symbols: list[str]) -> dict[str, tuple[int, Decimal, Decimal]]:
+    """Отметка уведомлений о достижении следующей ступени и снятие их с отслеживания.
+
+    Args:
+        symbols: Токены, цена которых дошла до следующей ступени
+
+    Returns:
+        {symbol: (номер ступени, цена ступени, размер покупки в $)} по токенам,
+        уведомление по которым ещё не было отмечено
+    """
+    if not symbols:
+        return {}
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                update(Ladder)
+                .where(Ladder.token_id == Token.id, Token.symbol.in_(symbols),
+                       Ladder.alerted < Ladder.filled, Ladder.filled < LADDER_RUNGS)
+                .values(alerted=Ladder.filled)
+                .returning(Ladder.token_id)
+                .execution_options(synchronize_session=False)
+            )
+            alerted = result.scalars().all()
+            rungs = {}
+            if alerted:
+                # Следующая ступень - с номером, равным числу заполненных
+                query = (select(Token.symbol, LadderRung.rung, LadderRung.price,
+                                LadderRung.size_usd)
+                         .join(Token, Token.id == LadderRung.token_id)
+                         .join(Ladder, Ladder.token_id == LadderRung.token_id)
+                         .where(LadderRung.token_id.in_(alerted),
+                                LadderRung.rung == Ladder.filled))
+                rungs = {row.symbol: tuple(row[1:]) for row in await session.execute(query)}
+            await cache_bus.publish([("ladders", "remove", symbol) for symbol in symbols],
+                                    session=session)
+            return rungs
 
 
 async def get_all_positions() -> Optional[list[Position]]:
@@ -838,3 +1309,195 @@ async def update_tokens_prices(prices: dict[str, Decimal]) -> None:
                     token.current_coinprice_usd = price
                     if token.position:
                         token.position.total_usd = token.position.amount * price
+
+
+async def save_alert_state(session: AsyncSession, symbol: str, **values) -> None:
+    """Сохранение состояния уведомлений по токену в рамках транзакции вызывающего.
+
+    Args:
+        session: Сессия с открытой транзакцией
+        symbol: Символ токена
+        values: Поля AlertState (bodyfix_notified, drawdown_last_price)
+    """
+    query = (insert(AlertState)
+             .values(symbol=symbol, **values)
+             .on_conflict_do_update(index_elements=[AlertState.symbol], set_=values))
+    await session.execute(query)
+
+
+async def save_alert_notifications(bodyfix_symbols: list[str],
+                                   drawdown_prices: dict[str, Decimal]) -> None:
+    """Сохранение отправленных парсером уведомлений и рассылка изменений кэшей.
+
+    Args:
+        bodyfix_symbols: Токены, по которым отправлено уведомление о фиксации тела
+        drawdown_prices: Цены уведомлений о просадке {symbol: price}
+    """
+    if not (bodyfix_symbols or drawdown_prices):
+        return
+    async with async_session() as session:
+        async with session.begin():
+            changes = []
+            for symbol in bodyfix_symbols:
+                await save_alert_state(session, symbol, bodyfix_notified=True)
+                changes.append(("bodyfix", "add", symbol))
+            for symbol, price in drawdown_prices.items():
+                await save_alert_state(session, symbol, drawdown_last_price=price)
+                changes.append(("drawdown", "set", symbol, price))
+            await cache_bus.publish(changes, session=session)
+
+
+async def add_alert_rule(kind: str, threshold: Decimal, symbol: str = None,
+                         sector_id: int = None, window_minutes: int = None) -> int:
+    """Добавление правила уведомлений.
+
+    Args:
+        kind: Вид правила из RULE_KINDS
+        threshold: Цена в $ или процент; у изменения за период знак задаёт направление
+        symbol: Токен для правил по токену
+        sector_id: ID сектора для изменения цен сектора
+        window_minutes: Период изменения в минутах
+
+    Returns:
+        ID нового правила
+
+    Raises:
+        ValueError: Если токен или сектор не найдены или параметры правила некорректны
+    """
+    if kind not in RULE_KINDS:
+        raise ValueError('❌ <b>Ошибка!</b>\n\nНеизвестный вид правила.')
+    if kind in WINDOW_RULE_KINDS:
+        if not window_minutes or not 1 <= window_minutes <= MAX_RULE_WINDOW_MINUTES:
+            raise ValueError(f'❌ <b>Ошибка!</b>\n\nПериод должен быть '
+                             f'от 1 до {MAX_RULE_WINDOW_MINUTES} минут.')
+        if threshold == 0:
+            raise ValueError('❌ <b>Ошибка!</b>\n\nИзменение не может быть равно нулю.')
+    elif threshold <= 0:
+        raise ValueError('❌ <b>Ошибка!</b>\n\nЗначение должно быть больше нуля.')
+
+    async with async_session() as session:
+        async with session.begin():
+            if kind in TOKEN_RULE_KINDS:
+                query = select(Token.id).where(Token.symbol == symbol)
+                if not (await session.execute(query)).scalar_one_or_none():
+                    raise ValueError(f'❌ <b>Ошибка!</b>\n\nТокен <b>{symbol}</b> '
+                                     f'не найден в стратегии.')
+                sector_id = None
+            else:
+                query = select(Sector.id).where(Sector.id == sector_id)
+                if not (await session.execute(query)).scalar_one_or_none():
+                    raise ValueError('❌ <b>Ошибка!</b>\n\nСектор не найден.')
+                symbol = None
+            rule = AlertRule(kind=kind, symbol=symbol, sector_id=sector_id, threshold=threshold,
+                             window_minutes=window_minutes if kind in WINDOW_RULE_KINDS else None)
+            session.add(rule)
+            await session.flush()
+            await cache_bus.publish([("rules", "add", rule.id)], session=session)
+            return rule.id
+
+
+async def delete_alert_rule(rule_id: int) -> None:
+    """Удаление правила уведомлений.
+
+    Raises:
+        ValueError: Если правило не найдено
+    """
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(
+                delete(AlertRule).where(AlertRule.id == rule_id).returning(AlertRule.id)
+            )
+            if result.scalar_one_or_none() is None:
+                raise ValueError('❌ <b>Ошибка!</b>\n\nПравило не найдено.')
+            await cache_bus.publish([("rules", "remove", rule_id)], session=session)
+
+
+async def save_alert_rule_states(triggered: list[int], rearmed: list[int]) -> None:
+    """Сохранение сработавших и сброшенных на тике правил двумя UPDATE.
+
+    Args:
+        triggered: ID сработавших правил
+        rearmed: ID правил, условие которых перестало выполняться
+    """
+    if not (triggered or rearmed):
+        return
+    async with async_session() as session:
+        async with session.begin():
+            for rule_ids, value in ((triggered, True), (rearmed, False)):
+                if rule_ids:
+                    await session.execute(
+                        update(AlertRule).where(AlertRule.id.in_(rule_ids))
+                        .values(triggered=value)
+                        .execution_options(synchronize_session=False)
+                    )
+
+
+
+async def get_update_watermark(bot_id: int) -> int:
+    """Наибольший принятый в обработку update_id бота или 0"""
+    async with async_session() as session:
+        query = select(UpdateWatermark.update_id).where(UpdateWatermark.bot_id == bot_id)
+        return await session.scalar(query) or 0
+
+
+async def save_update_watermark(bot_id: int, update_id: int, window: int) -> None:
+    """
+    Сохранение наибольшего принятого update_id.
+
+    Отметка только растёт, кроме номера ниже неё больше чем на window - это
+    новая последовательность Telegram, она заменяет отметку.
+    """
+    query = insert(UpdateWatermark).values(bot_id=bot_id, update_id=update_id)
+    query = query.on_conflict_do_update(
+        index_elements=[UpdateWatermark.bot_id],
+        set_={"update_id": case(
+            (query.excluded.update_id < UpdateWatermark.update_id - window,
+             query.excluded.update_id),
+            else_=func.greatest(UpdateWatermark.update_id, query.excluded.update_id),
+        )},
+    )
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(query)
+
+
+@cache_bus.state_loader
+async def load_cache_state() -> dict:
+    """Полное состояние общих кэшей из БД для CacheBus.
+
+    Returns:
+        Словарь {имя кэша: данные}: отслеживаемые токены открытых позиций
+        (только торгуемые на Bybit), уведомленные о фиксации тела токены,
+        цены последних уведомлений о просадке, ID правил уведомлений и цены
+        следующих ступеней лестниц, уведомление о которых ещё не отправлено,
+        названия токенов и секторов для поиска
+    """
+    async with async_session() as session:
+        query = select(Token.symbol).join(Position, Position.token_id == Token.id)
+        symbols = (await session.scalars(query)).all()
+        alert_states = (await session.scalars(select(AlertState))).all()
+        rule_ids = (await session.scalars(select(AlertRule.id))).all()
+        query = (select(Token.symbol, LadderRung.price)
+                 .join(Ladder, Ladder.token_id == Token.id)
+                 .join(LadderRung, (LadderRung.token_id == Ladder.token_id)
+                       & (LadderRung.rung == Ladder.filled))
+                 .where(Ladder.alerted < Ladder.filled))
+        ladder_triggers = dict((await session.execute(query)).all())
+        search_names = {token_ref(token_id): symbol for token_id, symbol
+                        in await session.execute(select(Token.id, Token.symbol))}
+        search_names.update({sector_ref(sector_id): name for sector_id, name
+                             in await session.execute(select(Sector.id, Sector.name))})
+    return {
+        "rules": set(rule_ids),
+        "ladders": ladder_triggers,
+        "search": search_names,
+        # Версии экранов не хранятся в БД: перезагрузка сбрасывает их все
+        "versions": {},
+        "symbols": [symbol for symbol in symbols if instrument_catalogue.is_known(symbol)],
+        "bodyfix": {state.symbol for state in alert_states if state.bodyfix_notified},
+        "drawdown": {
+            state.symbol: state.drawdown_last_price
+            for state in alert_states
+            if state.drawdown_last_price is not None
+        },
+    }
@@ -8,26 +8,70 @@ from dotenv import load_dotenv
 
 from bot.handlers import router
 from database.connection import create_database
-from bot.middlewares import CheckAdminMiddleware
+from bot.middlewares import CheckAdminMiddleware, CallbackDebounceMiddleware
+from bot.middlewares import UpdateWatermarkMiddleware
+from bot.webhook import WebhookServer
 from utils.parsers import BybitTickersParser
+from utils.instruments import instrument_catalogue
+from utils.events import EventSubscriber, PRICE_CHANNEL
+from utils.cache import CACHE_CHANNEL
+from utils.common import cache_bus
+from utils.charts import chart_renderer
+from utils.price_stats import price_stats
+from utils.leader import LeaderElector
+from utils.jobs import job_runner
 
 async def main():
     load_dotenv()
     await create_database()
+    await instrument_catalogue.load()
     bot = Bot(token=os.getenv("BOT_TOKEN"), default=DefaultBotProperties(parse_mode="HTML"))
     dp = Dispatcher()
+    # Повторно доставленные после перезапуска обновления не обрабатываются
+    update_watermark = UpdateWatermarkMiddleware(dp, bot_id=bot.id)
+    await update_watermark.start()
     CheckAdminMiddleware(dp)
+    CallbackDebounceMiddleware(dp)
     dp.include_router(router)
-    bybit_parser = BybitTickersParser(bot=bot)
-    parser_task = asyncio.create_task(bybit_parser.run())
+    # Фоновые задачи: оставшиеся в очереди с прошлого запуска выполняются сразу
+    await job_runner.start(bot)
+    # Изменения общих кэшей от других процессов
+    handlers = {CACHE_CHANNEL: cache_bus.handle}
+    if os.getenv("PARSER_MODE", "embedded") == "worker":
+        # Цены собирает и уведомления отправляет отдельный процесс worker.py
+        # Статистика цен для экранов позиций считается и в процессе бота
+        handlers[PRICE_CHANNEL] = price_stats.handle_prices
+        parser_task = None
+    else:
+        # Обработчики работают во всех репликах, цены собирает только лидер
+        bybit_parser = BybitTickersParser(bot=bot)
+        elector = LeaderElector(on_elected=bybit_parser.start, on_demoted=bybit_parser.shutdown)
+        parser_task = asyncio.create_task(elector.run())
+    subscriber = EventSubscriber(handlers, on_connect=cache_bus.reload)
+    subscriber_task = asyncio.create_task(subscriber.run())
     try:
-        await dp.start_polling(bot)
+        if os.getenv("BOT_MODE", "polling") == "webhook":
+            webhook = WebhookServer(bot=bot, dp=dp)
+            await webhook.start()
+            await webhook.set_webhook()
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await webhook.stop()
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     finally:
-        await bybit_parser.stop() 
-        try:
-            await parser_task
-        except asyncio.CancelledError:
-            pass
+        for task in (parser_task, subscriber_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await job_runner.shutdown()
+        await update_watermark.stop()
+        chart_renderer.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+"""
+Приём обновлений через webhook (bot/webhook.py) с локальным фейком Telegram.
+
+Бот работает с фейковой сессией без сети, обновления отправляет
+aiohttp-клиент POST-запросами на сервер, поднятый на свободном порту.
+
+Запуск: python -m pytest tests
+"""
+import asyncio
+import time
+from typing import Any
+
+import aiohttp
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Message
+
+from bot.webhook import WebhookServer
+
+BOT_TOKEN = "42:FAKE"
+SECRET = "secret"
+
+
+class FakeTelegramSession(BaseSession):
+    """Сессия бота без обращений к Telegram: запоминает, что была закрыта"""
+
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout=None) -> Any:
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Admin"},
+            "text": "ping",
+        },
+    }
+
+
+class FakeTelegramClient:
+    """Клиент, доставляющий обновления на webhook, как это делает Telegram"""
+
+    def __init__(self, server: WebhookServer):
+        host, port = server.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}{server.path}"
+        self.session = aiohttp.ClientSession()
+
+    async def deliver(self, update: dict, secret: str = SECRET) -> int:
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+        async with self.session.post(self.url, json=update, headers=headers) as response:
+            return response.status
+
+    async def close(self) -> None:
+        await self.session.close()
+
+
+async def start_server(handler, queue_size: int = 10, workers: int = 1):
+    session = FakeTelegramSession()
+    bot = Bot(token=BOT_TOKEN, session=session)
+    router = Router()
+    router.message()(handler)
+    dp = Dispatcher()
+    dp.include_router(router)
+    server = WebhookServer(bot=bot, dp=dp, host="127.0.0.1", port=0, secret=SECRET,
+                           queue_size=queue_size, workers=workers)
+    await server.start()
+    return server, session, FakeTelegramClient(server)
+
+
+def test_updates_acknowledged_before_handling():
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(message: Message):
+            await release.wait()
+            handled.append(message.message_id)
+
+        server, session, client = await start_server(handler)
+        try:
+            started = time.monotonic()
+            statuses = [await client.deliver(make_update(i)) for i in range(1, 4)]
+            elapsed = time.monotonic() - started
+            # Ответ пришёл, пока обработчик ещё ждёт
+            assert statuses == [200, 200, 200]
+            assert handled == []
+            assert elapsed < 1
+            release.set()
+            await asyncio.wait_for(server.queue.join(), timeout=5)
+            assert sorted(handled) == [1, 2, 3]
+        finally:
+            release.set()
+            await client.close()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_returns_503():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(message: Message):
+            await release.wait()
+
+        server, session, client = await start_server(handler, queue_size=2, workers=1)
+        try:
+            # Первое обновление занимает единственного воркера, два следующих - очередь
+            assert await client.deliver(make_update(1)) == 200
+            await asyncio.sleep(0.05)
+            assert await client.deliver(make_update(2)) == 200
+            assert await client.deliver(make_update(3)) == 200
+            assert await client.deliver(make_update(4)) == 503
+            release.set()
+            await asyncio.wait_for(server.queue.join(), timeout=5)
+            # После разгрузки очереди обновления снова принимаются
+            assert await client.deliver(make_update(5)) == 200
+        finally:
+            release.set()
+            await client.close()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_wrong_secret_rejected():
+    async def scenario():
+        async def handler(message: Message):
+            pass
+
+        server, session, client = await start_server(handler)
+        try:
+            assert await client.deliver(make_update(1), secret="wrong") == 401
+            assert server.queue.qsize() == 0
+        finally:
+            await client.close()
+            await server.stop()
+
+    asyncio.run(scenario())
+
+
+def test_stop_drains_queue_and_closes_session():
+    async def scenario():
+        handled = []
+
+        async def handler(message: Message):
+            await asyncio.sleep(0.05)
+            handled.append(message.message_id)
+
+        server, session, client = await start_server(handler, workers=1)
+        for update_id in range(1, 4):
+            assert await client.deliver(make_update(update_id)) == 200
+        await client.close()
+        await server.stop()
+        assert sorted(handled) == [1, 2, 3]
+        assert server.workers == []
+        assert session.closed
+
+    asyncio.run(scenario())
@@ -0,0 +1,206 @@
+"""
+Пользовательские правила уведомлений по ценам и их вычисление на каждом тике.
+
+Правила компилируются в группы: у всех правил группы одна и та же метрика
+(цена токена, изменение цены за окно, расстояние до фиксации тела, среднее
+изменение цен сектора за окно), а пороги лежат отсортированным массивом.
+На тике метрика группы вычисляется один раз, и одним bisect находится,
+сколько порогов пройдено. Выполненные правила группы всегда образуют префикс
+массива, поэтому состояние группы - одно число, а новые срабатывания и сбросы
+- срез между прежним и новым значением. Стоимость тика зависит от числа групп
+(токены x виды правил x окна), а не от числа правил.
+"""
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from database.read_models import AlertRuleRow
+from utils.helpers import format_number
+
+# Виды правил и их названия на кнопках
+RULE_KINDS = {
+    "price_above": "Цена выше",
+    "price_below": "Цена ниже",
+    "change": "Изменение цены за период",
+    "bodyfix": "Близость к фиксации тела",
+    "sector_change": "Изменение цен сектора за период",
+}
+TOKEN_RULE_KINDS = {"price_above", "price_below", "change", "bodyfix"}
+WINDOW_RULE_KINDS = {"change", "sector_change"}
+# Самое длинное окно изменения цены: столько истории цен хранится в памяти
+MAX_RULE_WINDOW_MINUTES = 24 * 60
+
+
+class TokenState(NamedTuple):
+    sector_id: int
+    bodyfix_price_usd: Optional[Decimal]
+
+
+class RuleGroup:
+    """Правила с общей метрикой: пороги по возрастанию и число пройденных порогов"""
+
+    __slots__ = ("thresholds", "rules", "passed")
+
+    def __init__(self, rules: list[tuple[float, AlertRuleRow]]):
+        rules.sort(key=lambda item: item[0])
+        self.thresholds = array("d", [threshold for threshold, _ in rules])
+        self.rules = [rule for _, rule in rules]
+        # None до первого тика после компиляции: тогда сверяется с состоянием из БД
+        self.passed: Optional[int] = None
+
+
+def rule_metric(rule: AlertRuleRow) -> tuple[tuple, float]:
+    """
+    Ключ группы правила и порог в её шкале.
+
+    Ключ - (метрика, токен или сектор, окно в секундах, знак). Правило
+    выполнено, когда метрика * знак >= порог, поэтому "цена ниже" и "падение"
+    хранятся с обратным знаком и проверяются тем же bisect.
+    """
+    threshold = float(rule.threshold)
+    window = (rule.window_minutes or 0) * 60
+    if rule.kind == "price_above":
+        return ("price", rule.symbol, 0, 1), threshold
+    if rule.kind == "price_below":
+        return ("price", rule.symbol, 0, -1), -threshold
+    if rule.kind == "bodyfix":
+        return ("bodyfix", rule.symbol, 0, -1), -threshold
+    sign = 1 if threshold > 0 else -1
+    if rule.kind == "change":
+        return ("change", rule.symbol, window, sign), threshold * sign
+    return ("sector_change", rule.sector_id, window, sign), threshold * sign
+
+
+class AlertRuleEngine:
+    """Скомпилированные правила и история цен для изменений за окно"""
+
+    def __init__(self):
+        self.groups: dict[tuple, RuleGroup] = {}
+        self.version: Optional[int] = None
+        self.max_window = 0
+        # {symbol: (моменты, цены)} за последние max_window секунд
+        self.history: dict[str, tuple[array, array]] = {}
+
+    def compile(self, rules: list[AlertRuleRow], version: int) -> None:
+        grouped = defaultdict(list)
+        for rule in rules:
+            key, threshold = rule_metric(rule)
+            grouped[key].append((threshold, rule))
+        self.groups = {key: RuleGroup(group_rules) for key, group_rules in grouped.items()}
+        self.max_window = max((key[2] for key in self.groups), default=0)
+        self.version = version
+        if not self.max_window:
+            self.history.clear()
+
+    def record(self, prices: dict[str, Decimal], now: float) -> None:
+        """Добавление цен тика в историю и отбрасывание точек старше самого длинного окна"""
+        if not self.max_window:
+            return
+        horizon = now - self.max_window
+        for symbol, price in prices.items():
+            times, values = self.history.setdefault(symbol, (array("d"), array("d")))
+            times.append(now)
+            values.append(float(price))
+            # Последняя точка до горизонта нужна как база изменения за полное окно
+            cut = bisect_right(times, horizon) - 1
+            if cut > 0:
+                del times[:cut]
+                del values[:cut]
+
+    def change(self, symbol: str, window: int, now: float) -> Optional[float]:
+        """Изменение цены в % за window секунд или None, если истории не хватает"""
+        times, values = self.history.get(symbol, (None, None))
+        if not times:
+            return None
+        base = bisect_right(times, now - window) - 1
+        if base < 0 or not values[base]:
+            return None
+        return (values[-1] - values[base]) / values[base] * 100
+
+    def evaluate(self, prices: dict[str, Decimal], tokens: dict[str, TokenState],
+                 now: float) -> tuple[list[tuple[AlertRuleRow, float]], list[int]]:
+        """
+        Проверка всех правил по ценам тика.
+
+        Args:
+            prices: Цены тика {symbol: price}
+            tokens: Сектор и цена фиксации тела токенов тика {symbol: TokenState}
+            now: Момент тика в секундах
+
+        Returns:
+            Сработавшие правила со значением метрики и ID сброшенных правил
+        """
+        self.record(prices, now)
+        sector_symbols = defaultdict(list)
+        for symbol, token in tokens.items():
+            if symbol in prices:
+                sector_symbols[token.sector_id].append(symbol)
+        metrics: dict[tuple, Optional[float]] = {}
+        fired, rearmed = [], []
+        for key, group in self.groups.items():
+            metric, subject, window, sign = key
+            value_key = (metric, subject, window)
+            if value_key not in metrics:
+                metrics[value_key] = self.metric(metric, subject, window, prices, tokens,
+                                                 sector_symbols, now)
+            value = metrics[value_key]
+            if value is None:
+                continue
+            passed = bisect_right(group.thresholds, value * sign)
+            if group.passed is None:
+                for index, rule in enumerate(group.rules):
+                    if index < passed and not rule.triggered:
+                        fired.append((rule, value))
+                    elif index >= passed and rule.triggered:
+                        rearmed.append(rule.id)
+            elif passed > group.passed:
+                fired += [(rule, value) for rule in group.rules[group.passed:passed]]
+            elif passed < group.passed:
+                rearmed += [rule.id for rule in group.rules[passed:group.passed]]
+            group.passed = passed
+        return fired, rearmed
+
+    def metric(self, metric: str, subject, window: int, prices: dict[str, Decimal],
+               tokens: dict[str, TokenState], sector_symbols: dict[int, list[str]],
+               now: float) -> Optional[float]:
+        if metric == "sector_change":
+            changes = [change for symbol in sector_symbols.get(subject, ())
+                       if (change := self.change(symbol, window, now)) is not None]
+            return sum(changes) / len(changes) if changes else None
+        price = prices.get(subject)
+        if price is None:
+            return None
+        if metric == "price":
+            return float(price)
+        if metric == "change":
+            return self.change(subject, window, now)
+        token = tokens.get(subject)
+        if token is None or not token.bodyfix_price_usd:
+            return None
+        bodyfix_price = float(token.bodyfix_price_usd)
+        return (bodyfix_price - float(price)) / bodyfix_price * 100
+
+
+def rule_text(rule: AlertRuleRow) -> str:
+    """Описание правила для списка правил и уведомлений"""
+    threshold = format_number(abs(rule.threshold))
+    if rule.kind == "price_above":
+        return f"<b>{rule.symbol}</b>: цена выше {threshold}$"
+    if rule.kind == "price_below":
+        return f"<b>{rule.symbol}</b>: цена ниже {threshold}$"
+    if rule.kind == "bodyfix":
+        return f"<b>{rule.symbol}</b>: до цены фиксации тела меньше {threshold}%"
+    direction = "рост" if rule.threshold > 0 else "падение"
+    subject = rule.symbol if rule.kind == "change" else f"сектор {rule.sector_name}"
+    return f"<b>{subject}</b>: {direction} на {threshold}% за {rule.window_minutes} мин."
+
+
+def rule_value_text(rule: AlertRuleRow, value: float) -> str:
+    """Значение метрики правила в момент срабатывания"""
+    if rule.kind in ("price_above", "price_below"):
+        return f"цена {format_number(Decimal(repr(value)))}$"
+    if rule.kind == "bodyfix":
+        return f"до фиксации тела {value:.2f}%"
+    return f"изменение {value:+.2f}%"
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import uuid
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from utils.events import publish
+
+# Канал PostgreSQL LISTEN/NOTIFY с изменениями общих кэшей
+CACHE_CHANNEL = "cache_events"
+# Изменений в одном событии, чтобы payload уложился в предел NOTIFY
+CHANGES_PER_EVENT = 50
+
+logger = logging.getLogger(__name__)
+
+
+class VersionedList(list):
+    """Список с номером версии, который растёт при каждом изменении через apply/replace"""
+
+    version = 0
+
+    def apply(self, op: str, key: Any, value: Any = None) -> None:
+        if op == "add" and key not in self:
+            self.append(key)
+        elif op == "remove" and key in self:
+            self.remove(key)
+        else:
+            return
+        self.version += 1
+
+    def replace(self, data) -> None:
+        self[:] = list(data)
+        self.version += 1
+
+
+class VersionedSet(set):
+    """Множество с номером версии, который растёт при каждом изменении через apply/replace"""
+
+    version = 0
+
+    def apply(self, op: str, key: Any, value: Any = None) -> None:
+        if op == "add" and key not in self:
+            self.add(key)
+        elif op == "remove" and key in self:
+            self.discard(key)
+        else:
+            return
+        self.version += 1
+
+    def replace(self, data) -> None:
+        self.clear()
+        self.update(data)
+        self.version += 1
+
+
+class VersionedDict(dict):
+    """
+    Словарь с номером версии, который растёт при каждом изменении через apply/replace.
+
+    Значения приходят из событий строками и приводятся к Decimal.
+    """
+
+    version = 0
+
+    def apply(self, op: str, key: Any, value: Any = None) -> None:
+        if op == "set":
+            self[key] = Decimal(value)
+        elif op == "remove" and key in self:
+            del self[key]
+        else:
+            return
+        self.version += 1
+
+    def replace(self, data) -> None:
+        self.clear()
+        self.update(data)
+        self.version += 1
+
+
+class CacheBus:
+    """
+    Согласование общих кэшей между процессами бота и воркерами.
+
+    Изменения публикуются через NOTIFY в той же транзакции, что и запись в БД,
+    поэтому подписчики получают их только после коммита. Процесс-источник
+    применяет изменения к своим кэшам сразу после коммита и игнорирует свои же
+    события. Каждое событие несёт идентификатор процесса и его порядковый
+    номер; при пропуске номера (обрыв подписки) и при подключении подписки
+    кэши целиком перечитываются из БД загрузчиком.
+    """
+
+    def __init__(self, caches: dict[str, Any]):
+        self.caches = caches
+        self.origin = uuid.uuid4().hex[:12]
+        self.seq = 0
+        # Последний номер события от каждого другого процесса
+        self.last_seen: dict[str, int] = {}
+        self.loader: Optional[Callable[[], Awaitable[dict[str, Any]]]] = None
+        self.lock = asyncio.Lock()
+
+    def state_loader(self, loader: Callable[[], Awaitable[dict[str, Any]]]):
+        """Регистрация загрузчика полного состояния кэшей из БД (декоратор)"""
+        self.loader = loader
+        return loader
+
+    async def publish(self, changes: list[tuple], session: AsyncSession = None) -> None:
+        """
+        Публикация изменений вида (кэш, операция, ключ[, значение]).
+
+        С сессией изменения применяются к своим кэшам после коммита её
+        транзакции, без сессии - сразу. Большие наборы изменений уходят
+        несколькими событиями подряд.
+        """
+        if not changes:
+            return
+        for start in range(0, len(changes), CHANGES_PER_EVENT):
+            self.seq += 1
+            payload = {
+                "origin": self.origin,
+                "seq": self.seq,
+                "changes": changes[start:start + CHANGES_PER_EVENT],
+            }
+            await publish(CACHE_CHANNEL, payload, session=session)
+        if session:
+            event.listen(
+                session.sync_session, "after_commit", lambda _: self._apply(changes), once=True
+            )
+        else:
+            self._apply(changes)
+
+    async def handle(self, payload: dict) -> None:
+        """Применение изменений из другого процесса"""
+        origin, seq = payload["origin"], payload["seq"]
+        if origin == self.origin:
+            return
+        async with self.lock:
+            last_seq = self.last_seen.get(origin)
+            self.last_seen[origin] = max(seq, last_seq or 0)
+            self._apply(payload["changes"])
+            # Изменения разных транзакций коммитятся не строго по порядку номеров,
+            # поэтому пропуск - это только скачок вперёд
+            if last_seq is not None and seq > last_seq + 1:
+                logger.warning(f"Пропущены события кэшей процесса {origin}, полная перезагрузка")
+                await self._reload()
+
+    async def reload(self) -> None:
+        """Полная перезагрузка кэшей из БД"""
+        async with self.lock:
+            await self._reload()
+
+    async def _reload(self) -> None:
+        if not self.loader:
+            return
+        state = await self.loader()
+        for name, data in state.items():
+            self.caches[name].replace(data)
+        logger.info(f"Кэши перезагружены из БД: {', '.join(state)}")
+
+    def _apply(self, changes: list) -> None:
+        for name, op, key, *value in changes:
+            self.caches[name].apply(op, key, *value)
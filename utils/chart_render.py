@@ -0,0 +1,59 @@
+"""
+Отрисовка графиков в PNG.
+
+Функции выполняются в процессах пула utils.charts, поэтому модуль не зависит
+от бота и БД: на вход только простые значения, на выходе байты PNG.
+Требуется matplotlib (pip install matplotlib).
+"""
+import io
+from datetime import datetime
+
+from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+from matplotlib.figure import Figure
+
+CHART_SIZE = (8, 4.5)
+CHART_DPI = 100
+
+
+def to_png(figure: Figure) -> bytes:
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", dpi=CHART_DPI, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+def render_line_chart(title: str, times: list[datetime], values: list[float],
+                      levels: list[tuple[str, float, str]]) -> bytes:
+    """
+    Линейный график с горизонтальными уровнями.
+
+    Args:
+        title: Заголовок
+        times: Моменты снимков
+        values: Значения в моменты снимков
+        levels: Уровни (подпись, значение, цвет), например цена входа
+    """
+    figure = Figure(figsize=CHART_SIZE)
+    axes = figure.subplots()
+    axes.plot(times, values, color="tab:blue", linewidth=1.5)
+    for label, value, color in levels:
+        axes.axhline(value, color=color, linestyle="--", linewidth=1, label=f"{label}: {value:g}")
+    locator = AutoDateLocator()
+    axes.xaxis.set_major_locator(locator)
+    axes.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    axes.set_title(title)
+    axes.grid(alpha=0.3)
+    if levels:
+        axes.legend(loc="best")
+    return to_png(figure)
+
+
+def render_pie_chart(title: str, labels: list[str], values: list[float]) -> bytes:
+    """Круговая диаграмма долей; нулевые доли не показываются"""
+    shares = [(label, value) for label, value in zip(labels, values) if value > 0]
+    figure = Figure(figsize=CHART_SIZE)
+    axes = figure.subplots()
+    axes.pie([value for _, value in shares], labels=[label for label, _ in shares],
+             autopct="%1.1f%%", startangle=90, counterclock=False)
+    axes.axis("equal")
+    axes.set_title(title, pad=20)
+    return to_png(figure)
@@ -0,0 +1,169 @@
+"""
+Графики для экранов бота: история цены токена, стоимость позиции и
+распределение портфеля.
+
+Отрисовка выполняется в пуле процессов (см. ChartRenderer), данные для неё
+читаются из снимков, которые пишет utils.equity. Без matplotlib графики
+недоступны, остальной бот работает как обычно.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Callable, Hashable, Optional
+
+from dotenv import load_dotenv
+
+import database.read_models as rm
+from database.equity import take_snapshot, utc_now
+
+try:
+    from utils import chart_render
+except ImportError:
+    chart_render = None
+
+load_dotenv()
+# Процессов отрисовки и число PNG в кэше
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", 2))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", 64))
+# Доступные диапазоны графиков, дней
+CHART_RANGES = (1, 7, 30)
+
+logger = logging.getLogger(__name__)
+
+
+class ChartRenderer:
+    """
+    Отрисовка графиков в пуле процессов с кэшем готовых PNG.
+
+    matplotlib занимает CPU на сотни миллисекунд на график, поэтому рисует в
+    ProcessPoolExecutor и не блокирует цикл событий обработчиков и парсера.
+    PNG хранятся в LRU-кэше по ключу (график, сущность, диапазон) вместе с
+    версией данных: когда приходят новые данные, версия меняется и график
+    перерисовывается. Одинаковые запросы во время отрисовки ждут один результат.
+    """
+
+    def __init__(self, workers: int, cache_size: int):
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache: OrderedDict[tuple, tuple[Hashable, bytes]] = OrderedDict()
+        self.pending: dict[tuple, asyncio.Future] = {}
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def cached(self, key: tuple, version: Hashable) -> Optional[bytes]:
+        """PNG из кэша, если он построен по той же версии данных"""
+        entry = self.cache.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self.cache.move_to_end(key)
+        return entry[1]
+
+    async def render(self, key: tuple, version: Hashable, render: Callable, *args) -> bytes:
+        """Отрисовка render(*args) в пуле процессов с сохранением в кэш"""
+        pending_key = (key, version)
+        future = self.pending.get(pending_key)
+        if future is None:
+            if self.executor is None:
+                # spawn: дочерние процессы не наследуют соединения и потоки бота
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            future = asyncio.get_running_loop().run_in_executor(self.executor, render, *args)
+            self.pending[pending_key] = future
+            future.add_done_callback(lambda _: self.pending.pop(pending_key, None))
+        png = await asyncio.shield(future)
+        self.cache[key] = (version, png)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return png
+
+    def shutdown(self) -> None:
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+chart_renderer = ChartRenderer(workers=CHART_WORKERS, cache_size=CHART_CACHE_SIZE)
+
+
+def charts_available() -> bool:
+    return chart_render is not None
+
+
+async def price_chart(token_id: int, days: int) -> Optional[bytes]:
+    """График цены токена за days дней или None, если снимков меньше двух"""
+    key = ("price", token_id, days)
+    version = await rm.get_price_history_version(token_id)
+    if version is None:
+        return None
+    if png := chart_renderer.cached(key, version):
+        return png
+    token = await rm.get_token_card(token_id)
+    history = await rm.get_price_history(token_id, utc_now() - timedelta(days=days))
+    if token is None or len(history) < 2:
+        return None
+    return await chart_renderer.render(
+        key, version, chart_render.render_line_chart,
+        f"{token.symbol}USDT, {days} дн. (UTC)",
+        [point.taken_at for point in history],
+        [float(point.price) for point in history],
+        [],
+    )
+
+
+async def position_chart(position_id: int, days: int) -> Optional[bytes]:
+    """
+    График стоимости позиции за days дней с уровнями цены входа и фиксации тела.
+    None, если позиции нет или снимков меньше двух.
+    """
+    position = await rm.get_position_card(position_id)
+    if position is None:
+        return None
+    key = ("position", position_id, days)
+    # Версия учитывает и новые снимки цены, и изменение позиции ордерами
+    version = (await rm.get_price_history_version(position.token_id),
+               position.amount, position.entry_price, position.bodyfix_price_usd)
+    if version[0] is None:
+        return None
+    if png := chart_renderer.cached(key, version):
+        return png
+    history = await rm.get_price_history(position.token_id, utc_now() - timedelta(days=days))
+    if len(history) < 2:
+        return None
+    amount = float(position.amount)
+    return await chart_renderer.render(
+        key, version, chart_render.render_line_chart,
+        f"Позиция {position.name}, стоимость в $, {days} дн. (UTC)",
+        [point.taken_at for point in history],
+        [float(point.price) * amount for point in history],
+        [("Цена входа", round(float(position.entry_price) * amount, 2), "tab:orange"),
+         ("Фиксация тела", round(float(position.bodyfix_price_usd) * amount, 2), "tab:green")],
+    )
+
+
+async def allocation_chart() -> Optional[bytes]:
+    """Круговая диаграмма текущего распределения портфеля или None для пустого портфеля"""
+    sample = await take_snapshot()
+    names = {sector.id: sector.name for sector in await rm.list_sectors()}
+    shares = [("Ликвидность", sample.liquidity_usd)]
+    shares += [(names.get(sector_id, f"Сектор {sector_id}"), positions_usd + tokens_usd)
+               for sector_id, (positions_usd, tokens_usd) in sorted(sample.sectors.items())]
+    shares.append(("Свободный рабочий капитал",
+                   sample.tokens_usd - sum(tokens for _, tokens in sample.sectors.values())))
+    if not sample.total_usd:
+        return None
+    # Версия - сами доли: при любом изменении балансов диаграмма перерисовывается
+    version = tuple(shares)
+    key = ("allocation", 0, 0)
+    if png := chart_renderer.cached(key, version):
+        return png
+    return await chart_renderer.render(
+        key, version, chart_render.render_pie_chart,
+        f"Распределение портфеля, всего {sample.total_usd}$",
+        [label for label, _ in shares],
+        [float(value) for _, value in shares],
+    )
@@ -0,0 +1,182 @@
+import logging
+import random
+import time
+from collections import deque
+from enum import Enum
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BreakerState(str, Enum):
+    """Состояния предохранителя"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Предохранитель запросов к API биржи.
+
+    Состояние определяется исходами реальных запросов: долей ошибок, таймаутов
+    и медленных ответов в скользящем окне. После срабатывания запросы блокируются
+    на время экспоненциальной задержки с джиттером, затем пропускается несколько
+    пробных запросов (half-open), по итогам которых предохранитель закрывается
+    или снова открывается с увеличенной задержкой.
+
+    Каждый пропущенный пробный запрос должен завершиться record_success,
+    record_failure или release (отменён без исхода). Если пробы не дали
+    итога за half_open_timeout, предохранитель снова открывается.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 50,
+        min_requests: int = 10,
+        error_rate_threshold: float = 0.5,
+        latency_threshold: float = 5.0,
+        base_backoff: float = 30.0,
+        max_backoff: float = 600.0,
+        half_open_max_calls: int = 3,
+        half_open_timeout: float = 60.0,
+    ):
+        self.name = name
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.latency_threshold = latency_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.half_open_max_calls = half_open_max_calls
+        self.half_open_timeout = half_open_timeout
+
+        self.state = BreakerState.CLOSED
+        # Окно исходов запросов: True - успех, False - ошибка/таймаут/медленный ответ
+        self.outcomes: deque[bool] = deque(maxlen=window_size)
+        self.latencies: deque[float] = deque(maxlen=window_size)
+        self.consecutive_opens = 0
+        self.retry_at = 0.0
+        self.half_open_calls = 0
+        self.half_open_successes = 0
+        self.half_open_since = 0.0
+        self.metrics = {
+            "successes": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "slow": 0,
+            "rejected": 0,
+            "opened": 0,
+        }
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def retry_in(self) -> float:
+        """Секунд до следующей пробы, если предохранитель открыт"""
+        if self.state != BreakerState.OPEN:
+            return 0.0
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def probe_due(self) -> bool:
+        """Истекла ли задержка открытого предохранителя"""
+        return self.state == BreakerState.OPEN and time.monotonic() >= self.retry_at
+
+    def allow_request(self) -> bool:
+        """Можно ли выполнить запрос в текущем состоянии"""
+        if self.state == BreakerState.CLOSED:
+            return True
+        if (self.state == BreakerState.HALF_OPEN
+                and time.monotonic() - self.half_open_since > self.half_open_timeout):
+            logger.warning(f"Предохранитель {self.name}: пробные запросы не дали итога вовремя")
+            self._open()
+        if self.state == BreakerState.HALF_OPEN and self.half_open_calls < self.half_open_max_calls:
+            self.half_open_calls += 1
+            return True
+        self.metrics["rejected"] += 1
+        return False
+
+    def release(self) -> None:
+        """Возврат слота пробного запроса, отменённого до получения исхода"""
+        if self.state == BreakerState.HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def record_success(self, latency: float) -> None:
+        """Фиксация успешного запроса. Медленный ответ считается неудачей."""
+        self.latencies.append(latency)
+        if latency > self.latency_threshold:
+            self.metrics["slow"] += 1
+            self._on_failure()
+            return
+        self.metrics["successes"] += 1
+        self.outcomes.append(True)
+        if self.state == BreakerState.HALF_OPEN:
+            self.half_open_successes += 1
+            if self.half_open_successes >= self.half_open_max_calls:
+                self._transition(BreakerState.CLOSED)
+
+    def record_failure(self, timeout: bool = False) -> None:
+        """Фиксация неудачного запроса"""
+        self.metrics["timeouts" if timeout else "errors"] += 1
+        self._on_failure()
+
+    def record_probe(self, healthy: bool) -> None:
+        """Результат проверки доступности API при открытом предохранителе"""
+        if healthy:
+            self._transition(BreakerState.HALF_OPEN)
+        else:
+            self._open()
+
+    def snapshot(self) -> dict:
+        """Текущее состояние и счётчики для логов/метрик"""
+        latencies = sorted(self.latencies)
+        p95: Optional[float] = None
+        if latencies:
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return {
+            "state": self.state.value,
+            "error_rate": round(self.error_rate, 3),
+            "latency_p95": round(p95, 3) if p95 is not None else None,
+            "retry_in": round(self.retry_in, 1),
+            **self.metrics,
+        }
+
+    def _on_failure(self) -> None:
+        self.outcomes.append(False)
+        if self.state == BreakerState.HALF_OPEN:
+            self._open()
+        elif (self.state == BreakerState.CLOSED
+              and len(self.outcomes) >= self.min_requests
+              and self.error_rate >= self.error_rate_threshold):
+            self._open()
+
+    def _open(self) -> None:
+        self.consecutive_opens += 1
+        self.metrics["opened"] += 1
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (self.consecutive_opens - 1))
+        # Джиттер, чтобы пробы нескольких клиентов не совпадали по времени
+        delay = random.uniform(delay / 2, delay)
+        self.retry_at = time.monotonic() + delay
+        self._transition(BreakerState.OPEN)
+        logger.warning(f"Предохранитель {self.name}: следующая проба через {delay:.1f} сек.")
+
+    def _transition(self, state: BreakerState) -> None:
+        previous = self.state
+        self.state = state
+        self.half_open_calls = 0
+        self.half_open_successes = 0
+        if state == BreakerState.HALF_OPEN:
+            self.half_open_since = time.monotonic()
+        if state == BreakerState.CLOSED:
+            self.consecutive_opens = 0
+            self.outcomes.clear()
+        if previous != state:
+            logger.warning(
+                f"Предохранитель {self.name}: {previous.value} -> {state.value} "
+                f"(доля ошибок {self.error_rate:.0%})"
+            )
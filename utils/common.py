@@ -1,9 +1,28 @@
-from decimal import Decimal
+from utils.cache import CacheBus, VersionedDict, VersionedList, VersionedSet
+from utils.search import search_index
+from utils.render_cache import data_versions
 
 
-symbols_list = []
+symbols_list = VersionedList()
 
-bodyfix_notified_tokens: set[str] = set()
+bodyfix_notified_tokens = VersionedSet()
 
 # Словарь для отслеживания последних цен уведомлений о просадке {symbol: last_notification_price}
-drawdown_last_prices: dict[str, Decimal] = {}
+drawdown_last_prices = VersionedDict()
+
+# ID правил уведомлений: по смене версии парсер перекомпилирует правила
+alert_rule_ids = VersionedSet()
+
+# Цены следующих ступеней лестниц входа, о достижении которых ещё не уведомляли {symbol: price}
+ladder_triggers = VersionedDict()
+
+# Изменения этих структур расходятся по всем процессам через cache_bus
+cache_bus = CacheBus({
+    "symbols": symbols_list,
+    "bodyfix": bodyfix_notified_tokens,
+    "drawdown": drawdown_last_prices,
+    "rules": alert_rule_ids,
+    "ladders": ladder_triggers,
+    "search": search_index,
+    "versions": data_versions,
+})
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from database.equity import EquitySample, purge_price_history, rollup_snapshots
+from database.equity import save_snapshots, take_snapshot
+
+load_dotenv()
+# Интервал между снимками стоимости портфеля, сек.
+EQUITY_SNAPSHOT_INTERVAL = float(os.getenv("EQUITY_SNAPSHOT_INTERVAL", 300))
+# Снимков в одной пачке записи
+EQUITY_SNAPSHOT_BATCH = int(os.getenv("EQUITY_SNAPSHOT_BATCH", 6))
+# Сколько дней хранить исходные снимки после свёртки в агрегаты
+EQUITY_RAW_RETENTION_DAYS = int(os.getenv("EQUITY_RAW_RETENTION_DAYS", 7))
+# Сколько дней хранить историю цен токенов для графиков
+PRICE_HISTORY_RETENTION_DAYS = int(os.getenv("PRICE_HISTORY_RETENTION_DAYS", 30))
+
+logger = logging.getLogger(__name__)
+
+
+class EquitySnapshotter:
+    """
+    Снимки стоимости портфеля и цен токенов по циклам парсера.
+
+    Снимок делается после обновления цен, но не чаще interval. Снимки
+    копятся в памяти и пишутся пачкой по batch_size, после чего в фоне
+    пересчитываются часовые и дневные агрегаты затронутых периодов.
+    """
+
+    def __init__(self, interval: float, batch_size: int, retention: timedelta,
+                 price_retention: timedelta):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retention = retention
+        self.price_retention = price_retention
+        self.samples: list[EquitySample] = []
+        self.sampled_at = 0.0
+        self.rollup_task: Optional[asyncio.Task] = None
+        self.rollup_lock = asyncio.Lock()
+
+    async def on_cycle(self) -> None:
+        """Вызывается после каждого обновления цен"""
+        if time.monotonic() - self.sampled_at < self.interval:
+            return
+        self.sampled_at = time.monotonic()
+        try:
+            self.samples.append(await take_snapshot())
+        except Exception as e:
+            logger.error(f"Ошибка при снимке стоимости портфеля: {e}")
+            return
+        if len(self.samples) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Запись накопленных снимков и запуск пересчёта агрегатов"""
+        samples, self.samples = self.samples, []
+        if not samples:
+            return
+        try:
+            await save_snapshots(samples)
+        except Exception as e:
+            logger.error(f"Ошибка при записи {len(samples)} снимков стоимости портфеля: {e}")
+            return
+        self.rollup_task = asyncio.create_task(self.rollup(samples[0].taken_at))
+
+    async def rollup(self, since) -> None:
+        async with self.rollup_lock:
+            try:
+                await rollup_snapshots(since, self.retention)
+                await purge_price_history(self.price_retention)
+            except Exception as e:
+                logger.error(f"Ошибка при пересчёте агрегатов стоимости портфеля: {e}")
+
+    async def close(self) -> None:
+        """Запись остатка снимков и ожидание пересчёта агрегатов при остановке"""
+        await self.flush()
+        if self.rollup_task:
+            await self.rollup_task
+            self.rollup_task = None
+
+
+equity_snapshotter = EquitySnapshotter(
+    interval=EQUITY_SNAPSHOT_INTERVAL,
+    batch_size=EQUITY_SNAPSHOT_BATCH,
+    retention=timedelta(days=EQUITY_RAW_RETENTION_DAYS),
+    price_retention=timedelta(days=PRICE_HISTORY_RETENTION_DAYS),
+)
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.connection import async_session, get_asyncpg_dsn
+
+# Каналы PostgreSQL LISTEN/NOTIFY между процессом бота и воркером цен
+PRICE_CHANNEL = "price_events"
+
+# Предел размера payload в NOTIFY - 8000 байт
+MAX_PAYLOAD_SIZE = 7900
+RECONNECT_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+
+async def publish(channel: str, payload: dict, session: AsyncSession = None) -> None:
+    """
+    Публикация события в канал.
+
+    Если передана сессия, событие уходит подписчикам только после коммита
+    её транзакции, вместе с изменениями в БД.
+    """
+    message = json.dumps(payload, default=str)
+    if len(message.encode()) > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"Событие для канала {channel} превышает размер NOTIFY")
+    query = select(func.pg_notify(channel, message))
+    if session:
+        await session.execute(query)
+    else:
+        async with async_session() as new_session:
+            async with new_session.begin():
+                await new_session.execute(query)
+
+
+async def publish_prices(prices: dict) -> None:
+    """Публикация новых цен частями, укладывающимися в размер NOTIFY"""
+    chunk = {}
+    for symbol, price in prices.items():
+        chunk[symbol] = str(price)
+        if len(chunk) >= 200:
+            await publish(PRICE_CHANNEL, {"type": "prices", "prices": chunk})
+            chunk = {}
+    if chunk:
+        await publish(PRICE_CHANNEL, {"type": "prices", "prices": chunk})
+
+
+class EventSubscriber:
+    """
+    Подписка на каналы событий через отдельное соединение asyncpg.
+
+    Каждое событие передаётся обработчику своего канала в отдельной задаче.
+    При обрыве соединения подписка восстанавливается; события, пришедшие
+    во время обрыва, теряются, поэтому после каждого подключения вызывается
+    on_connect - например, для перезагрузки состояния из БД.
+    """
+
+    def __init__(
+        self,
+        handlers: dict[str, Callable[[dict], Awaitable[None]]],
+        on_connect: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        self.handlers = handlers
+        self.on_connect = on_connect
+        self.dsn = get_asyncpg_dsn()
+        self.connection: Optional[asyncpg.Connection] = None
+        self.tasks: set[asyncio.Task] = set()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self.connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                self.connection.add_termination_listener(lambda _: closed.set())
+                for channel in self.handlers:
+                    await self.connection.add_listener(channel, self._on_notify)
+                logger.info(f"Подписка на события: {', '.join(self.handlers)}")
+                if self.on_connect:
+                    await self.on_connect()
+                await closed.wait()
+                logger.warning("Соединение подписки на события потеряно")
+            except asyncio.CancelledError:
+                await self.stop()
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка подписки на события: {e}")
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def stop(self) -> None:
+        if self.connection and not self.connection.is_closed():
+            await self.connection.close()
+        self.connection = None
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        task = asyncio.create_task(self._dispatch(channel, payload))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _dispatch(self, channel: str, payload: str) -> None:
+        try:
+            await self.handlers[channel](json.loads(payload))
+        except Exception as e:
+            logger.error(f"Ошибка обработки события из канала {channel}: {e}")
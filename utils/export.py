@@ -0,0 +1,144 @@
+"""
+Потоковая выгрузка таблиц в CSV или Parquet.
+
+Строки читаются курсором на стороне сервера пачками по EXPORT_CHUNK_SIZE и
+сразу пишутся в файл, поэтому память не зависит от размера таблицы.
+Parquet доступен, если установлен pyarrow (pip install pyarrow).
+
+Тот же код используется командой /export в боте и из командной строки:
+    python -m utils.export orders positions --format parquet --output-dir exports
+"""
+import argparse
+import asyncio
+import csv
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import Boolean, Integer, Numeric, Select, String, TIMESTAMP, select
+
+from database.connection import async_session, engine
+from database.models import Deposit, EquityRollup, Order, Position, Token
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+load_dotenv()
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+
+# Выгружаемые наборы данных: имя -> запрос
+EXPORTS: dict[str, Select] = {
+    "orders": (
+        select(Order.id, Token.symbol, Order.type, Order.amount, Order.entry_price,
+               Order.added_at)
+        .join(Token, Order.token_id == Token.id)
+        .order_by(Order.id)
+    ),
+    "positions": select(
+        Position.id, Position.name, Position.amount, Position.entry_price,
+        Position.invested_usd, Position.bodyfix_price_usd, Position.total_usd,
+    ).order_by(Position.id),
+    "deposits": select(Deposit.id, Deposit.amount_usd).order_by(Deposit.id),
+    "equity": select(
+        EquityRollup.period, EquityRollup.period_start, EquityRollup.open_usd,
+        EquityRollup.high_usd, EquityRollup.low_usd, EquityRollup.close_usd,
+        EquityRollup.liquidity_usd, EquityRollup.positions_usd, EquityRollup.tokens_usd,
+    ).order_by(EquityRollup.period, EquityRollup.period_start),
+}
+
+
+def available_formats() -> list[str]:
+    return ["csv", "parquet"] if pa else ["csv"]
+
+
+def arrow_type(column_type):
+    """Тип колонки Parquet по типу колонки SQLAlchemy"""
+    if isinstance(column_type, Numeric):
+        precision, scale = column_type.precision or 38, column_type.scale or 0
+        if precision > 38:
+            return pa.decimal256(precision, scale)
+        return pa.decimal128(precision, scale)
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, TIMESTAMP):
+        return pa.timestamp("us")
+    if isinstance(column_type, String):
+        return pa.string()
+    raise ValueError(f"Нет типа Parquet для колонки {column_type}")
+
+
+async def export_table(name: str, path: str, fmt: str = "csv",
+                       progress: Optional[Callable[[int], Awaitable[None]]] = None) -> int:
+    """
+    Выгрузка набора данных name в файл path.
+
+    progress вызывается после каждой пачки с числом выгруженных строк.
+
+    Returns:
+        int: Количество выгруженных строк
+    """
+    if name not in EXPORTS:
+        raise ValueError(f"Неизвестная таблица {name}, доступны: {', '.join(EXPORTS)}")
+    if fmt not in available_formats():
+        raise ValueError(f"Формат {fmt} недоступен, доступны: {', '.join(available_formats())}")
+
+    query = EXPORTS[name].execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    columns = [column.name for column in query.selected_columns]
+    rows_count = 0
+    async with async_session() as session:
+        result = await session.stream(query)
+        if fmt == "csv":
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                writer.writerow(columns)
+                async for rows in result.partitions():
+                    writer.writerows(rows)
+                    rows_count += len(rows)
+                    if progress:
+                        await progress(rows_count)
+        else:
+            schema = pa.schema([
+                (column.name, arrow_type(column.type)) for column in query.selected_columns
+            ])
+            with pq.ParquetWriter(path, schema) as writer:
+                async for rows in result.partitions():
+                    writer.write_batch(pa.RecordBatch.from_pylist(
+                        [dict(zip(columns, row)) for row in rows], schema=schema
+                    ))
+                    rows_count += len(rows)
+                    if progress:
+                        await progress(rows_count)
+    return rows_count
+
+
+def export_filename(name: str, fmt: str, directory: Optional[str] = None) -> str:
+    filename = f"{name}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+    return os.path.join(directory, filename) if directory else filename
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Выгрузка таблиц портфеля")
+    parser.add_argument("tables", nargs="*", default=list(EXPORTS),
+                        help=f"Таблицы: {', '.join(EXPORTS)} (по умолчанию все)")
+    parser.add_argument("--format", choices=available_formats(), default="csv")
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    try:
+        for name in args.tables:
+            path = export_filename(name, args.format, args.output_dir)
+            rows_count = await export_table(name, path, args.format)
+            print(f"{name}: {rows_count} строк -> {path}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
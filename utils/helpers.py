@@ -1,20 +1,45 @@
-from decimal import Decimal
+from decimal import Context, Decimal
+
+# Контекст с запасом точности для Numeric(45, 15), чтобы не округлять значащие цифры
+EXACT_CONTEXT = Context(prec=60)
+ONE = Decimal(1)
+CENT = Decimal("0.01")
+HUNDRED = Decimal(100)
 
 
 def format_number(value: Decimal) -> Decimal:
-    value_str = format(value, "f")
-    if "." in value_str:
-        int_part, frac_part = value_str.split(".", 1)
-        frac_part = frac_part.rstrip("0")
-        if frac_part:
-            formatted_str = f"{int_part}.{frac_part}"
-        else:
-            formatted_str = int_part
-    else:
-        formatted_str = value_str
-    return Decimal(formatted_str)
+    """Число без незначащих нулей после запятой и без экспоненциальной записи"""
+    if not isinstance(value, Decimal):
+        # repr у float - кратчайшая точная запись; format(value, "f") оставил бы 6 знаков
+        value = Decimal(repr(value))
+    if value == value.to_integral_value():
+        return value.quantize(ONE, context=EXACT_CONTEXT)
+    return value.normalize(EXACT_CONTEXT)
 
 
 def round_to_2(value: Decimal) -> Decimal:
     """Округление числа до 2 знаков после запятой"""
-    return value.quantize(Decimal("0.01"))
+    return value.quantize(CENT)
+
+
+def allocate(total: Decimal, percentages: list[Decimal]) -> list[Decimal]:
+    """
+    Распределение суммы по долям в процентах с точностью до цента.
+
+    Все доли кроме последней округляются, последняя получает остаток,
+    чтобы сумма частей была ровно равна total.
+    """
+    if not percentages:
+        return []
+    parts = [round_to_2(total * percentage / HUNDRED) for percentage in percentages[:-1]]
+    parts.append(total - sum(parts))
+    return parts
+
+
+def drawdown_reached(reference: Decimal, price: Decimal, percentage: Decimal) -> bool:
+    """
+    Проверка, что цена упала от reference не меньше чем на percentage процентов.
+
+    То же, что (reference - price) / reference * 100 >= percentage, но без деления.
+    """
+    return (reference - price) * HUNDRED >= percentage * reference
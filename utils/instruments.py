@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import ssl
+import time
+from typing import Optional
+
+import aiofiles
+import aiohttp
+import certifi
+from dotenv import load_dotenv
+
+from utils.rate_limiter import bybit_rate_limiter, PRIORITY_HIGH
+
+load_dotenv()
+INSTRUMENTS_CACHE_PATH = os.getenv("INSTRUMENTS_CACHE_PATH", "instruments_cache.json")
+INSTRUMENTS_CACHE_TTL_HOURS = float(os.getenv("INSTRUMENTS_CACHE_TTL_HOURS", 24))
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentCatalogue:
+    """
+    Справочник спотовых пар к USDT, торгуемых на Bybit.
+
+    Список инструментов запрашивается у биржи один раз и кэшируется на диске
+    с TTL. Пока справочник не загружен (биржа и кэш недоступны), проверка
+    символов пропускает любые токены, чтобы не блокировать работу бота.
+    """
+
+    def __init__(self, cache_path: str, ttl_seconds: float):
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self.bybit_url = "https://api.bybit.com/"
+        self.quote_coin = "USDT"
+        self.symbols: set[str] = set()
+        self.fetched_at = 0.0
+
+    @property
+    def expired(self) -> bool:
+        return time.time() - self.fetched_at > self.ttl_seconds
+
+    def is_known(self, symbol: str) -> bool:
+        """Проверка, что токен торгуется на Bybit в паре с USDT"""
+        if not self.symbols:
+            return True
+        return symbol in self.symbols
+
+    async def load(self, session: Optional[aiohttp.ClientSession] = None) -> None:
+        """Загрузка справочника из кэша, а при устаревшем кэше - с биржи"""
+        await self._read_cache()
+        if self.symbols and not self.expired:
+            logger.info(f"Справочник инструментов загружен из кэша: {len(self.symbols)} токенов")
+            return
+        symbols = await self._fetch(session)
+        if symbols:
+            self.symbols = symbols
+            self.fetched_at = time.time()
+            await self._write_cache()
+            logger.info(f"Справочник инструментов загружен с Bybit: {len(symbols)} токенов")
+        elif self.symbols:
+            logger.warning("Не удалось обновить справочник инструментов, используется старый кэш")
+        else:
+            logger.error("Справочник инструментов недоступен, проверка токенов отключена")
+
+    async def _fetch(self, session: Optional[aiohttp.ClientSession]) -> Optional[set[str]]:
+        own_session = session is None
+        if own_session:
+            ssl_context = ssl.create_default_context(cafile=certifi.where())
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ssl=ssl_context),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+        symbols = set()
+        cursor = ""
+        try:
+            while True:
+                url = f"{self.bybit_url}/v5/market/instruments-info?category=spot&limit=1000"
+                if cursor:
+                    url += f"&cursor={cursor}"
+                await bybit_rate_limiter.acquire(PRIORITY_HIGH)
+                async with session.get(url) as response:
+                    bybit_rate_limiter.update_from_headers(response.headers)
+                    data = await response.json()
+                if data["retCode"] != 0:
+                    logger.error(f"Ошибка API при загрузке инструментов: {data['retMsg']}")
+                    return None
+                symbols.update(
+                    item["baseCoin"]
+                    for item in data["result"]["list"]
+                    if item["quoteCoin"] == self.quote_coin and item["status"] == "Trading"
+                )
+                cursor = data["result"].get("nextPageCursor")
+                if not cursor:
+                    return symbols
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке инструментов Bybit: {e}")
+            return None
+        finally:
+            if own_session:
+                await session.close()
+
+    async def _read_cache(self) -> None:
+        try:
+            async with aiofiles.open(self.cache_path, "r") as file:
+                data = json.loads(await file.read())
+            self.symbols = set(data["symbols"])
+            self.fetched_at = data["fetched_at"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Кэш инструментов повреждён: {e}")
+
+    async def _write_cache(self) -> None:
+        data = {"fetched_at": self.fetched_at, "symbols": sorted(self.symbols)}
+        try:
+            async with aiofiles.open(self.cache_path, "w") as file:
+                await file.write(json.dumps(data))
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш инструментов: {e}")
+
+
+instrument_catalogue = InstrumentCatalogue(
+    cache_path=INSTRUMENTS_CACHE_PATH,
+    ttl_seconds=INSTRUMENTS_CACHE_TTL_HOURS * 3600,
+)
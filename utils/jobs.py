@@ -0,0 +1,228 @@
+"""
+Фоновые задачи для тяжёлых операций администратора: депозит, пакетный ввод
+ордеров, выгрузки и перераспределения.
+
+Обработчик сообщения ставит задачу в очередь через job_runner.submit и сразу
+возвращает управление, задачу выполняет один из JOB_WORKERS воркеров
+процесса. Задача записывается в таблицу jobs: после перезапуска задачи из
+очереди выполняются, а прерванные на середине отмечаются ошибкой. Ход
+выполнения показывается правкой одного сообщения не чаще раза в
+JOB_PROGRESS_SECONDS. Виды задач регистрируются декоратором job_runner.job
+(см. bot.jobs).
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import suppress
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from dotenv import load_dotenv
+
+import database.jobs as jb
+from database.equity import utc_now
+
+load_dotenv()
+# Задач, выполняемых одновременно
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# Как часто можно править сообщение о ходе задачи, сек.
+JOB_PROGRESS_SECONDS = float(os.getenv("JOB_PROGRESS_SECONDS", 3))
+# Выполняемая задача без отметок дольше стольких секунд брошена упавшим процессом
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 120))
+PROGRESS_BAR_LENGTH = 10
+
+logger = logging.getLogger(__name__)
+
+
+class JobResult(NamedTuple):
+    text: str
+    reply_markup: Any = None
+    # Задача не выполнена по ожидаемой причине (ошибка проверки данных)
+    failed: bool = False
+
+
+def progress_bar(percentage: int) -> str:
+    filled = percentage * PROGRESS_BAR_LENGTH // 100
+    return "▰" * filled + "▱" * (PROGRESS_BAR_LENGTH - filled)
+
+
+class JobContext:
+    """Выполняемая задача: бот, чат для результатов и отчёт о ходе выполнения"""
+
+    def __init__(self, runner: "JobRunner", job: jb.JobRow, title: str):
+        self.runner = runner
+        self.bot = runner.bot
+        self.job = job
+        self.chat_id = job.chat_id
+        self.title = title
+        self.reported_at: Optional[float] = None
+
+    async def progress(self, done: int, total: Optional[int] = None,
+                       stage: Optional[str] = None) -> None:
+        """
+        Отчёт о ходе выполнения; вызывать можно сколько угодно часто.
+
+        Args:
+            done: Обработано единиц работы
+            total: Всего единиц, если известно заранее
+            stage: Подпись текущего этапа
+        """
+        now = time.monotonic()
+        if self.reported_at is not None and now - self.reported_at < JOB_PROGRESS_SECONDS:
+            return
+        self.reported_at = now
+        lines = [f"⏳ <b>{self.title}</b>\n\nЗадача #{self.job.id} выполняется."]
+        if stage:
+            lines.append(stage)
+        percentage = 0
+        if total:
+            percentage = min(done * 100 // total, 99)
+            lines.append(f"{progress_bar(percentage)} {done}/{total}")
+        elif done:
+            lines.append(f"Обработано: {done}")
+        await jb.save_job_progress(self.job.id, percentage)
+        await self.runner.edit(self.job, "\n".join(lines))
+
+
+JobHandler = Callable[..., Awaitable[JobResult]]
+
+
+class JobRunner:
+    """Очередь фоновых задач процесса с пулом воркеров"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.kinds: dict[str, tuple[str, JobHandler]] = {}
+        self.queue: asyncio.Queue[int] = asyncio.Queue()
+        self.tasks: list[asyncio.Task] = []
+        # Выполняемые в этом процессе задачи: им нужны отметки, что процесс жив
+        self.running: set[int] = set()
+        self.bot: Optional[Bot] = None
+
+    def job(self, kind: str, title: str):
+        """
+        Декоратор обработчика задач вида kind.
+
+        Обработчик получает JobContext и параметры задачи именованными
+        аргументами и возвращает JobResult - итоговый текст сообщения.
+        """
+        def decorator(handler: JobHandler) -> JobHandler:
+            self.kinds[kind] = (title, handler)
+            return handler
+
+        return decorator
+
+    async def submit(self, kind: str, params: dict, chat_id: int,
+                     message_id: Optional[int] = None) -> int:
+        """
+        Ставит задачу в очередь и показывает это в сообщении.
+
+        Args:
+            kind: Вид задачи
+            params: Параметры обработчика, только JSON-типы (суммы - строками)
+            chat_id: Чат для сообщения о ходе и результатов
+            message_id: Сообщение бота, которое станет сообщением о ходе;
+                без него отправляется новое
+
+        Returns:
+            ID задачи
+        """
+        title = self.kinds[kind][0]
+        job_id = await jb.create_job(kind, params, chat_id, message_id)
+        text = f"⏳ <b>{title}</b>\n\nЗадача #{job_id} поставлена в очередь."
+        if message_id is None:
+            message = await self.bot.send_message(chat_id, text)
+            await jb.set_job_message(job_id, message.message_id)
+        else:
+            with suppress(TelegramBadRequest):
+                await self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        self.queue.put_nowait(job_id)
+        return job_id
+
+    async def edit(self, job: jb.JobRow, text: str, reply_markup: Any = None) -> None:
+        if job.message_id is None:
+            return
+        # Сообщение могли удалить, а текст - не измениться с прошлого отчёта
+        with suppress(TelegramBadRequest):
+            await self.bot.edit_message_text(text, chat_id=job.chat_id,
+                                             message_id=job.message_id,
+                                             reply_markup=reply_markup)
+
+    async def run(self, job_id: int) -> None:
+        job = await jb.claim_job(job_id)
+        if job is None:
+            return
+        title, handler = self.kinds[job.kind]
+        self.running.add(job.id)
+        try:
+            result = await handler(JobContext(self, job, title), **job.params)
+        except ValueError as e:
+            result = JobResult(str(e), failed=True)
+        except asyncio.CancelledError:
+            await jb.finish_job(job.id, jb.FAILED, "Прервана остановкой бота")
+            await self.edit(job, f"⚠️ <b>{title}</b>\n\nЗадача #{job.id} прервана "
+                                 f"остановкой бота. Запустите её заново.")
+            raise
+        except Exception as e:
+            logger.exception(f"Задача {job.id} ({job.kind}) завершилась ошибкой")
+            result = JobResult(f"❌ <b>Ошибка!</b>\n\n{title}: задача #{job.id} "
+                               f"не выполнена ({type(e).__name__}).", failed=True)
+        finally:
+            self.running.discard(job.id)
+        await jb.finish_job(job.id, jb.FAILED if result.failed else jb.DONE, result.text)
+        await self.edit(job, result.text, result.reply_markup)
+
+    async def worker(self) -> None:
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self.run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка воркера задач на задаче {job_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def fail_stale(self) -> None:
+        """Завершает ошибкой задачи, брошенные упавшими процессами"""
+        stale = await jb.fail_stale_jobs(
+            utc_now() - timedelta(seconds=JOB_STALE_SECONDS), "Прервана перезапуском бота"
+        )
+        for job in stale:
+            title = self.kinds[job.kind][0] if job.kind in self.kinds else job.kind
+            logger.warning(f"Задача {job.id} ({job.kind}) прервана перезапуском")
+            await self.edit(job, f"⚠️ <b>{title}</b>\n\nЗадача #{job.id} прервана "
+                                 f"перезапуском бота. Запустите её заново.")
+
+    async def watch(self) -> None:
+        """Отметки выполняемых задач и поиск брошенных, трижды за JOB_STALE_SECONDS"""
+        while True:
+            await asyncio.sleep(JOB_STALE_SECONDS / 3)
+            try:
+                if self.running:
+                    await jb.touch_jobs(list(self.running))
+                await self.fail_stale()
+            except Exception as e:
+                logger.error(f"Ошибка проверки фоновых задач: {e}")
+
+    async def start(self, bot: Bot) -> None:
+        """Запуск воркеров; задачи, оставшиеся в очереди с прошлого запуска, выполняются"""
+        self.bot = bot
+        await self.fail_stale()
+        for job_id in await jb.list_queued_jobs():
+            self.queue.put_nowait(job_id)
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self.watch()))
+
+    async def shutdown(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+job_runner = JobRunner(workers=JOB_WORKERS)
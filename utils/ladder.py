@@ -0,0 +1,75 @@
+"""
+Лестница входа в токен: вход в 10 ордеров по заранее рассчитанным уровням цены.
+
+Ступень i стоит на цене anchor * (1 - step%)^i. Незаполненные ступени делят
+оставшийся баланс токена поровну или с ростом LADDER_SIZE_GROWTH на каждой
+следующей ступени, поэтому при изменении баланса токена размеры пересчитываются.
+Шаг задаётся в процентах или от волатильности по истории цен токена.
+"""
+import os
+from decimal import Decimal
+from math import log, sqrt
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from utils.helpers import HUNDRED, allocate
+
+load_dotenv()
+LADDER_RUNGS = 10
+# fixed - шаг LADDER_STEP_PERCENTAGE, volatility - шаг от дневной волатильности токена
+LADDER_SPACING = os.getenv("LADDER_SPACING", "fixed")
+LADDER_STEP_PERCENTAGE = Decimal(os.getenv("LADDER_STEP_PERCENTAGE", "5"))
+LADDER_VOLATILITY_MULTIPLIER = Decimal(os.getenv("LADDER_VOLATILITY_MULTIPLIER", "1"))
+# Во сколько раз каждая следующая ступень больше предыдущей (1 - поровну)
+LADDER_SIZE_GROWTH = Decimal(os.getenv("LADDER_SIZE_GROWTH", "1"))
+# Границы шага от волатильности, %
+MIN_STEP_PERCENTAGE = Decimal(1)
+MAX_STEP_PERCENTAGE = Decimal(20)
+# Сколько дней истории цен и точек в ней нужно для оценки волатильности
+VOLATILITY_DAYS = 7
+MIN_VOLATILITY_POINTS = 20
+
+
+def rung_prices(anchor_price: Decimal, step_percentage: Decimal) -> list[Decimal]:
+    factor = 1 - step_percentage / HUNDRED
+    return [anchor_price * factor ** rung for rung in range(LADDER_RUNGS)]
+
+
+def rung_sizes(balance_usd: Decimal, filled: int) -> list[Decimal]:
+    """
+    Размеры ступеней в $: заполненные - 0, незаполненные делят balance_usd.
+    """
+    remaining = LADDER_RUNGS - min(filled, LADDER_RUNGS)
+    weights = [LADDER_SIZE_GROWTH ** rung for rung in range(remaining)]
+    total_weight = sum(weights)
+    sizes = allocate(max(balance_usd, Decimal(0)),
+                     [weight / total_weight * HUNDRED for weight in weights])
+    return [Decimal(0)] * (LADDER_RUNGS - remaining) + sizes
+
+
+def daily_volatility(times: list, prices: list[Decimal]) -> Optional[Decimal]:
+    """
+    Дневная волатильность в % по снимкам цены или None, если точек мало.
+
+    Стандартное отклонение лог-доходностей между снимками, приведённое к суткам
+    по среднему интервалу между ними.
+    """
+    if len(prices) < MIN_VOLATILITY_POINTS:
+        return None
+    returns = [log(float(current) / float(previous))
+               for previous, current in zip(prices, prices[1:]) if previous and current]
+    interval = (times[-1] - times[0]).total_seconds() / (len(times) - 1)
+    if len(returns) < 2 or interval <= 0:
+        return None
+    mean = sum(returns) / len(returns)
+    variance = sum((value - mean) ** 2 for value in returns) / (len(returns) - 1)
+    return Decimal(sqrt(variance * 86400 / interval) * 100)
+
+
+def step_from_volatility(volatility: Optional[Decimal]) -> Decimal:
+    """Шаг лестницы по настройкам: фиксированный или от волатильности в границах"""
+    if LADDER_SPACING != "volatility" or volatility is None:
+        return LADDER_STEP_PERCENTAGE
+    step = volatility * LADDER_VOLATILITY_MULTIPLIER
+    return min(max(step, MIN_STEP_PERCENTAGE), MAX_STEP_PERCENTAGE).quantize(Decimal("0.01"))
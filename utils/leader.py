@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+from dotenv import load_dotenv
+
+from database.connection import get_asyncpg_dsn
+
+load_dotenv()
+# Ключ advisory lock, общий для всех реплик, собирающих цены
+PARSER_LOCK_KEY = int(os.getenv("PARSER_LOCK_KEY", 7_310_512_001))
+LEADER_RENEW_INTERVAL = float(os.getenv("LEADER_RENEW_INTERVAL", 5))
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", 2))
+LEADER_LEASE_TIMEOUT = float(os.getenv("LEADER_LEASE_TIMEOUT", 10))
+
+# Keepalive на стороне сервера: соединение упавшей реплики закрывается
+# (и блокировка освобождается) примерно за idle + interval * count секунд
+KEEPALIVE_SETTINGS = {
+    "tcp_keepalives_idle": "10",
+    "tcp_keepalives_interval": "5",
+    "tcp_keepalives_count": "2",
+}
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderElector:
+    """
+    Выбор единственной реплики, выполняющей фоновую работу (сбор цен).
+
+    Лидерство - это сессионная advisory-блокировка PostgreSQL на отдельном
+    соединении asyncpg. Лидер продлевает аренду, проверяя соединение каждые
+    renew_interval секунд; если проверка не прошла за lease_timeout, реплика
+    сразу слагает полномочия и закрывает соединение, после чего блокировку
+    снимает сервер. Остальные реплики пытаются взять блокировку каждые
+    retry_interval секунд, поэтому переключение занимает несколько секунд.
+    """
+
+    def __init__(
+        self,
+        on_elected: Callable[[], Awaitable[None]],
+        on_demoted: Callable[[], Awaitable[None]],
+        lock_key: int = PARSER_LOCK_KEY,
+        renew_interval: float = LEADER_RENEW_INTERVAL,
+        retry_interval: float = LEADER_RETRY_INTERVAL,
+        lease_timeout: float = LEADER_LEASE_TIMEOUT,
+    ):
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.lock_key = lock_key
+        self.renew_interval = renew_interval
+        self.retry_interval = retry_interval
+        self.lease_timeout = lease_timeout
+        self.dsn = get_asyncpg_dsn()
+        self.instance = f"{socket.gethostname()}:{os.getpid()}"
+        self.connection: Optional[asyncpg.Connection] = None
+        self.is_leader = False
+        # Метрики переключений
+        self.elections = 0
+        self.demotions = 0
+        self.leader_since: Optional[float] = None
+        self.last_handoff: Optional[float] = None
+        # Момент, когда блокировка в последний раз была занята другой репликой
+        self.held_elsewhere_at: Optional[float] = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self.connection = await asyncpg.connect(
+                    self.dsn, server_settings=KEEPALIVE_SETTINGS
+                )
+                while True:
+                    if await self._try_acquire():
+                        await self._elected()
+                        await self._hold_lease()
+                        await self._demoted("аренда не продлена")
+                        break
+                    self.held_elsewhere_at = time.monotonic()
+                    await asyncio.sleep(self.retry_interval)
+            except asyncio.CancelledError:
+                await self.stop()
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка выбора лидера: {e}")
+                await self._demoted("ошибка соединения")
+            await self._close()
+            await asyncio.sleep(self.retry_interval)
+
+    async def stop(self) -> None:
+        """Добровольная передача лидерства при остановке реплики"""
+        await self._demoted("остановка реплики")
+        if self.connection and not self.connection.is_closed():
+            try:
+                await asyncio.wait_for(
+                    self.connection.execute("SELECT pg_advisory_unlock($1)", self.lock_key),
+                    timeout=self.lease_timeout,
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось снять блокировку лидера: {e}")
+        await self._close()
+
+    def snapshot(self) -> dict:
+        leader_for = time.monotonic() - self.leader_since if self.leader_since else 0
+        return {
+            "instance": self.instance,
+            "leader": self.is_leader,
+            "elections": self.elections,
+            "demotions": self.demotions,
+            "leader_for": round(leader_for, 1),
+            "last_handoff": round(self.last_handoff, 2) if self.last_handoff is not None else None,
+        }
+
+    async def _try_acquire(self) -> bool:
+        return await asyncio.wait_for(
+            self.connection.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_key),
+            timeout=self.lease_timeout,
+        )
+
+    async def _hold_lease(self) -> None:
+        """Продление аренды, пока соединение с блокировкой живо"""
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await asyncio.wait_for(
+                    self.connection.fetchval("SELECT 1"), timeout=self.lease_timeout
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Аренда лидера не продлена: {e}")
+                return
+
+    async def _elected(self) -> None:
+        now = time.monotonic()
+        # Время переключения считается от последней неудачной попытки, то есть
+        # с точностью до retry_interval; при первом запуске его нет
+        if self.held_elsewhere_at is not None:
+            self.last_handoff = now - self.held_elsewhere_at
+        self.held_elsewhere_at = None
+        self.is_leader = True
+        self.elections += 1
+        self.leader_since = now
+        logger.warning(f"Реплика {self.instance} стала лидером. Метрики: {self.snapshot()}")
+        try:
+            await self.on_elected()
+        except Exception as e:
+            logger.error(f"Ошибка запуска работы лидера: {e}")
+
+    async def _demoted(self, reason: str) -> None:
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        self.demotions += 1
+        logger.warning(
+            f"Реплика {self.instance} больше не лидер ({reason}). Метрики: {self.snapshot()}"
+        )
+        self.leader_since = None
+        try:
+            await self.on_demoted()
+        except Exception as e:
+            logger.error(f"Ошибка остановки работы лидера: {e}")
+
+    async def _close(self) -> None:
+        if self.connection and not self.connection.is_closed():
+            self.connection.terminate()
+        self.connection = None
@@ -0,0 +1,104 @@
+import csv
+import os
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Предел строк в одном пакете ордеров и размер загружаемого файла
+MAX_BULK_ORDERS = int(os.getenv("MAX_BULK_ORDERS", 1000))
+MAX_BULK_FILE_SIZE = int(os.getenv("MAX_BULK_FILE_SIZE", 1024 * 1024))
+
+SIDES = {
+    "buy": "buy", "b": "buy", "покупка": "buy",
+    "sell": "sell", "s": "sell", "продажа": "sell",
+}
+# Допустимые названия колонок заголовка CSV по порядку
+HEADER_COLUMNS = (
+    {"symbol", "token", "символ", "токен"},
+    {"side", "сторона"},
+    {"amount", "quantity", "qty", "количество"},
+    {"price", "цена"},
+)
+# Поля строки сообщения разделяются пробелами, точками с запятой или табуляцией;
+# запятая в числе - десятичный разделитель (1,5)
+FIELD_SEPARATOR = re.compile(r"[\s;]+")
+
+
+class OrderLine(NamedTuple):
+    line_no: int
+    symbol: str
+    side: str
+    amount: Decimal
+    price: Optional[Decimal]
+
+
+class OrderLineError(NamedTuple):
+    line_no: int
+    error: str
+
+
+def is_header(fields: list[str]) -> bool:
+    """Строка - заголовок CSV: каждое поле - название своей колонки"""
+    return 3 <= len(fields) <= len(HEADER_COLUMNS) and all(
+        field.lower() in names for field, names in zip(fields, HEADER_COLUMNS)
+    )
+
+
+def split_fields(line: str) -> list[str]:
+    """
+    Поля строки ордера.
+
+    Строка без точек с запятой и табуляций, где после разбиения по пробелам
+    какое-то поле начинается или кончается запятой (или полей меньше трёх),
+    разбирается как строка CSV с разделителем-запятой: "BTC,buy,1.5,60000"
+    или "BTC, buy, \"1,5\", 60000". Иначе запятые остаются внутри полей.
+    """
+    fields = [field for field in FIELD_SEPARATOR.split(line) if field]
+    if ";" not in line and "\t" not in line and "," in line and (
+            len(fields) < 3 or any(field.startswith(",") or field.endswith(",")
+                                   for field in fields)):
+        fields = next(csv.reader([line], skipinitialspace=True))
+    return [field.strip().strip("\"'") for field in fields]
+
+
+def to_decimal(field: str) -> Decimal:
+    """Число с точкой или запятой в качестве десятичного разделителя"""
+    return Decimal(field.replace(",", "."))
+
+
+def parse_order_lines(lines: Iterable[str]) -> Iterator[OrderLine | OrderLineError]:
+    """
+    Разбор строк вида "символ сторона количество цена" по одной.
+
+    Подходит и для текста сообщения, и для CSV-файла, открытого как поток
+    строк. Пустые строки, комментарии (#) и строка заголовка CSV пропускаются;
+    цена для продажи необязательна.
+    """
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip().lstrip("\ufeff")
+        if not line or line.startswith("#"):
+            continue
+        fields = split_fields(line)
+        if line_no == 1 and is_header(fields):
+            continue
+        side = SIDES.get(fields[1].lower()) if len(fields) > 1 else None
+        if side is None:
+            yield OrderLineError(line_no, "Ожидается: символ, buy/sell, количество, цена")
+            continue
+        if len(fields) != 4 and not (side == "sell" and len(fields) == 3):
+            yield OrderLineError(line_no, "Ожидается: символ, buy/sell, количество, цена")
+            continue
+        try:
+            amount = to_decimal(fields[2])
+            price = to_decimal(fields[3]) if len(fields) == 4 else None
+        except InvalidOperation:
+            yield OrderLineError(line_no, "Количество и цена должны быть числами")
+            continue
+        numbers = [amount] if price is None else [amount, price]
+        if not all(number.is_finite() and number > 0 for number in numbers):
+            yield OrderLineError(line_no, "Количество и цена должны быть больше нуля")
+            continue
+        yield OrderLine(line_no, fields[0].upper(), side, amount, price)
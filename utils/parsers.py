@@ -1,6 +1,8 @@
 import asyncio
 import logging
 import os
+import time
+from collections import deque
 from typing import Optional
 
 import aiohttp
@@ -9,82 +11,521 @@ import ssl
 from dotenv import load_dotenv
 from decimal import Decimal
 
-from database.requests import get_all_positions, update_tokens_prices, get_token_or_info
-from utils.common import symbols_list, bodyfix_notified_tokens, drawdown_last_prices
-import bot.keyboards as kb
+from database.requests import (
+    get_all_positions, update_tokens_prices, get_token_or_info, save_alert_notifications,
+    save_alert_rule_states, save_ladder_alerts,
+)
+from database.read_models import list_alert_rules
+from utils.common import symbols_list, bodyfix_notified_tokens, drawdown_last_prices, cache_bus
+from utils.common import alert_rule_ids, ladder_triggers
+from utils.alert_rules import AlertRuleEngine, TokenState, rule_text, rule_value_text
+from utils.price_stats import PEAK_WINDOW_MINUTES, price_stats
+from utils.circuit_breaker import CircuitBreaker, BreakerState
+from utils.rate_limiter import bybit_rate_limiter, PRIORITY_HIGH, PRIORITY_NORMAL
+from utils.ticker_decoder import decode_tickers
+from utils.instruments import instrument_catalogue
+from utils.events import publish_prices
+from utils.helpers import drawdown_reached
+from utils.equity import equity_snapshotter
+from bot.alerts import send_alert
 
 load_dotenv()
-ADMIN_ID = int(os.getenv("ADMIN_ID"))
 DRAWDOWN_PERCENTAGE = int(os.getenv("DRAWDOWN_PERCENTAGE"))
+# Просадка от максимума за PEAK_WINDOW_MINUTES: порог в % (0 - не проверять)
+# и в единицах ожидаемого разброса цены, чтобы отличать обвал от медленного снижения
+PEAK_DRAWDOWN_PERCENTAGE = float(os.getenv("PEAK_DRAWDOWN_PERCENTAGE", 10))
+PEAK_DRAWDOWN_SIGMAS = float(os.getenv("PEAK_DRAWDOWN_SIGMAS", 10))
+BREAKER_ERROR_PERCENTAGE = int(os.getenv("BREAKER_ERROR_PERCENTAGE", 50))
+BREAKER_LATENCY_SECONDS = float(os.getenv("BREAKER_LATENCY_SECONDS", 5))
+BREAKER_BACKOFF_SECONDS = float(os.getenv("BREAKER_BACKOFF_SECONDS", 30))
+BREAKER_MAX_BACKOFF_SECONDS = float(os.getenv("BREAKER_MAX_BACKOFF_SECONDS", 600))
+BREAKER_HALF_OPEN_SECONDS = float(os.getenv("BREAKER_HALF_OPEN_SECONDS", 60))
+# Пауза всех запросов к Bybit после ответа о превышении лимита
+RATE_LIMIT_PAUSE_SECONDS = 5
+TICKER_REQUEST_TIMEOUT = float(os.getenv("TICKER_REQUEST_TIMEOUT", 5))
+PARSER_CYCLE_BUDGET = float(os.getenv("PARSER_CYCLE_BUDGET", 20))
+# С этого числа токенов цены запрашиваются одним запросом всех тикеров
+BULK_TICKERS_THRESHOLD = int(os.getenv("BULK_TICKERS_THRESHOLD", 10))
+# Задержка дублирующего запроса, пока не накоплена статистика задержек
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_LATENCY_SAMPLES = 20
 
 logger = logging.getLogger(__name__)
 
 class BybitTickersParser:
     """Класс парсера цен токенов из symbols_list с Bybit"""
 
-    def __init__(self, bot: Optional[object] = None):
+    def __init__(self, bot: Optional[object] = None, publish_events: bool = False):
+        # Семафор ограничивает число одновременных запросов, лимитер - их частоту
         self.semaphore = asyncio.Semaphore(15)
+        self.rate_limiter = bybit_rate_limiter
         self.bybit_url = "https://api.bybit.com/"
         self.category = "spot"
         self.bot = bot
+        # В отдельном процессе-воркере цены публикуются через NOTIFY для процессов бота
+        self.publish_events = publish_events
         self.is_running = False
+        self.run_task: Optional[asyncio.Task] = None
         self.session: Optional[aiohttp.ClientSession] = None
         self.tasks: list[asyncio.Task] = []
         self.sleep_task: Optional[asyncio.Task] = None
+        self.request_timeout = aiohttp.ClientTimeout(total=TICKER_REQUEST_TIMEOUT)
+        # Задержки успешных запросов для расчёта p95 и момента дублирующего запроса
+        self.latencies: deque[float] = deque(maxlen=200)
+        # Токены, не получившие цену в прошлом цикле, запрашиваются первыми
+        self.carryover: list[str] = []
+        # Токены, отсутствующие на бирже; удаляются из отслеживания после цикла
+        self.invalid_symbols: set[str] = set()
+        self.alert_rules = AlertRuleEngine()
+        # Токены с отправленным уведомлением о просадке от максимума
+        self.peak_alerted: set[str] = set()
+        self.breaker = CircuitBreaker(
+            name="bybit",
+            error_rate_threshold=BREAKER_ERROR_PERCENTAGE / 100,
+            latency_threshold=BREAKER_LATENCY_SECONDS,
+            base_backoff=BREAKER_BACKOFF_SECONDS,
+            max_backoff=BREAKER_MAX_BACKOFF_SECONDS,
+            half_open_timeout=BREAKER_HALF_OPEN_SECONDS,
+        )
 
     async def init_tokens(self) -> None:
-        """Инициализация токенов в уже созданных позициях"""
+        """
+        Инициализация токенов в уже созданных позициях.
+
+        Кэши перечитываются из БД: парсер мог запуститься в реплике, которая
+        до получения лидерства не была подписана на изменения.
+        """
+        await cache_bus.reload()
         positions = await get_all_positions()
         if positions:
-            symbols_list.extend(
-                position.token.symbol 
-                for position in positions 
-                if position.token and position.token.symbol not in symbols_list
-            )
+            for position in positions:
+                if position.token and not instrument_catalogue.is_known(position.token.symbol):
+                    self.invalid_symbols.add(position.token.symbol)
             logger.info(f"Инициализировано {len(symbols_list)} токенов")
+            await self.drop_invalid_symbols()
+
+    async def drop_invalid_symbols(self) -> None:
+        """Снятие с отслеживания во всех процессах токенов, которых нет на Bybit, с уведомлением"""
+        invalid_symbols, self.invalid_symbols = self.invalid_symbols, set()
+        await cache_bus.publish([("symbols", "remove", symbol) for symbol in invalid_symbols])
+        for symbol in invalid_symbols:
+            logger.warning(f"Токен {symbol} отсутствует на Bybit")
+            await self.notify({"type": "invalid_symbol", "symbol": symbol})
 
     async def check_api_health(self, session: aiohttp.ClientSession) -> bool:
-        """Проверка доступности API Bybit."""
+        """Проверка доступности API Bybit. Используется как проба открытого предохранителя."""
         url = f"{self.bybit_url}/v5/market/time"
         try:
+            await self.rate_limiter.acquire(PRIORITY_HIGH)
             async with session.get(url) as response:
+                self.rate_limiter.update_from_headers(response.headers)
                 data = await response.json()
                 return data["retCode"] == 0
         except Exception as e:
             logger.error(f"Ошибка при проверке доступности API Bybit: {e}")
             return False
 
+    def hedge_delay(self) -> float:
+        """Задержка дублирующего запроса - p95 последних успешных запросов"""
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        latencies = sorted(self.latencies)
+        return latencies[int(len(latencies) * 0.95) - 1]
+
     async def fetch_tickers_bybit(
-        self, session: aiohttp.ClientSession, symbol: str
+        self, session: aiohttp.ClientSession, symbol: str, priority: int = PRIORITY_NORMAL
     ) -> tuple[str, Decimal] | None:
-        """Получение цены для заданного токена."""
+        """
+        Получение цены для заданного токена.
+
+        Если ответ не пришёл за p95 обычной задержки, отправляется дублирующий
+        запрос и используется первый успешный ответ. Задержка отсчитывается от
+        отправки запроса: ожидание слота семафора и лимитера в неё не входит.
+        """
+        sent = asyncio.Event()
+        primary = asyncio.create_task(self.request_ticker(session, symbol, priority, sent))
+        requests = {primary}
+        sending = asyncio.create_task(sent.wait())
+        try:
+            done, _ = await asyncio.wait({primary, sending}, return_when=asyncio.FIRST_COMPLETED)
+            if primary in done:
+                return primary.result()
+            done, _ = await asyncio.wait(requests, timeout=self.hedge_delay())
+            if done:
+                return primary.result()
+            # Без свободного слота дубль встал бы в очередь за неотправленными запросами
+            if self.semaphore.locked():
+                return await primary
+            requests.add(
+                asyncio.create_task(self.request_ticker(session, symbol, PRIORITY_HIGH))
+            )
+            while requests:
+                done, requests = await asyncio.wait(
+                    requests, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.result():
+                        return task.result()
+            return None
+        finally:
+            sending.cancel()
+            for task in requests:
+                task.cancel()
+
+    async def fetch_all_tickers(
+        self, session: aiohttp.ClientSession, symbols: set[str]
+    ) -> dict[str, Decimal] | None:
+        """Получение цен всех нужных токенов одним запросом всех спотовых тикеров."""
+        url = f"{self.bybit_url}/v5/market/tickers?category={self.category}"
+        if not self.breaker.allow_request():
+            return None
+        try:
+            await self.rate_limiter.acquire(PRIORITY_HIGH)
+            started = time.monotonic()
+            async with session.get(url, timeout=self.request_timeout) as response:
+                self.rate_limiter.update_from_headers(response.headers)
+                if response.status == 429:
+                    self.rate_limiter.block(RATE_LIMIT_PAUSE_SECONDS)
+                    self.breaker.record_failure()
+                    logger.error("Превышен лимит запросов к Bybit при запросе всех тикеров")
+                    return None
+                if response.status >= 500:
+                    self.breaker.record_failure()
+                    logger.error(
+                        f"Ошибка сервера Bybit при запросе всех тикеров: HTTP {response.status}"
+                    )
+                    return None
+                data = decode_tickers(await response.read(), symbols=symbols)
+                self.breaker.record_success(time.monotonic() - started)
+                if data.ret_code != 0:
+                    logger.error(f"Ошибка API при запросе всех тикеров: {data.ret_msg}")
+                    return None
+                return data.prices
+        except asyncio.TimeoutError:
+            self.breaker.record_failure(timeout=True)
+            logger.error("Таймаут при запросе всех тикеров")
+        except asyncio.CancelledError:
+            # У отменённого запроса нет исхода, пробный слот предохранителя освобождается
+            self.breaker.release()
+            raise
+        except aiohttp.ClientError as e:
+            self.breaker.record_failure()
+            logger.error(f"Ошибка при запросе всех тикеров: {e}")
+        except Exception as e:
+            self.breaker.record_failure()
+            logger.error(f"Ошибка при разборе всех тикеров: {e}")
+
+    async def request_ticker(
+        self, session: aiohttp.ClientSession, symbol: str, priority: int = PRIORITY_NORMAL,
+        sent: Optional[asyncio.Event] = None,
+    ) -> tuple[str, Decimal] | None:
+        """
+        Один запрос цены токена с собственным дедлайном.
+
+        sent устанавливается, когда получены слот семафора и разрешение лимитера.
+        """
         url = f"{self.bybit_url}/v5/market/tickers?category={self.category}&symbol={symbol}USDT"
         async with self.semaphore:
+            if not self.breaker.allow_request():
+                return None
             try:
-                async with session.get(url) as response:
-                    data = await response.json()
-                    if data["retCode"] == 0:
-                        price = Decimal(data["result"]["list"][0]["lastPrice"])
-                        return symbol, price
+                await self.rate_limiter.acquire(priority)
+                if sent:
+                    sent.set()
+                started = time.monotonic()
+                async with session.get(url, timeout=self.request_timeout) as response:
+                    self.rate_limiter.update_from_headers(response.headers)
+                    if response.status == 429:
+                        self.rate_limiter.block(RATE_LIMIT_PAUSE_SECONDS)
+                        self.breaker.record_failure()
+                        logger.error(f"Превышен лимит запросов к Bybit при парсинге {symbol}")
+                        return None
+                    if response.status >= 500:
+                        self.breaker.record_failure()
+                        logger.error(f"Ошибка сервера Bybit для {symbol}: HTTP {response.status}")
+                        return None
+                    data = decode_tickers(await response.read(), symbols={symbol})
+                    # Ответ API, даже с ошибкой по символу, означает что биржа доступна
+                    latency = time.monotonic() - started
+                    self.breaker.record_success(latency)
+                    if data.ret_code == 0 and symbol in data.prices:
+                        self.latencies.append(latency)
+                        return symbol, data.prices[symbol]
+                    elif data.ret_code == 10006:
+                        self.rate_limiter.block(RATE_LIMIT_PAUSE_SECONDS)
+                        logger.error(f"Превышен лимит запросов к Bybit при парсинге {symbol}")
                     else:
-                        logger.error(f"Ошибка API для {symbol}: {data['retMsg']}")
-                        # Если токен не найден, удаляем его из списка и отправляем уведомление
-                        if data.get("retMsg") == "invalid symbol" or data.get("retCode") == 10001:
-                            if symbol in symbols_list:
-                                symbols_list.remove(symbol)
-                                if self.bot:
-                                    await self.bot.send_message(
-                                        chat_id=ADMIN_ID,
-                                        text=(f"❗️ Токен <b>{symbol}</b> отсутствует на Bybit, "
-                                              f"уведомлений по его цене <b>не будет</b>.")
-                                    )
+                        logger.error(f"Ошибка API для {symbol}: {data.ret_msg}")
+                        # Токен не найден: снимается с отслеживания после завершения цикла
+                        if data.ret_msg == "invalid symbol" or data.ret_code == 10001:
+                            self.invalid_symbols.add(symbol)
+            except asyncio.CancelledError:
+                # Проигравший дубль или запрос сверх бюджета цикла: исхода нет
+                self.breaker.release()
+                raise
+            except asyncio.TimeoutError:
+                self.breaker.record_failure(timeout=True)
+                logger.error(f"Таймаут при парсинге {symbol}")
+            except aiohttp.ClientError as e:
+                self.breaker.record_failure()
+                logger.error(f"Ошибка при парсинге {symbol}: {e}")
             except Exception as e:
+                self.breaker.record_failure()
                 logger.error(f"Ошибка при парсинге {symbol}: {e}")
 
+    async def api_available(self) -> bool:
+        """
+        Проверка предохранителя перед циклом парсинга.
+
+        Отдельный запрос к API выполняется только при открытом предохранителе,
+        когда истекла задержка до следующей пробы.
+        """
+        if self.breaker.state != BreakerState.OPEN:
+            return True
+        if not self.breaker.probe_due():
+            return False
+        healthy = await self.check_api_health(session=self.session)
+        self.breaker.record_probe(healthy)
+        return healthy
+
+    async def collect_prices(self) -> dict[str, Decimal]:
+        """
+        Сбор цен всех отслеживаемых токенов в пределах бюджета времени цикла.
+
+        При большом числе токенов сначала запрашиваются все тикеры разом, затем
+        по отдельности только те, что не нашлись в общем ответе.
+        Запросы, не уложившиеся в бюджет, отменяются, а их токены переносятся
+        в начало следующего цикла с повышенным приоритетом.
+        """
+        deadline = time.monotonic() + PARSER_CYCLE_BUDGET
+        carried = set(self.carryover)
+        cycle_symbols = list(dict.fromkeys(
+            [symbol for symbol in self.carryover if symbol in symbols_list] + symbols_list
+        ))
+        prices = {}
+        if len(cycle_symbols) >= BULK_TICKERS_THRESHOLD:
+            prices = await self.fetch_all_tickers(self.session, set(cycle_symbols)) or {}
+        remaining_symbols = [symbol for symbol in cycle_symbols if symbol not in prices]
+        if not remaining_symbols:
+            self.carryover = []
+            return prices
+
+        self.tasks = [
+            asyncio.create_task(
+                self.fetch_tickers_bybit(
+                    self.session,
+                    symbol,
+                    priority=PRIORITY_HIGH if symbol in carried else PRIORITY_NORMAL,
+                )
+            )
+            for symbol in remaining_symbols
+        ]
+        done, pending = await asyncio.wait(
+            self.tasks, timeout=max(deadline - time.monotonic(), 0)
+        )
+        for task in pending:
+            task.cancel()
+
+        for task in done:
+            result = task.result()
+            if result:
+                symbol, price = result
+                prices[symbol] = price
+        self.carryover = [
+            symbol for symbol in cycle_symbols
+            if symbol not in prices and symbol in symbols_list
+        ]
+        if pending:
+            logger.warning(
+                f"Бюджет цикла {PARSER_CYCLE_BUDGET} сек. исчерпан, цены получены для "
+                f"{len(prices)} из {len(cycle_symbols)} токенов, "
+                f"перенесено на следующий цикл: {len(self.carryover)}"
+            )
+        return prices
+
+    async def check_alerts(self, prices: dict[str, Decimal]) -> None:
+        """Проверка цен на достижение фиксации тела и просадки"""
+        symbols = list(prices.keys())
+        tokens = await get_token_or_info(symbols=symbols)
+
+        # Фильтруем список для отправки уведомлений о фиксации тела
+        bodyfix_tokens = [
+            (token, prices.get(token.symbol))
+            for token in tokens
+            if (token.position and
+                prices.get(token.symbol, 0) >= token.position.bodyfix_price_usd and
+                token.symbol not in bodyfix_notified_tokens)
+        ]
+
+        # Фильтруем список для отправки уведомлений о просадке.
+        # Просадка проверяется умножением, без деления Decimal
+        drawdown_tokens = []
+        for token in tokens:
+            if not token.position:
+                continue
+
+            symbol = token.symbol
+            price = prices.get(symbol, 0)
+            entry_price = token.position.entry_price
+            if price >= entry_price:
+                continue
+            if not drawdown_reached(entry_price, price, DRAWDOWN_PERCENTAGE):
+                continue
+
+            # Получаем последнюю цену, по которой было отправлено уведомление
+            last_notified_price = drawdown_last_prices.get(symbol)
+
+            # Первое уведомление о просадке (ранее не отправлялось) или повторное -
+            # только при значительной дополнительной просадке от последней цены уведомления
+            if last_notified_price is None or drawdown_reached(
+                last_notified_price, price, DRAWDOWN_PERCENTAGE
+            ):
+                drawdown_tokens.append((token, price))
+
+        # Отправляем уведомления о фиксации тела
+        for token, price in bodyfix_tokens:
+            await self.notify({
+                "type": "bodyfix",
+                "symbol": token.symbol,
+                "position_id": token.position.id,
+                "price": price,
+            })
+            logger.info(f"Отправлено уведомление по токену {token.symbol}")
+
+        # Отправляем уведомления о просадке
+        for token, price in drawdown_tokens:
+            entry_price = token.position.entry_price
+            drawdown_percent = ((entry_price - price) / entry_price) * 100
+            await self.notify({
+                "type": "drawdown",
+                "symbol": token.symbol,
+                "position_id": token.position.id,
+                "price": price,
+                "drawdown_percent": drawdown_percent,
+            })
+            logger.info(
+                f"Отправлено уведомление о просадке {drawdown_percent}% "
+                f"по токену {token.symbol}"
+            )
+
+        # Добавляем токены в множество уведомленных и обновляем последние цены
+        # в словаре отслеживания просадки - в БД и во всех процессах
+        await save_alert_notifications(
+            bodyfix_symbols=[token.symbol for token, _ in bodyfix_tokens],
+            drawdown_prices={token.symbol: price for token, price in drawdown_tokens},
+        )
+        await self.check_peak_drawdowns(tokens)
+        await self.check_rules(prices, tokens)
+        await self.check_ladders(prices, tokens)
+
+    async def check_peak_drawdowns(self, tokens: list) -> None:
+        """
+        Уведомления о просадке от максимума окна по токенам позиций.
+
+        Уведомление отправляется, когда просадка превышает и порог в %, и порог
+        в сигмах. Повторное - только после восстановления цены до половины порога.
+        """
+        if not PEAK_DRAWDOWN_PERCENTAGE:
+            return
+        for token in tokens:
+            stats = price_stats.get(token.symbol)
+            if not token.position or stats is None:
+                continue
+            if stats.drawdown_percentage < PEAK_DRAWDOWN_PERCENTAGE / 2:
+                self.peak_alerted.discard(token.symbol)
+                continue
+            if (token.symbol in self.peak_alerted
+                    or stats.drawdown_percentage < PEAK_DRAWDOWN_PERCENTAGE
+                    or stats.drawdown_sigmas is None
+                    or stats.drawdown_sigmas < PEAK_DRAWDOWN_SIGMAS):
+                continue
+            self.peak_alerted.add(token.symbol)
+            await self.notify({
+                "type": "peak_drawdown",
+                "symbol": token.symbol,
+                "position_id": token.position.id,
+                # repr - кратчайшая точная запись float, без потери знаков у дешёвых токенов
+                "price": Decimal(repr(stats.price)),
+                "peak": Decimal(repr(stats.peak)),
+                "drawdown_percent": stats.drawdown_percentage,
+                "sigmas": stats.drawdown_sigmas,
+                "window_minutes": PEAK_WINDOW_MINUTES,
+            })
+            logger.info(
+                f"Отправлено уведомление о просадке от максимума "
+                f"{stats.drawdown_percentage:.2f}% по токену {token.symbol}"
+            )
+
+    async def check_rules(self, prices: dict[str, Decimal], tokens: list) -> None:
+        """Проверка пользовательских правил уведомлений; правила перекомпилируются при изменении"""
+        if self.alert_rules.version != alert_rule_ids.version:
+            version = alert_rule_ids.version
+            self.alert_rules.compile(await list_alert_rules(), version)
+        if not self.alert_rules.groups:
+            return
+        states = {
+            token.symbol: TokenState(
+                sector_id=token.sector_id,
+                bodyfix_price_usd=token.position.bodyfix_price_usd if token.position else None,
+            )
+            for token in tokens
+        }
+        fired, rearmed = self.alert_rules.evaluate(prices, states, time.time())
+        for rule, value in fired:
+            await self.notify({
+                "type": "rule",
+                "rule_id": rule.id,
+                "text": rule_text(rule),
+                "value": rule_value_text(rule, value),
+            })
+        if fired:
+            logger.info(f"Сработало правил уведомлений: {len(fired)}")
+        await save_alert_rule_states([rule.id for rule, _ in fired], rearmed)
+
+    async def check_ladders(self, prices: dict[str, Decimal], tokens: list) -> None:
+        """Уведомления о достижении ценой следующей ступени лестницы входа"""
+        reached = [
+            symbol for symbol, price in prices.items()
+            if (trigger := ladder_triggers.get(symbol)) is not None and price <= trigger
+        ]
+        if not reached:
+            return
+        positions = {token.symbol: token.position.id for token in tokens if token.position}
+        for symbol, (rung, rung_price, size_usd) in (await save_ladder_alerts(reached)).items():
+            await self.notify({
+                "type": "ladder",
+                "symbol": symbol,
+                "position_id": positions.get(symbol),
+                "price": prices[symbol],
+                "rung": rung,
+                "rung_price": rung_price,
+                "size_usd": size_usd,
+            })
+            logger.info(
+                f"Отправлено уведомление о {rung + 1}-й ступени лестницы по токену {symbol}"
+            )
+
+    async def notify(self, alert: dict) -> None:
+        """
+        Отправка уведомления через бота. Парсер работает только в лидере,
+        поэтому уведомление отправляется один раз при любом числе реплик бота.
+        """
+        try:
+            if self.bot:
+                await send_alert(self.bot, alert)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке уведомления {alert['type']}: {e}")
+
     async def run(self) -> None:
-        """Запуск парсера"""
+        """
+        Запуск парсера.
+
+        Ошибка цикла не останавливает парсер: пока реплика остаётся лидером,
+        сбор цен повторяется в следующем цикле, иначе блокировка лидера
+        удерживалась бы без работающего парсера.
+        """
         self.is_running = True
-        await self.init_tokens()
+        tokens_loaded = False
         ssl_context = ssl.create_default_context(cafile=certifi.where())
         self.session = aiohttp.ClientSession(
             connector=aiohttp.TCPConnector(ssl=ssl_context),
@@ -92,111 +533,15 @@ class BybitTickersParser:
         )
         try:
             while self.is_running:
-                api_healthy = await self.check_api_health(session=self.session)
-
-                if api_healthy and symbols_list:
-                    self.tasks = [
-                        asyncio.create_task(
-                            self.fetch_tickers_bybit(self.session, symbol)
-                        )
-                        for symbol in symbols_list
-                    ]
-                    results = await asyncio.gather(*self.tasks)
-                    prices = {}
-                    for result in results:
-                        if result:
-                            symbol, price = result
-                            prices[symbol] = price
-                    if prices:
-                        await update_tokens_prices(prices)
-                        # Проверяем, достигла ли цена токена цены фиксации тела инвестиций
-                        symbols = list(prices.keys())
-                        tokens = await get_token_or_info(symbols=symbols)
-
-                        # Фильтруем список для отправки уведомлений о фиксации тела
-                        bodyfix_tokens = [
-                            (token, prices.get(token.symbol))
-                            for token in tokens
-                            if (token.position and 
-                                prices.get(token.symbol, 0) >= token.position.bodyfix_price_usd and
-                                token.symbol not in bodyfix_notified_tokens)  
-                        ]
-
-                        # Фильтруем список для отправки уведомлений о просадке
-                        drawdown_tokens = []
-                        for token in tokens:
-                            if not token.position:
-                                continue
-                                
-                            symbol = token.symbol
-                            price = prices.get(symbol, 0)
-                            entry_price = token.position.entry_price
-                            if price >= entry_price:
-                                continue
-                            drawdown_percent = ((entry_price - price) / entry_price) * 100
-                            if drawdown_percent < DRAWDOWN_PERCENTAGE:
-                                continue
-                            
-                            # Получаем последнюю цену, по которой было отправлено уведомление
-                            last_notified_price = drawdown_last_prices.get(symbol)
-                            
-                            # Первое уведомление о просадке (ранее не отправлялось)
-                            if last_notified_price is None:
-                                drawdown_tokens.append((token, price))
-                                continue
-                                
-                            # Рассчитываем просадку от последней цены уведомления
-                            additional_drawdown = ((last_notified_price - price) / last_notified_price) * 100
-                            
-                            # Отправляем повторное уведомление только при значительной дополнительной просадке
-                            if additional_drawdown >= DRAWDOWN_PERCENTAGE:
-                                drawdown_tokens.append((token, price))
-                                
-                        # Отправляем уведомления о фиксации тела
-                        for token, price in bodyfix_tokens:
-                            if self.bot:
-                                await self.bot.send_message(
-                                    chat_id=ADMIN_ID,
-                                    text=(
-                                        f"🎯 Цена токена <b>{token.symbol}</b> "
-                                        f"достигла <b>цены фиксации тела!</b>"
-                                    ),
-                                    reply_markup=await kb.to_position_button(
-                                        token.position.id
-                                    ),
-                                )
-                                # Добавляем токен в множество уведомленных
-                                bodyfix_notified_tokens.add(token.symbol)
-                                logger.info(f"Отправлено уведомление по токену {token.symbol}")
-
-                        # Отправляем уведомления о просадке
-                        for token, price in drawdown_tokens:
-                            if self.bot:
-                                drawdown_percent = ((token.position.entry_price - price) / token.position.entry_price) * 100
-                                await self.bot.send_message(
-                                    chat_id=ADMIN_ID,
-                                    text=(
-                                        f"📉 <b>Просадка по {token.symbol} от последнего уведомления!</b>\n\n"
-                                        f"Текущая цена: <b>${price}</b>\n"
-                                        f"Просадка: <b><i>-{drawdown_percent:.2f}%</i></b>"
-                                    ),
-                                    reply_markup=await kb.to_position_button(
-                                        token.position.id
-                                    ),
-                                )
-                                # Обновляем последнюю цену в словаре отслеживания просадки
-                                drawdown_last_prices[token.symbol] = price
-                                logger.info(
-                                    f"Отправлено уведомление о просадке {drawdown_percent}% "
-                                    f"по токену {token.symbol}"
-                                )
-                    else:
-                        logger.warning("Не удалось получить цены ни для одного токена")
+                try:
+                    if not tokens_loaded:
+                        await self.init_tokens()
+                        tokens_loaded = True
+                    await self.cycle()
+                except Exception as e:
+                    logger.error(f"Ошибка в цикле парсера: {e}")
+                finally:
                     self.tasks = []
-                elif not symbols_list:
-                    logger.warning("Список символов пуст.")
-                else:
-                    logger.error("API Bybit недоступен.")
 
                 logger.info("Парсер уходит в сон на 60 секунд")
                 self.sleep_task = asyncio.create_task(asyncio.sleep(60))
@@ -204,14 +549,56 @@ class BybitTickersParser:
                     await self.sleep_task
                 except asyncio.CancelledError:
                     break
-        except Exception as e:
-            logger.error(f"Ошибка в парсере: {e}")
         finally:
+            await equity_snapshotter.close()
             if self.session:
                 await self.session.close()
                 self.session = None
             logger.info("Парсер Bybit был остановлен.")
 
+    async def cycle(self) -> None:
+        """Один цикл: сбор цен, их запись и проверка уведомлений"""
+        api_healthy = await self.api_available()
+
+        if api_healthy and instrument_catalogue.expired:
+            await instrument_catalogue.load(session=self.session)
+
+        if api_healthy and symbols_list:
+            prices = await self.collect_prices()
+            await self.drop_invalid_symbols()
+            if prices:
+                await update_tokens_prices(prices)
+                price_stats.update(prices)
+                if self.publish_events:
+                    await publish_prices(prices)
+                await self.check_alerts(prices)
+                await equity_snapshotter.on_cycle()
+            else:
+                logger.warning("Не удалось получить цены ни для одного токена")
+            logger.info(f"Состояние предохранителя Bybit: {self.breaker.snapshot()}")
+        elif not symbols_list:
+            logger.warning("Список символов пуст.")
+        else:
+            logger.error(
+                f"API Bybit недоступен, предохранитель открыт: {self.breaker.snapshot()}"
+            )
+
+    async def start(self) -> None:
+        """Запуск парсера в фоновой задаче, например при получении лидерства"""
+        self.run_task = asyncio.create_task(self.run())
+
+    async def shutdown(self, timeout: float = 10) -> None:
+        """Остановка парсера с ожиданием фоновой задачи; по таймауту задача отменяется"""
+        await self.stop()
+        if self.run_task:
+            try:
+                await asyncio.wait_for(self.run_task, timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Парсер не остановился вовремя, задача отменена")
+            except asyncio.CancelledError:
+                pass
+            self.run_task = None
+
     async def stop(self) -> None:
         """Остановка парсера"""
         self.is_running = False
@@ -0,0 +1,136 @@
+import os
+import time
+from array import array
+from collections import deque
+from decimal import Decimal
+from math import exp, log, sqrt
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Окно скользящего максимума и доходности, мин.
+PEAK_WINDOW_MINUTES = int(os.getenv("PEAK_WINDOW_MINUTES", 240))
+# Период полураспада EWMA волатильности, мин.
+VOLATILITY_HALFLIFE_MINUTES = float(os.getenv("VOLATILITY_HALFLIFE_MINUTES", 60))
+# Тиков до того, как оценке волатильности можно доверять
+MIN_VOLATILITY_SAMPLES = 10
+
+
+class SymbolStats(NamedTuple):
+    price: float
+    peak: float
+    # Просадка от максимума окна, %
+    drawdown_percentage: float
+    # Изменение цены от первой точки окна, %
+    window_change_percentage: float
+    # Ожидаемый разброс цены за окно по EWMA волатильности, %; None, пока мало тиков
+    volatility_percentage: Optional[float]
+    # Просадка в единицах ожидаемого разброса за время с момента максимума
+    drawdown_sigmas: Optional[float]
+
+
+class PriceStats:
+    """
+    Потоковая статистика цен по токенам, O(1) на тик.
+
+    Скалярное состояние токенов (последняя цена, её время, EWMA дисперсии
+    лог-доходности в секунду, число тиков) хранится в массивах по номеру
+    слота токена. Для окна есть две очереди: монотонная очередь кандидатов
+    в максимум (цены в ней убывают, голова - максимум окна) и очередь всех
+    точек окна для изменения цены. Каждая точка входит и выходит из очереди
+    один раз, поэтому обновление амортизированно O(1).
+
+    Просадка в сигмах делится на ожидаемый разброс за время с момента
+    максимума при волатильности на момент максимума: резкое падение за минуты
+    даёт десятки сигм, такое же медленное сползание за часы - единицы.
+    """
+
+    def __init__(self, window_seconds: float, halflife_seconds: float):
+        self.window_seconds = window_seconds
+        self.decay = log(2) / halflife_seconds
+        self.slots: dict[str, int] = {}
+        self.last_price = array("d")
+        self.last_time = array("d")
+        self.variance = array("d")
+        self.samples = array("L")
+        # (время, цена, дисперсия на тот момент) кандидатов в максимум
+        self.peaks: list[deque[tuple[float, float, float]]] = []
+        self.points: list[deque[tuple[float, float]]] = []
+
+    def slot(self, symbol: str) -> int:
+        slot = self.slots.get(symbol)
+        if slot is None:
+            slot = self.slots[symbol] = len(self.last_price)
+            self.last_price.append(0.0)
+            self.last_time.append(0.0)
+            self.variance.append(0.0)
+            self.samples.append(0)
+            self.peaks.append(deque())
+            self.points.append(deque())
+        return slot
+
+    def update(self, prices: dict[str, Decimal], now: Optional[float] = None) -> None:
+        """Учёт цен очередного тика"""
+        now = time.time() if now is None else now
+        horizon = now - self.window_seconds
+        for symbol, price in prices.items():
+            price = float(price)
+            if price <= 0:
+                continue
+            slot = self.slot(symbol)
+            last_price, elapsed = self.last_price[slot], now - self.last_time[slot]
+            if last_price and elapsed > 0:
+                # EWMA по времени: вес наблюдения зависит от интервала между тиками
+                weight = 1 - exp(-self.decay * elapsed)
+                log_return = log(price / last_price)
+                self.variance[slot] += weight * (log_return * log_return / elapsed
+                                                 - self.variance[slot])
+            self.last_price[slot] = price
+            self.last_time[slot] = now
+            self.samples[slot] += 1
+
+            peaks = self.peaks[slot]
+            while peaks and peaks[-1][1] <= price:
+                peaks.pop()
+            peaks.append((now, price, self.variance[slot]))
+            while peaks[0][0] < horizon:
+                peaks.popleft()
+            points = self.points[slot]
+            points.append((now, price))
+            while points[0][0] < horizon:
+                points.popleft()
+
+    async def handle_prices(self, payload: dict) -> None:
+        """Цены из событий воркера (PARSER_MODE=worker) для экранов процесса бота"""
+        self.update({symbol: Decimal(price) for symbol, price in payload["prices"].items()})
+
+    def get(self, symbol: str) -> Optional[SymbolStats]:
+        """Статистика токена на последний тик или None, если по нему ещё не было цен"""
+        slot = self.slots.get(symbol)
+        if slot is None or not self.samples[slot]:
+            return None
+        price = self.last_price[slot]
+        peak_time, peak, peak_variance = self.peaks[slot][0]
+        first_price = self.points[slot][0][1]
+        volatility = sigmas = None
+        if self.samples[slot] >= MIN_VOLATILITY_SAMPLES and self.variance[slot] > 0:
+            volatility = sqrt(self.variance[slot] * self.window_seconds) * 100
+            # Разброс берётся на момент максимума: само падение не должно его раздувать
+            variance = peak_variance or self.variance[slot]
+            since_peak = max(self.last_time[slot] - peak_time, 1.0)
+            sigmas = log(peak / price) / sqrt(variance * since_peak)
+        return SymbolStats(
+            price=price,
+            peak=peak,
+            drawdown_percentage=(peak - price) / peak * 100,
+            window_change_percentage=(price - first_price) / first_price * 100,
+            volatility_percentage=volatility,
+            drawdown_sigmas=sigmas,
+        )
+
+
+price_stats = PriceStats(
+    window_seconds=PEAK_WINDOW_MINUTES * 60,
+    halflife_seconds=VOLATILITY_HALFLIFE_MINUTES * 60,
+)
@@ -0,0 +1,116 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Mapping, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+BYBIT_RATE_LIMIT = float(os.getenv("BYBIT_RATE_LIMIT", 20))
+BYBIT_RATE_BURST = int(os.getenv("BYBIT_RATE_BURST", 20))
+
+# Приоритеты запросов: меньшее значение обслуживается раньше
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket для исходящих запросов к бирже.
+
+    Запросы сверх доступных токенов встают в очередь по приоритету (FIFO внутри
+    приоритета). Скорость пополнения подстраивается под заголовки остатка квоты
+    из ответов биржи, а при исчерпании квоты или 429 выдача токенов
+    приостанавливается до сброса лимита.
+    """
+
+    def __init__(self, rate: float, capacity: int, min_rate: float = 1.0):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._queue: list[tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> None:
+        """Ожидание разрешения на один запрос"""
+        self._refill()
+        if not self._queue and self.tokens >= 1 and time.monotonic() >= self.blocked_until:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._counter), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Подстройка скорости по заголовкам Bybit.
+
+        X-Bapi-Limit-Status - остаток запросов в текущем окне,
+        X-Bapi-Limit-Reset-Timestamp - время сброса окна в мс.
+        """
+        remaining = headers.get("X-Bapi-Limit-Status")
+        reset_ts = headers.get("X-Bapi-Limit-Reset-Timestamp")
+        if remaining is None or reset_ts is None:
+            return
+        try:
+            remaining = int(remaining)
+            window_left = max(int(reset_ts) / 1000 - time.time(), 0.001)
+        except ValueError:
+            return
+        self._refill()
+        if remaining <= 0:
+            self.block(window_left)
+            return
+        self.rate = max(self.min_rate, min(self.base_rate, remaining / window_left))
+        self.tokens = min(self.tokens, remaining)
+
+    def block(self, seconds: float) -> None:
+        """Приостановка выдачи токенов (исчерпана квота или получен 429)"""
+        until = time.monotonic() + seconds
+        if until > self.blocked_until:
+            self.blocked_until = until
+            self.tokens = 0
+            logger.warning(f"Лимит запросов к бирже исчерпан, пауза {seconds:.1f} сек.")
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        # Во время паузы токены не накапливаются
+        start = max(self.updated, self.blocked_until)
+        if now <= start:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    async def _dispatch(self) -> None:
+        while self._queue:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill()
+            while self._queue and self.tokens >= 1:
+                _, _, future = heapq.heappop(self._queue)
+                # Отменённые ожидания не расходуют токены
+                if future.done():
+                    continue
+                future.set_result(None)
+                self.tokens -= 1
+            if self._queue:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Общий лимитер для всех запросов к Bybit
+bybit_rate_limiter = RateLimiter(rate=BYBIT_RATE_LIMIT, capacity=BYBIT_RATE_BURST)
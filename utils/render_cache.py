@@ -0,0 +1,99 @@
+"""
+Кэш клавиатур и текстов экранов бота с инвалидацией по версиям данных.
+
+Каждый экран зависит от одной или нескольких областей данных (секторы,
+токены, позиции). У области есть счётчик версии, который функции записи
+в database.requests увеличивают событием ("versions", "bump", область)
+через cache_bus - после коммита и во всех процессах. Ключ кэша - экран,
+аргументы и версии его областей, поэтому после записи следующий показ
+экрана идёт мимо кэша, а повторная навигация без изменений - без запросов
+к БД. Полная перезагрузка кэшей (пропуск событий) сбрасывает все версии.
+"""
+import functools
+import inspect
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", 512))
+
+# Области данных экранов
+SECTORS = "sectors"
+TOKENS = "tokens"
+POSITIONS = "positions"
+
+
+def version_bumps(*scopes: str) -> list[tuple]:
+    """Изменения cache_bus, увеличивающие версии областей"""
+    return [("versions", "bump", scope) for scope in scopes]
+
+
+class DataVersions:
+    """Счётчики версий областей данных; применяет события cache_bus"""
+
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+        # Растёт при полной перезагрузке: старые ключи кэша перестают совпадать
+        self.epoch = 0
+
+    def apply(self, op: str, key: Any, value: Any = None) -> None:
+        if op == "bump":
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def replace(self, data) -> None:
+        self.counters.clear()
+        self.epoch += 1
+
+    def stamp(self, scopes: tuple[str, ...]) -> tuple[int, ...]:
+        return (self.epoch, *(self.counters.get(scope, 0) for scope in scopes))
+
+
+class RenderCache:
+    """LRU-кэш результатов асинхронных функций отрисовки экранов"""
+
+    def __init__(self, versions: DataVersions, size: int):
+        self.versions = versions
+        self.size = size
+        self.items: OrderedDict[tuple, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, screen: str, scopes: tuple[str, ...] = ()):
+        """
+        Декоратор функции отрисовки экрана.
+
+        Args:
+            screen: Имя экрана в ключе кэша
+            scopes: Области данных, от которых зависит экран; без областей
+                результат зависит только от аргументов (статичные клавиатуры)
+        """
+        def decorator(render: Callable[..., Awaitable[Any]]):
+            signature = inspect.signature(render)
+
+            @functools.wraps(render)
+            async def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                # Версии берутся до отрисовки: запись во время неё даст новый ключ
+                key = (screen, tuple(bound.arguments.values()), self.versions.stamp(scopes))
+                if key in self.items:
+                    self.items.move_to_end(key)
+                    self.hits += 1
+                    return self.items[key]
+                self.misses += 1
+                value = await render(*args, **kwargs)
+                self.items[key] = value
+                while len(self.items) > self.size:
+                    self.items.popitem(last=False)
+                return value
+
+            return wrapper
+
+        return decorator
+
+
+data_versions = DataVersions()
+render_cache = RenderCache(data_versions, size=RENDER_CACHE_SIZE)
@@ -0,0 +1,140 @@
+"""
+Поиск токенов и секторов для inline-режима бота.
+
+Индекс - отсортированный массив ключей поиска (символ токена, название
+сектора и отдельные слова названия в нижнем регистре) с параллельным
+массивом ссылок на записи. Все ключи с общим префиксом лежат подряд,
+поэтому поиск - один bisect и проход по совпадениям: O(log n + k).
+Индекс зарегистрирован в cache_bus как "search": при запуске собирается
+из БД загрузчиком, добавление и удаление токенов и секторов расходятся
+по всем процессам событиями.
+"""
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Сколько секунд ответ на запрос берётся из кэша: в нём цены на момент запроса
+INLINE_CACHE_SECONDS = int(os.getenv("INLINE_CACHE_SECONDS", 5))
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", 256))
+# Больше 50 результатов Telegram не принимает
+INLINE_RESULTS_LIMIT = 50
+
+TOKEN_PREFIX = "t"
+SECTOR_PREFIX = "s"
+WORD_SEPARATORS = re.compile(r"[\s\-_/.]+")
+
+
+def token_ref(token_id: int) -> str:
+    return f"{TOKEN_PREFIX}{token_id}"
+
+
+def sector_ref(sector_id: int) -> str:
+    return f"{SECTOR_PREFIX}{sector_id}"
+
+
+def parse_ref(ref: str) -> tuple[str, int]:
+    """Вид записи (TOKEN_PREFIX или SECTOR_PREFIX) и её ID"""
+    return ref[0], int(ref[1:])
+
+
+def search_terms(name: str) -> set[str]:
+    """Ключи поиска записи: всё название и каждое его слово"""
+    name = name.lower()
+    return {name, *(word for word in WORD_SEPARATORS.split(name) if word)}
+
+
+class SearchIndex:
+    """Префиксный индекс {ссылка: название} с номером версии, как у кэшей cache_bus"""
+
+    version = 0
+
+    def __init__(self):
+        self.names: dict[str, str] = {}
+        self.terms: list[str] = []
+        self.refs: list[str] = []
+
+    def apply(self, op: str, key: Any, value: Any = None) -> None:
+        if op == "set":
+            self._remove(key)
+            self.names[key] = value
+            for term in search_terms(value):
+                index = bisect_left(self.terms, term)
+                self.terms.insert(index, term)
+                self.refs.insert(index, key)
+        elif op == "remove" and key in self.names:
+            self._remove(key)
+        else:
+            return
+        self.version += 1
+
+    def _remove(self, ref: str) -> None:
+        name = self.names.pop(ref, None)
+        if name is None:
+            return
+        for term in search_terms(name):
+            index = bisect_left(self.terms, term)
+            while self.refs[index] != ref:
+                index += 1
+            del self.terms[index]
+            del self.refs[index]
+
+    def replace(self, data: dict[str, str]) -> None:
+        self.names = dict(data)
+        pairs = sorted((term, ref) for ref, name in self.names.items()
+                       for term in search_terms(name))
+        self.terms = [term for term, _ in pairs]
+        self.refs = [ref for _, ref in pairs]
+        self.version += 1
+
+    def search(self, query: str, limit: int = INLINE_RESULTS_LIMIT) -> list[str]:
+        """
+        Ссылки на записи, название или слово названия которых начинается с query.
+
+        Точные совпадения идут первыми: в отсортированном массиве ключ, равный
+        query, стоит перед всеми более длинными ключами с этим префиксом.
+        """
+        query = query.strip().lower()
+        found = {}
+        for index in range(bisect_left(self.terms, query), len(self.terms)):
+            if not self.terms[index].startswith(query):
+                break
+            found[self.refs[index]] = None
+            if len(found) >= limit:
+                break
+        return list(found)
+
+
+class ResultCache:
+    """LRU-кэш ответов по строке запроса; ответ годен при той же версии индекса и TTL"""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.items: OrderedDict[str, tuple[int, float, Any]] = OrderedDict()
+
+    def get(self, query: str, version: int) -> Optional[Any]:
+        item = self.items.get(query)
+        if item is None:
+            return None
+        item_version, stored_at, value = item
+        if item_version != version or time.monotonic() - stored_at > self.ttl:
+            del self.items[query]
+            return None
+        self.items.move_to_end(query)
+        return value
+
+    def put(self, query: str, version: int, value: Any) -> None:
+        self.items[query] = (version, time.monotonic(), value)
+        self.items.move_to_end(query)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+search_index = SearchIndex()
+search_results = ResultCache(size=INLINE_CACHE_SIZE, ttl=INLINE_CACHE_SECONDS)
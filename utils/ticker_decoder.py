@@ -0,0 +1,145 @@
+import json
+import os
+import re
+from decimal import Decimal
+from typing import Any, Callable, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+load_dotenv()
+# regex, json или orjson (если установлен); по умолчанию самый быстрый из доступных
+TICKERS_DECODER = os.getenv("TICKERS_DECODER", "orjson" if orjson is not None else "regex")
+
+QUOTE_COIN = "USDT"
+
+RET_CODE = re.compile(rb'"retCode"\s*:\s*(-?\d+)')
+RET_MSG = re.compile(rb'"retMsg"\s*:\s*"([^"]*)"')
+SYMBOL = re.compile(rb'"symbol"\s*:\s*"([^"]+)"')
+LAST_PRICE = re.compile(rb'"lastPrice"\s*:\s*"([^"]*)"')
+VOLUME = re.compile(rb'"volume24h"\s*:\s*"([^"]*)"')
+
+
+class TickersResponse(NamedTuple):
+    """Разобранный ответ /v5/market/tickers: только нужные боту поля"""
+
+    ret_code: int
+    ret_msg: str
+    prices: dict[str, Any]
+    volumes: dict[str, Any]
+
+
+def scaled_int(scale: int) -> Callable[[str], int]:
+    """
+    Парсер цены в целое число с фиксированной точкой (цена * 10**scale).
+
+    Строка разбирается напрямую, без промежуточных float и Decimal.
+    Лишние знаки после запятой отбрасываются.
+    """
+    def parse(value: str) -> int:
+        int_part, _, frac_part = value.partition(".")
+        frac_part = frac_part[:scale].ljust(scale, "0")
+        sign = -1 if int_part.startswith("-") else 1
+        return sign * (abs(int(int_part or "0")) * 10 ** scale + int(frac_part or "0"))
+    return parse
+
+
+def _base_symbol(symbol: str, symbols: Optional[set[str]]) -> Optional[str]:
+    if not symbol.endswith(QUOTE_COIN):
+        return None
+    base = symbol[:-len(QUOTE_COIN)]
+    if symbols is not None and base not in symbols:
+        return None
+    return base
+
+
+def decode_regex(
+    raw: bytes,
+    symbols: Optional[set[str]] = None,
+    price_parser: Callable[[str], Any] = Decimal,
+    with_volume: bool = False,
+) -> TickersResponse:
+    """
+    Разбор ответа без построения словарей: ищутся только symbol, lastPrice
+    и, по желанию, volume24h в пределах объекта каждого тикера.
+    """
+    ret_code = RET_CODE.search(raw)
+    ret_msg = RET_MSG.search(raw)
+    prices, volumes = {}, {}
+    matches = list(SYMBOL.finditer(raw))
+    for idx, match in enumerate(matches):
+        base = _base_symbol(match.group(1).decode(), symbols)
+        if base is None:
+            continue
+        # Поля тикера лежат между его symbol и symbol следующего тикера
+        end = matches[idx + 1].start() if idx + 1 < len(matches) else len(raw)
+        price = LAST_PRICE.search(raw, match.end(), end)
+        if not price or not price.group(1):
+            continue
+        prices[base] = price_parser(price.group(1).decode())
+        if with_volume:
+            volume = VOLUME.search(raw, match.end(), end)
+            if volume and volume.group(1):
+                volumes[base] = price_parser(volume.group(1).decode())
+    return TickersResponse(
+        ret_code=int(ret_code.group(1)) if ret_code else -1,
+        ret_msg=ret_msg.group(1).decode() if ret_msg else "",
+        prices=prices,
+        volumes=volumes,
+    )
+
+
+def _decode_loaded(
+    data: dict,
+    symbols: Optional[set[str]],
+    price_parser: Callable[[str], Any],
+    with_volume: bool,
+) -> TickersResponse:
+    prices, volumes = {}, {}
+    for item in (data.get("result") or {}).get("list") or []:
+        base = _base_symbol(item["symbol"], symbols)
+        if base is None or not item.get("lastPrice"):
+            continue
+        prices[base] = price_parser(item["lastPrice"])
+        if with_volume and item.get("volume24h"):
+            volumes[base] = price_parser(item["volume24h"])
+    return TickersResponse(
+        ret_code=data.get("retCode", -1),
+        ret_msg=data.get("retMsg", ""),
+        prices=prices,
+        volumes=volumes,
+    )
+
+
+def decode_json(
+    raw: bytes,
+    symbols: Optional[set[str]] = None,
+    price_parser: Callable[[str], Any] = Decimal,
+    with_volume: bool = False,
+) -> TickersResponse:
+    """Разбор стандартным json"""
+    return _decode_loaded(json.loads(raw), symbols, price_parser, with_volume)
+
+
+def decode_orjson(
+    raw: bytes,
+    symbols: Optional[set[str]] = None,
+    price_parser: Callable[[str], Any] = Decimal,
+    with_volume: bool = False,
+) -> TickersResponse:
+    """Разбор через orjson (если установлен)"""
+    return _decode_loaded(orjson.loads(raw), symbols, price_parser, with_volume)
+
+
+DECODERS: dict[str, Callable[..., TickersResponse]] = {
+    "regex": decode_regex,
+    "json": decode_json,
+}
+if orjson is not None:
+    DECODERS["orjson"] = decode_orjson
+
+decode_tickers = DECODERS.get(TICKERS_DECODER, decode_regex)
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import os
+import signal
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from dotenv import load_dotenv
+
+from utils.parsers import BybitTickersParser
+from database.connection import create_database
+from utils.instruments import instrument_catalogue
+from utils.leader import LeaderElector
+from utils.events import EventSubscriber
+from utils.cache import CACHE_CHANNEL
+from utils.common import cache_bus
+
+
+async def main():
+    """
+    Отдельный процесс сбора цен: запросы к Bybit, запись цен и проверка уведомлений.
+
+    Уведомления воркер отправляет в Telegram сам, цены публикуются через
+    PostgreSQL NOTIFY для экранов процессов бота (PARSER_MODE=worker).
+    Воркеров можно запустить несколько: цены собирает и уведомления отправляет
+    только выбранный лидер, остальные ждут и подхватывают работу при его падении.
+    """
+    load_dotenv()
+    await create_database()
+    await instrument_catalogue.load()
+    subscriber = EventSubscriber({CACHE_CHANNEL: cache_bus.handle}, on_connect=cache_bus.reload)
+    subscriber_task = asyncio.create_task(subscriber.run())
+    bot = Bot(token=os.getenv("BOT_TOKEN"), default=DefaultBotProperties(parse_mode="HTML"))
+    bybit_parser = BybitTickersParser(bot=bot, publish_events=True)
+    elector = LeaderElector(on_elected=bybit_parser.start, on_demoted=bybit_parser.shutdown)
+    elector_task = asyncio.create_task(elector.run())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, elector_task.cancel)
+    try:
+        await elector_task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        subscriber_task.cancel()
+        await asyncio.gather(subscriber_task, return_exceptions=True)
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    asyncio.run(main())